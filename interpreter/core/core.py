@@ -16,9 +16,16 @@ from ..terminal_interface.utils.oi_dir import oi_dir
 from .computer.computer import Computer
 from .default_system_message import default_system_message
 from .llm.llm import Llm
+from .render_message import SystemMessageRenderer
 from .respond import respond
+from .utils.conversation_history import (
+    HISTORY_SUFFIX,
+    ConversationHistoryWriter,
+    history_filename,
+    load_conversation,
+)
 from .utils.telemetry import send_telemetry
-from .utils.truncate_output import truncate_output
+from .utils.truncate_output import OutputAccumulator
 
 
 class OpenInterpreter:
@@ -100,6 +107,7 @@ class OpenInterpreter:
         self.contribute_conversation = contribute_conversation
         self.plain_text_display = plain_text_display
         self.highlight_active_line = True  # additional setting to toggle active line highlighting. Defaults to True
+        self.output_spill_dir = None  # If set, console output longer than max_output is also saved here in full
 
         # Loop messages
         self.loop = loop
@@ -110,6 +118,8 @@ class OpenInterpreter:
         self.conversation_history = conversation_history
         self.conversation_filename = conversation_filename
         self.conversation_history_path = conversation_history_path
+        self.conversation_history_background = False  # Write history files on a background thread
+        self._history_writer = None
 
         # OS control mode related attributes
         self.os = os
@@ -138,6 +148,9 @@ class OpenInterpreter:
         self.empty_code_output_template = empty_code_output_template
         self.code_output_sender = code_output_sender
 
+        # Renders the system message, caching its template and {{ }} block outputs
+        self.system_message_renderer = SystemMessageRenderer()
+
     def local_setup(self):
         """
         Opens a wizard that lets terminal users pick a local model.
@@ -274,26 +287,45 @@ class OpenInterpreter:
 
                     date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S")
                     self.conversation_filename = (
-                        "__".join([first_few_words, date]) + ".json"
+                        "__".join([first_few_words, date]) + HISTORY_SUFFIX
                     )
 
-                # Check if the directory exists, if not, create it
-                if not os.path.exists(self.conversation_history_path):
-                    os.makedirs(self.conversation_history_path)
-                # Write or overwrite the file
-                with open(
-                    os.path.join(
-                        self.conversation_history_path, self.conversation_filename
-                    ),
-                    "w",
-                ) as f:
-                    json.dump(self.messages, f)
+                self._save_conversation()
             return
 
         raise Exception(
             "`interpreter.chat()` requires a display. Set `display=True` or pass a message into `interpreter.chat(message)`."
         )
 
+    def _save_conversation(self):
+        """
+        Appends what changed since the last turn to the conversation's history file.
+        """
+        # Conversations from before history files were append-only are moved over
+        legacy_path = None
+        filename = history_filename(self.conversation_filename)
+        if filename != self.conversation_filename:
+            legacy_path = os.path.join(
+                self.conversation_history_path, self.conversation_filename
+            )
+            self.conversation_filename = filename
+
+        path = os.path.join(self.conversation_history_path, self.conversation_filename)
+        writer = self._history_writer
+        if writer is None or writer.path != path:
+            if writer is not None:
+                writer.close()
+            writer = self._history_writer = ConversationHistoryWriter(
+                path, background=self.conversation_history_background
+            )
+        writer.save(self.messages)
+
+        if legacy_path and os.path.exists(legacy_path):
+            writer.flush()
+            # Leave files that aren't ours alone, e.g. a server session journal
+            if os.path.exists(path) and load_conversation(legacy_path) is not None:
+                os.remove(legacy_path)
+
     def _respond_and_store(self):
         """
         Pulls from the respond stream, adding delimiters. Some things, like active_line, console, confirmation... these act specially.
@@ -314,6 +346,10 @@ class OpenInterpreter:
 
         last_flag_base = None
 
+        # Console output is accumulated here and truncated incrementally
+        output = None
+        output_message = None
+
         try:
             for chunk in respond(self):
                 # For async usage
@@ -391,6 +427,8 @@ class OpenInterpreter:
                             ]
                         ):
                             self.messages.append(chunk)
+                        elif output_message is self.messages[-1]:
+                            output.append(chunk["content"])
                         else:
                             self.messages[-1]["content"] += chunk["content"]
                 else:
@@ -415,21 +453,36 @@ class OpenInterpreter:
 
                 # Truncate output if it's console output
                 if chunk["type"] == "console" and chunk["format"] == "output":
-                    self.messages[-1]["content"] = truncate_output(
-                        self.messages[-1]["content"],
-                        self.max_output,
-                        add_scrollbars=self.computer.import_computer_api,  # I consider scrollbars to be a computer API thing
-                    )
+                    if output_message is not self.messages[-1]:
+                        if output is not None:
+                            output.close()
+                        output = OutputAccumulator(
+                            self.max_output, spill_path=self._output_spill_path()
+                        )
+                        output_message = self.messages[-1]
+                        output.append(output_message["content"])
+                    output_message["content"] = output.view()
 
             # Yield a final end flag
             if last_flag_base:
                 yield {**last_flag_base, "end": True}
         except GeneratorExit:
             raise  # gotta pass this up!
+        finally:
+            if output is not None:
+                output.close()
+
+    def _output_spill_path(self):
+        # Where the full text of a long console output goes, if anywhere
+        if not self.output_spill_dir:
+            return None
+        date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S-%f")
+        return os.path.join(self.output_spill_dir, f"output__{date}.txt")
 
     def reset(self):
         self.computer.terminate()  # Terminates all languages
         self.computer._has_imported_computer_api = False  # Flag reset
+        self.system_message_renderer.invalidate()  # Block outputs came from the old kernel
         self.messages = []
         self.last_messages_count = 0
 
@@ -0,0 +1,238 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Params that don't change what the model returns
+IGNORED_PARAMS = ("api_key", "priority", "conversation_id", "prompt_tokens")
+
+
+def cache_key(params):
+    """
+    Hash of everything that determines the response: model, sampling params
+    and the final OpenAI-format messages, exactly as they go to completions.
+    """
+    keyed = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+    dumped = json.dumps(keyed, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(params):
+    """
+    Only deterministic requests are worth replaying. Without an explicit
+    temperature the provider's default sampling applies (usually 1.0).
+    """
+    return "temperature" in params and params["temperature"] == 0
+
+
+def plain_chunk(chunk):
+    """
+    A JSON-compatible copy of a provider chunk (e.g. a litellm stream chunk).
+
+    Consumers edit chunks in place (the judge review strips its tags from the
+    delta), so the cache keeps its own copy instead of the provider's object.
+    """
+    if hasattr(chunk, "model_dump"):
+        chunk = chunk.model_dump()
+    return json.loads(json.dumps(chunk, default=str))
+
+
+class MemoryResponseCache:
+    """
+    In-process LRU of recorded chunk streams, optionally with a TTL.
+
+    A hit replays a copy of the stored chunks, since consumers may edit them.
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (created_at, chunks)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                self._stats["evictions"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            chunks = entry[1]
+        return copy.deepcopy(chunks)
+
+    def put(self, key, chunks):
+        with self._lock:
+            self._entries[key] = (time.time(), list(chunks))
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+class DiskResponseCache:
+    """
+    One JSON file per key, so the cache survives restarts and can be shared
+    by several processes. Reads touch the file's mtime, which makes mtime the
+    LRU order used for size-based eviction.
+
+    Entries are plain JSON rather than pickles, so whoever can write to the
+    cache directory can't get code run by reading an entry.
+    """
+
+    SUFFIX = ".json"
+
+    def __init__(self, path, max_entries=1024, ttl=None):
+        self.path = os.path.expanduser(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            created_at, chunks = entry["created_at"], entry["chunks"]
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except Exception:
+            # Truncated or written by an incompatible version
+            self._discard(path)
+            self._count("misses")
+            return None
+
+        if self.ttl and time.time() - created_at > self.ttl:
+            self._discard(path)
+            self._count("misses")
+            return None
+
+        try:
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        self._count("hits")
+        return chunks
+
+    def put(self, key, chunks):
+        try:
+            data = json.dumps({"created_at": time.time(), "chunks": list(chunks)})
+        except (TypeError, ValueError):
+            # Only plain chunks (see plain_chunk) can be stored
+            return
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            self._discard(tmp)
+            return
+        self._count("stores")
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            if self._discard(path):
+                self._count("evictions")
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(self.SUFFIX):
+                self._discard(entry.path)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.path) if name.endswith(self.SUFFIX))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self))
+
+
+class CompletionStream:
+    """
+    Iterates over a completions stream and, if a cache and key are given,
+    records a plain copy of every chunk so the whole response can be stored
+    once it's done.
+
+    The response is stored when the stream is exhausted, or when the consumer
+    calls complete() because it deliberately stopped reading early (e.g. at the
+    end of a code block). A stream that raises or is abandoned is never stored.
+    """
+
+    def __init__(self, chunks, cache=None, key=None):
+        self._chunks = iter(chunks)
+        self._cache = cache
+        self._key = key
+        self._recorded = [] if cache is not None else None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.complete()
+            raise
+        if self._recorded is not None:
+            self._recorded.append(plain_chunk(chunk))
+        return chunk
+
+    def complete(self):
+        """Store what has been received so far as the full response."""
+        if self._recorded is None:
+            return
+        recorded, self._recorded = self._recorded, None
+        if recorded:
+            self._cache.put(self._key, recorded)
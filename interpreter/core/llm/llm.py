@@ -15,13 +15,18 @@ import time
 import uuid
 
 import requests
-import tokentrim as tt
 
+from .cache import CompletionStream, cache_key, is_cacheable
 from .run_text_llm import run_text_llm
 
 # from .run_function_calling_llm import run_function_calling_llm
 from .run_tool_calling_llm import run_tool_calling_llm
-from .utils.convert_to_openai_messages import convert_to_openai_messages
+from .scheduler import estimate_tokens, scheduler
+from .utils.convert_to_openai_messages import (
+    ConversionCache,
+    convert_to_openai_messages,
+)
+from .utils.token_trimmer import TokenTrimmer
 
 # Create or get the logger
 logger = logging.getLogger("LiteLLM")
@@ -73,6 +78,21 @@ class Llm:
         # Budget manager powered by LiteLLM
         self.max_budget = None
 
+        # Priority in the process-wide LLM scheduler (lower runs first)
+        self.priority = 0
+
+        # Optional response cache (MemoryResponseCache / DiskResponseCache).
+        # Deterministic requests with identical params replay the stored chunks.
+        # With a cache set, the default temperature of 0 is sent explicitly.
+        self.cache = None
+
+        # OpenAI-format versions of the LMC messages, so each message is only
+        # converted (templates, images...) once rather than on every call
+        self.conversion_cache = ConversionCache()
+
+        # Like tokentrim.trim, but remembers each message's token count
+        self.trimmer = TokenTrimmer()
+
     def run(self, messages):
         """
         We're responsible for formatting the call into the llm.completions object,
@@ -206,32 +226,34 @@ class Llm:
             vision=self.supports_vision,
             shrink_images=self.interpreter.shrink_images,
             interpreter=self.interpreter,
+            cache=self.conversion_cache,
         )
 
         system_message = messages[0]["content"]
         messages = messages[1:]
 
         # Trim messages
+        prompt_tokens = None
         try:
             if self.context_window and self.max_tokens:
                 trim_to_be_this_many_tokens = (
                     self.context_window - self.max_tokens - 25
                 )  # arbitrary buffer
-                messages = tt.trim(
+                messages = self.trimmer.trim(
                     messages,
                     system_message=system_message,
                     max_tokens=trim_to_be_this_many_tokens,
                 )
             elif self.context_window and not self.max_tokens:
                 # Just trim to the context window if max_tokens not set
-                messages = tt.trim(
+                messages = self.trimmer.trim(
                     messages,
                     system_message=system_message,
                     max_tokens=self.context_window,
                 )
             else:
                 try:
-                    messages = tt.trim(
+                    messages = self.trimmer.trim(
                         messages, system_message=system_message, model=model
                     )
                 except:
@@ -258,9 +280,10 @@ Also please set `self.max_tokens = {max tokens per response}`.
 Continuing...
                             """
                             )
-                    messages = tt.trim(
+                    messages = self.trimmer.trim(
                         messages, system_message=system_message, max_tokens=8000
                     )
+            prompt_tokens = self.trimmer.last_total
         except:
             # If we're trimming messages, this won't work.
             # If we're trimming from a model we don't know, this won't work.
@@ -296,8 +319,17 @@ Continuing...
             params["max_tokens"] = self.max_tokens
         if self.temperature:
             params["temperature"] = self.temperature
+        elif self.cache is not None and self.temperature == 0:
+            # Setting a cache opts in to deterministic requests, so the 0 is
+            # sent rather than leaving the provider's default sampling
+            params["temperature"] = 0
         if hasattr(self.interpreter, "conversation_id"):
             params["conversation_id"] = self.interpreter.conversation_id
+        if self.priority:
+            params["priority"] = self.priority
+        if prompt_tokens:
+            # Lets the scheduler reserve the trimmer's count instead of estimating
+            params["prompt_tokens"] = prompt_tokens
 
         # Set some params directly on LiteLLM
         if self.max_budget:
@@ -323,6 +355,23 @@ Continuing...
         else:
             yield from run_text_llm(self, params)
 
+    def stream_completions(self, **params):
+        """
+        Calls self.completions, going through self.cache when it's set.
+
+        `params` must be final (messages included), since they are the cache key.
+        Returns a CompletionStream; call complete() on it if you stop reading
+        before the end and what you've read is the whole response.
+        """
+        if self.cache is None or not is_cacheable(params):
+            return CompletionStream(self.completions(**params))
+
+        key = cache_key(params)
+        chunks = self.cache.get(key)
+        if chunks is not None:
+            return CompletionStream(chunks)
+        return CompletionStream(self.completions(**params), self.cache, key)
+
     # If you change model, set _is_loaded to false
     @property
     def model(self):
@@ -432,6 +481,14 @@ def fixed_litellm_completions(**params):
 
     params["model"] = params["model"].replace(":latest", "")
 
+    # Reserve the (already trimmed) prompt plus the response budget, using the
+    # trimmer's token count when there is one
+    priority = params.pop("priority", 0)
+    prompt_tokens = params.pop("prompt_tokens", None)
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(params.get("messages", []))
+    tokens = prompt_tokens + (params.get("max_tokens") or 0)
+
     # Run completion
     attempts = 4
     first_error = None
@@ -440,7 +497,9 @@ def fixed_litellm_completions(**params):
 
     for attempt in range(attempts):
         try:
+            scheduler.acquire(params["model"], tokens, priority)
             yield from litellm.completion(**params)
+            scheduler.report_success(params["model"])
             return  # If the completion is successful, exit the function
         except KeyboardInterrupt:
             print("Exiting...")
@@ -449,6 +508,15 @@ def fixed_litellm_completions(**params):
             if attempt == 0:
                 # Store the first error
                 first_error = e
+            if isinstance(e, litellm.exceptions.RateLimitError):
+                # Back off every caller of this model, the next acquire() waits it out
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                retry_after = headers.get("retry-after")
+                try:
+                    retry_after = float(retry_after) if retry_after else None
+                except ValueError:
+                    retry_after = None
+                scheduler.report_rate_limited(params["model"], retry_after)
             if (
                 isinstance(e, litellm.exceptions.AuthenticationError)
                 and "api_key" not in params
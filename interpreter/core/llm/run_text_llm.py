@@ -17,7 +17,9 @@ def run_text_llm(llm, params):
     accumulated_block = ""
     language = None
 
-    for chunk in llm.completions(**params):
+    stream = llm.stream_completions(**params)
+
+    for chunk in stream:
         if llm.interpreter.verbose:
             print("Chunk in coding_llm", chunk)
 
@@ -43,6 +45,8 @@ def run_text_llm(llm, params):
 
         # Did we just exit a code block?
         if inside_code_block and "```" in accumulated_block:
+            # Everything after the code block is ignored, so this is the full response
+            stream.complete()
             return
 
         # If we're in a code block,
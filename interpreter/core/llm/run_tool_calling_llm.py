@@ -175,7 +175,7 @@ def run_tool_calling_llm(llm, request_params):
     review_category = None
     buffer = ""
 
-    for chunk in llm.completions(**request_params):
+    for chunk in llm.stream_completions(**request_params):
         if "choices" not in chunk or len(chunk["choices"]) == 0:
             # This happens sometimes
             continue
@@ -187,12 +187,13 @@ def run_tool_calling_llm(llm, request_params):
             function_call_detected = True
 
             # import pdb; pdb.set_trace()
-            if len(delta["tool_calls"]) > 0 and delta["tool_calls"][0].function:
+            # Item access, so plain chunks replayed from the response cache work too
+            if len(delta["tool_calls"]) > 0 and delta["tool_calls"][0]["function"]:
                 delta = {
                     # "id": delta["tool_calls"][0],
                     "function_call": {
-                        "name": delta["tool_calls"][0].function.name,
-                        "arguments": delta["tool_calls"][0].function.arguments,
+                        "name": delta["tool_calls"][0]["function"]["name"],
+                        "arguments": delta["tool_calls"][0]["function"]["arguments"],
                     }
                 }
 
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+
+def estimate_tokens(messages):
+    """
+    Cheap prompt size estimate (~4 characters per token) for already-trimmed
+    OpenAI-style messages. Only a fallback for when the trimmer's token count
+    isn't available: it's far off for code or non-English text.
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    total += 1000  # Rough cost of an image
+                else:
+                    total += len(str(part.get("text", ""))) // 4
+        elif content:
+            total += len(str(content)) // 4
+        if message.get("tool_calls"):
+            total += len(str(message["tool_calls"])) // 4
+        total += 4  # Per-message overhead
+    return total
+
+
+class LlmScheduler:
+    """
+    A process-wide gate in front of LLM calls.
+
+    Every session's Llm goes through the same scheduler, so requests-per-minute
+    and tokens-per-minute budgets are enforced per model across all of them.
+    Waiters are served by priority (lower first), then arrival order. A rate
+    limit error from the provider puts the whole model into a jittered
+    exponential backoff instead of letting every caller retry immediately.
+
+    Models without configured limits pass straight through.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, max_backoff=60.0):
+        self.max_backoff = max_backoff
+        self._condition = threading.Condition()
+        self._limits = {}  # model -> (rpm, tpm); "default" applies to all others
+        self._usage = {}  # model -> deque of (timestamp, tokens)
+        self._usage_tokens = {}  # model -> tokens currently in the window
+        self._backoff_until = {}
+        self._failures = {}
+        self._waiting = []  # heap of (priority, sequence, model)
+        self._sequence = itertools.count()
+        self._stats = {
+            "requests": 0,
+            "delayed": 0,
+            "rate_limited": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+    def configure(self, model="default", rpm=None, tpm=None):
+        """Set the requests-per-minute and tokens-per-minute budget for a model."""
+        with self._condition:
+            if rpm is None and tpm is None:
+                self._limits.pop(model, None)
+            else:
+                self._limits[model] = (rpm, tpm)
+            self._condition.notify_all()
+
+    def reset(self):
+        """Drop all limits, usage and backoff state."""
+        with self._condition:
+            self._limits.clear()
+            self._usage.clear()
+            self._usage_tokens.clear()
+            self._backoff_until.clear()
+            self._failures.clear()
+            self._condition.notify_all()
+
+    def acquire(self, model, tokens=0, priority=0):
+        """
+        Block until `model` has budget for one request of `tokens` tokens.
+        Returns the number of seconds spent waiting.
+        """
+        started = time.monotonic()
+        with self._condition:
+            limits = self._limits.get(model, self._limits.get("default"))
+            if limits is None and not self._backoff_until.get(model):
+                self._record(model, tokens, started, 0.0)
+                return 0.0
+
+            ticket = (priority, next(self._sequence), model)
+            heapq.heappush(self._waiting, ticket)
+            blocked = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(model, tokens, now)
+                    if delay <= 0 and self._is_next(ticket):
+                        break
+                    # Wake up when budget frees up, or when someone ahead leaves
+                    blocked = True
+                    self._condition.wait(delay if delay > 0 else None)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+            waited = time.monotonic() - started if blocked else 0.0
+            self._record(model, tokens, time.monotonic(), waited)
+            return waited
+
+    def report_rate_limited(self, model, retry_after=None):
+        """
+        Record a rate limit error for `model` and back off all callers.
+        Returns the backoff delay in seconds.
+        """
+        with self._condition:
+            failures = self._failures.get(model, 0) + 1
+            self._failures[model] = failures
+            if retry_after is not None:
+                delay = float(retry_after)
+            else:
+                # Exponential backoff with jitter, so callers don't retry in lockstep
+                delay = min(self.max_backoff, 2 ** (failures - 1))
+                delay = random.uniform(delay / 2, delay)
+            self._backoff_until[model] = max(
+                self._backoff_until.get(model, 0), time.monotonic() + delay
+            )
+            self._stats["rate_limited"] += 1
+            self._condition.notify_all()
+            return delay
+
+    def report_success(self, model):
+        with self._condition:
+            self._failures.pop(model, None)
+
+    def stats(self):
+        """Queue depth and wait time metrics."""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._waiting)
+            waiting_by_model = {}
+            for _, _, model in self._waiting:
+                waiting_by_model[model] = waiting_by_model.get(model, 0) + 1
+            stats["waiting_by_model"] = waiting_by_model
+            stats["avg_wait"] = (
+                stats["total_wait"] / stats["requests"] if stats["requests"] else 0.0
+            )
+            return stats
+
+    def _is_next(self, ticket):
+        """Only the best-placed waiter for a model may take its budget."""
+        for waiting in sorted(self._waiting):
+            if waiting[2] == ticket[2]:
+                return waiting == ticket
+        return True
+
+    def _delay(self, model, tokens, now):
+        """Seconds until `model` can accept a request of `tokens` tokens."""
+        delay = self._backoff_until.get(model, 0) - now
+        limits = self._limits.get(model, self._limits.get("default"))
+        if limits is None:
+            return delay
+
+        rpm, tpm = limits
+        usage = self._usage.setdefault(model, deque())
+        while usage and usage[0][0] <= now - self.WINDOW:
+            self._usage_tokens[model] -= usage.popleft()[1]
+
+        if rpm and len(usage) >= rpm:
+            delay = max(delay, usage[len(usage) - rpm][0] + self.WINDOW - now)
+        if tpm and usage:
+            # A single request larger than the whole budget still runs, alone
+            excess = self._usage_tokens.get(model, 0) + min(tokens, tpm) - tpm
+            if excess > 0:
+                for timestamp, used in usage:
+                    excess -= used
+                    if excess <= 0:
+                        delay = max(delay, timestamp + self.WINDOW - now)
+                        break
+        return delay
+
+    def _record(self, model, tokens, now, waited):
+        self._usage.setdefault(model, deque()).append((now, tokens))
+        self._usage_tokens[model] = self._usage_tokens.get(model, 0) + tokens
+        usage = self._usage[model]
+        while usage and usage[0][0] <= now - self.WINDOW:
+            self._usage_tokens[model] -= usage.popleft()[1]
+        self._stats["requests"] += 1
+        if waited > 0:
+            self._stats["delayed"] += 1
+            self._stats["total_wait"] += waited
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+
+
+# Shared by every Llm in the process
+scheduler = LlmScheduler()
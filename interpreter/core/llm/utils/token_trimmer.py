@@ -0,0 +1,141 @@
+from tokentrim.model_map import MODEL_MAX_TOKENS
+from tokentrim.tokentrim import num_tokens_from_messages, shorten_message_to_fit_limit
+
+# num_tokens_from_messages adds this once per list of messages
+REPLY_PRIMING_TOKENS = 3
+
+
+def count_message_tokens(message, model=None):
+    return num_tokens_from_messages([message], model) - REPLY_PRIMING_TOKENS
+
+
+class TokenTrimmer:
+    """
+    A drop-in for tokentrim.trim that remembers how many tokens each message
+    has, so every step of the agent loop only tokenizes messages it hasn't
+    seen yet instead of the whole history.
+
+    Trimming works like tokentrim: keep the newest messages that fit, shorten
+    the next one into whatever room is left (unless it's a function call), and
+    drop everything older. With cached counts this is a single pass of
+    additions over the history.
+    """
+
+    def __init__(self, count_tokens=None, shorten=None):
+        self.count_tokens = count_tokens or count_message_tokens
+        self.shorten = shorten or shorten_message_to_fit_limit
+        self._counts = {}  # (model, message key) -> tokens
+        self.last_total = None  # Prompt tokens of what the last trim() returned
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, message, model=None):
+        return self._count(message, (model, _message_key(message)), model)
+
+    def _count(self, message, key, model):
+        tokens = self._counts.get(key)
+        if tokens is None:
+            self.misses += 1
+            tokens = self._counts[key] = self.count_tokens(message, model)
+        else:
+            self.hits += 1
+        return tokens
+
+    def total(self, messages, model=None):
+        """Same as tokentrim's num_tokens_from_messages, from cached counts."""
+        return sum(self.count(message, model) for message in messages) + REPLY_PRIMING_TOKENS
+
+    def trim(self, messages, system_message=None, max_tokens=None, model=None, trim_ratio=0.75):
+        if max_tokens is None:
+            if model not in MODEL_MAX_TOKENS:
+                raise ValueError(f"Invalid model: {model}. Specify max_tokens instead")
+            max_tokens = int(MODEL_MAX_TOKENS[model] * trim_ratio)
+
+        live_keys = set()
+
+        system_message_event = None
+        if system_message:
+            system_message_event = {"role": "system", "content": system_message}
+            system_key = (model, _message_key(system_message_event))
+            system_tokens = self._count(system_message_event, system_key, model) + REPLY_PRIMING_TOKENS
+            if system_tokens > max_tokens:
+                print(
+                    "`tokentrim`: Warning, system message exceeds token limit, which is probably undesired. Trimming..."
+                )
+                self.shorten(system_message_event, max_tokens, model)
+                system_key = (model, _message_key(system_message_event))
+                system_tokens = self._count(system_message_event, system_key, model) + REPLY_PRIMING_TOKENS
+            live_keys.add(system_key)
+            # tokentrim subtracts the system message twice, keep the same budget
+            max_tokens -= 2 * system_tokens
+
+        # One pass: each message's key is built once, and the total is kept
+        # running instead of summed again
+        counts = []
+        kept_tokens = REPLY_PRIMING_TOKENS
+        for message in messages:
+            key = (model, _message_key(message))
+            tokens = self._count(message, key, model)
+            counts.append(tokens)
+            kept_tokens += tokens
+            live_keys.add(key)
+
+        # Drop the oldest messages until the rest fits, subtracting as we go
+        start = 0
+        while start < len(messages) and kept_tokens > max_tokens:
+            kept_tokens -= counts[start]
+            start += 1
+
+        final_messages = list(messages[start:])
+        total = kept_tokens
+
+        # Shorten the newest dropped message into the remaining room
+        if start > 0:
+            message = dict(messages[start - 1])
+            if "function_call" not in message:
+                self.shorten(message, max_tokens - kept_tokens, model)
+            tokens = self.count(message, model)
+            if tokens + REPLY_PRIMING_TOKENS + kept_tokens <= max_tokens:
+                final_messages.insert(0, message)
+                total += tokens
+
+        if system_message_event is not None:
+            final_messages.insert(0, system_message_event)
+            total += system_tokens - REPLY_PRIMING_TOKENS
+
+        # Already counted, so callers (e.g. the LLM scheduler) needn't tokenize again
+        self.last_total = total
+
+        self._prune(live_keys)
+        return final_messages
+
+    def _prune(self, live_keys):
+        # Counts for messages that left the history (or changed) aren't needed anymore
+        if len(self._counts) > 2 * len(live_keys) + 16:
+            self._counts = {key: self._counts[key] for key in live_keys if key in self._counts}
+
+    def clear(self):
+        self._counts.clear()
+
+    def __len__(self):
+        return len(self._counts)
+
+
+def _message_key(message):
+    # Converted messages are new dicts every call but reuse the same content
+    # strings, and strings cache their hash and compare by identity first. So
+    # nested content (image parts, function calls) is keyed by its structure
+    # with the strings as they are, never by str() of a possibly huge value.
+    return _freeze(message)
+
+
+def _freeze(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
@@ -1,4 +1,32 @@
 import re
+import threading
+import time
+
+# Split a message into parts by {{ and }}, including multi-line strings
+BLOCK_PATTERN = re.compile(r"({{.*?}})", flags=re.DOTALL)
+
+# A block can choose its caching policy with a leading comment, e.g. {{ # cache: 60
+CACHE_DIRECTIVE = re.compile(r"\A\s*#\s*cache:\s*([\w.]+)")
+
+
+def is_block(part):
+    return part.startswith("{{") and part.endswith("}}")
+
+
+def run_block(interpreter, code):
+    """
+    Runs the code inside a {{ }} block and returns its printed output.
+    """
+    output = interpreter.computer.run("python", code, display=interpreter.verbose)
+
+    # Extract the output content
+    outputs = (
+        line["content"]
+        for line in output
+        if line.get("format") == "output"
+        and "IGNORE_ALL_ABOVE_THIS_LINE" not in line["content"]
+    )
+    return "\n".join(outputs)
 
 
 def render_message(interpreter, message):
@@ -9,27 +37,12 @@ def render_message(interpreter, message):
     previous_save_skills_setting = interpreter.computer.save_skills
     interpreter.computer.save_skills = False
 
-    # Split the message into parts by {{ and }}, including multi-line strings
-    parts = re.split(r"({{.*?}})", message, flags=re.DOTALL)
+    parts = BLOCK_PATTERN.split(message)
 
     for i, part in enumerate(parts):
-        # If the part is enclosed in {{ and }}
-        if part.startswith("{{") and part.endswith("}}"):
-            # Run the code inside the brackets
-            output = interpreter.computer.run(
-                "python", part[2:-2].strip(), display=interpreter.verbose
-            )
-
-            # Extract the output content
-            outputs = (
-                line["content"]
-                for line in output
-                if line.get("format") == "output"
-                and "IGNORE_ALL_ABOVE_THIS_LINE" not in line["content"]
-            )
-
-            # Replace the part with the output
-            parts[i] = "\n".join(outputs)
+        # If the part is enclosed in {{ and }}, run the code inside the brackets
+        if is_block(part):
+            parts[i] = run_block(interpreter, part[2:-2].strip())
 
     # Join the parts back into the message
     rendered_message = "".join(parts).strip()
@@ -44,3 +57,149 @@ def render_message(interpreter, message):
     interpreter.computer.save_skills = previous_save_skills_setting
 
     return rendered_message
+
+
+def block_policy(code, default):
+    """
+    Returns "turn", "step", "forever" or a TTL in seconds for a block.
+    """
+    match = CACHE_DIRECTIVE.match(code)
+    policy = match.group(1) if match else default
+    if policy in ("turn", "step", "forever"):
+        return policy
+    try:
+        return float(policy)
+    except (TypeError, ValueError):
+        return default
+
+
+class SystemMessageRenderer:
+    """
+    Renders the system message for respond(), reusing whatever hasn't changed.
+
+    The template (system message + language system messages + custom
+    instructions + computer API message) is only reassembled and re-split when
+    one of those inputs changes. Each {{ }} block's output is cached by its
+    code, according to its policy:
+
+        turn     - run once per user turn (default)
+        step     - run on every respond() iteration
+        forever  - run once, until invalidate()
+        <number> - reuse the output for that many seconds
+
+    A block picks its own policy with a leading `# cache: <policy>` comment.
+    """
+
+    def __init__(self, default_policy="turn"):
+        self.default_policy = default_policy
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._dependencies = None
+        self._parts = None
+        self._blocks = {}  # code -> (output, rendered_at, turn)
+        self._stats = {
+            "template_hits": 0,
+            "template_misses": 0,
+            "hits": 0,
+            "misses": 0,
+        }
+
+    def begin_turn(self):
+        """Called once per user message; expires blocks with the "turn" policy."""
+        with self._lock:
+            self._turn += 1
+
+    def invalidate(self):
+        """Forget everything, e.g. after the computer was reset."""
+        with self._lock:
+            self._dependencies = None
+            self._parts = None
+            self._blocks.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached_blocks=len(self._blocks))
+
+    def render(self, interpreter):
+        parts = self._template_parts(interpreter)
+        if len(parts) == 1:
+            # Nothing dynamic
+            return parts[0].strip()
+
+        previous_save_skills_setting = interpreter.computer.save_skills
+        interpreter.computer.save_skills = False
+        try:
+            rendered = [
+                self._render_block(interpreter, part[2:-2].strip())
+                if is_block(part)
+                else part
+                for part in parts
+            ]
+        finally:
+            interpreter.computer.save_skills = previous_save_skills_setting
+
+        return "".join(rendered).strip()
+
+    def _template_parts(self, interpreter):
+        computer = interpreter.computer
+        languages = computer.terminal.languages
+        dependencies = (
+            interpreter.system_message,
+            tuple(getattr(language, "system_message", None) for language in languages),
+            interpreter.custom_instructions,
+            computer.import_computer_api,
+            computer.system_message,
+        )
+
+        with self._lock:
+            if self._parts is not None and dependencies == self._dependencies:
+                self._stats["template_hits"] += 1
+                return self._parts
+            self._stats["template_misses"] += 1
+
+        system_message = interpreter.system_message
+
+        # Add language-specific system messages
+        for language in languages:
+            if hasattr(language, "system_message"):
+                system_message += "\n\n" + language.system_message
+
+        # Add custom instructions
+        if interpreter.custom_instructions:
+            system_message += "\n\n" + interpreter.custom_instructions
+
+        # Add computer API system message
+        if computer.import_computer_api:
+            if computer.system_message not in system_message:
+                system_message = system_message + "\n\n" + computer.system_message
+
+        parts = BLOCK_PATTERN.split(system_message)
+        with self._lock:
+            self._dependencies = dependencies
+            self._parts = parts
+        return parts
+
+    def _render_block(self, interpreter, code):
+        policy = block_policy(code, self.default_policy)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._blocks.get(code)
+            if cached is not None and policy != "step":
+                output, rendered_at, turn = cached
+                if (
+                    policy == "forever"
+                    or (policy == "turn" and turn == self._turn)
+                    or (isinstance(policy, float) and now - rendered_at < policy)
+                ):
+                    self._stats["hits"] += 1
+                    return output
+            self._stats["misses"] += 1
+            turn = self._turn
+
+        output = run_block(interpreter, code)
+
+        if policy != "step":
+            with self._lock:
+                self._blocks[code] = (output, now, turn)
+        return output
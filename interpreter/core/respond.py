@@ -8,7 +8,6 @@ os.environ["LITELLM_LOCAL_MODEL_COST_MAP"] = "True"
 import litellm
 import openai
 
-from .render_message import render_message
 
 
 def respond(interpreter):
@@ -20,27 +19,12 @@ def respond(interpreter):
     last_unsupported_code = ""
     insert_loop_message = False
 
+    # Blocks cached "once per turn" are rendered again for this user message
+    interpreter.system_message_renderer.begin_turn()
+
     while True:
         ## RENDER SYSTEM MESSAGE ##
 
-        system_message = interpreter.system_message
-
-        # Add language-specific system messages
-        for language in interpreter.computer.terminal.languages:
-            if hasattr(language, "system_message"):
-                system_message += "\n\n" + language.system_message
-
-        # Add custom instructions
-        if interpreter.custom_instructions:
-            system_message += "\n\n" + interpreter.custom_instructions
-
-        # Add computer API system message
-        if interpreter.computer.import_computer_api:
-            if interpreter.computer.system_message not in system_message:
-                system_message = (
-                    system_message + "\n\n" + interpreter.computer.system_message
-                )
-
         # Storing the messages so they're accessible in the interpreter's computer
         # no... this is a huge time sink.....
         # if interpreter.sync_computer:
@@ -49,7 +33,11 @@ def respond(interpreter):
         #     )
 
         ## Rendering ↓
-        rendered_system_message = render_message(interpreter, system_message)
+        # Assembles the system message from its parts and runs its {{ }} blocks,
+        # reusing everything that hasn't changed since the last iteration
+        rendered_system_message = interpreter.system_message_renderer.render(
+            interpreter
+        )
         ## Rendering ↑
 
         rendered_system_message = {
@@ -0,0 +1,273 @@
+"""
+Append-only conversation history files.
+
+Each conversation is a `.history.jsonl` file with one record per line:
+
+    {"op": "snapshot", "messages": [...]}            the whole conversation
+    {"op": "message", "message": {...}}              a new message
+    {"op": "update", "index": 3, "message": {...}}   a message that changed in place
+    {"op": "truncate", "length": 5}                  messages removed from the end
+
+Replaying the records in order gives the conversation. A turn normally only
+appends its new messages, so saving no longer rewrites the whole history
+(base64 images included) every turn. The file is rewritten as a single
+snapshot when a writer starts, or once enough update/truncate records pile up.
+
+Older conversations are a plain `.json` list, and still load.
+
+The suffix keeps these apart from the server's session journals, which are
+`<session_id>.jsonl` files in the same default directory with a different
+record format.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+
+HISTORY_SUFFIX = ".history.jsonl"
+LEGACY_SUFFIX = ".json"
+CONVERSATION_SUFFIXES = (HISTORY_SUFFIX, LEGACY_SUFFIX)
+
+
+def is_conversation_file(filename):
+    return filename.endswith(CONVERSATION_SUFFIXES)
+
+
+def conversation_name(filename):
+    """
+    The filename without its conversation suffix.
+    """
+    for suffix in (HISTORY_SUFFIX, ".jsonl", LEGACY_SUFFIX):
+        if filename.endswith(suffix):
+            return filename[: -len(suffix)]
+    return filename
+
+
+def history_filename(filename):
+    """
+    The history file a conversation is saved to, moving older names over.
+    """
+    if filename.endswith(HISTORY_SUFFIX):
+        return filename
+    return conversation_name(filename) + HISTORY_SUFFIX
+
+
+def load_conversation(path):
+    """
+    Loads the messages of a conversation file, in either format.
+
+    Returns None if the file isn't a conversation, e.g. a server session
+    journal or a `.json` file that isn't a list of messages.
+    """
+    if path.endswith(LEGACY_SUFFIX):
+        with open(path, "r") as f:
+            messages = json.load(f)
+        return messages if isinstance(messages, list) else None
+
+    messages = None
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A write interrupted by a crash, everything before it is intact
+                break
+            if not isinstance(record, dict):
+                continue
+            op = record.get("op")
+            if op == "snapshot":
+                snapshot = record.get("messages")
+                if isinstance(snapshot, list):
+                    messages = snapshot
+                continue
+            if messages is None:
+                # Not a history snapshot yet, so nothing to apply these to
+                continue
+            try:
+                if op == "message":
+                    messages.append(record["message"])
+                elif op == "update":
+                    messages[record["index"]] = record["message"]
+                elif op == "truncate":
+                    del messages[record["length"] :]
+            except (KeyError, IndexError, TypeError):
+                continue
+    return messages
+
+
+class ConversationHistoryWriter:
+    """
+    Saves a conversation to a `.history.jsonl` file, writing only what
+    changed since the last save.
+
+    Messages are compared to what was written by identity: the same dict with
+    the same content and format objects counts as unchanged, which is a pointer
+    comparison per message rather than re-serializing the history. Messages
+    that are new dicts fall back to comparing values.
+
+    With `background=True`, writing happens on a worker thread and save()
+    returns immediately; flush() waits for pending writes. Records are still
+    serialized by save(), so messages that keep changing afterwards (e.g.
+    while streaming) can't end up half written in the file.
+    """
+
+    def __init__(self, path, compact_threshold=100, background=False):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.background = background
+        self._written = None  # _state() of each message as of the last save
+        self._edits = 0  # update/truncate records since the last snapshot
+        self._failed = False  # a background write failed, start over from a snapshot
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def save(self, messages):
+        with self._lock:
+            if self._failed:
+                self._failed = False
+                self._written = None
+            records = self._records_for(messages)
+            if not records:
+                return
+            lines = self._encode_records(records)
+            if self.background:
+                self._start_worker()
+                self._queue.put(lines)
+                return
+        try:
+            self._write(lines)
+        except Exception:
+            with self._lock:
+                # Start over from a snapshot next time
+                self._written = None
+            raise
+
+    def flush(self):
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        self.flush()
+        if self._queue is not None:
+            self._queue.put(None)
+            self._queue = None
+            atexit.unregister(self.flush)
+
+    def _records_for(self, messages):
+        written = self._written
+        state = [_state(message) for message in messages]
+        self._written = state
+
+        # A new writer doesn't know what's in the file yet
+        if written is None:
+            self._edits = 0
+            return [("snapshot", list(messages))]
+
+        records = []
+        common = min(len(written), len(state))
+        for index in range(common):
+            if not _same(written[index], state[index]):
+                records.append(("update", index, messages[index]))
+        if len(state) < len(written):
+            records.append(("truncate", len(state)))
+        self._edits += len(records)
+
+        if self._edits > self.compact_threshold or len(records) > common // 2 + 1:
+            self._edits = 0
+            return [("snapshot", list(messages))]
+
+        for message in messages[len(written) :]:
+            records.append(("message", message))
+        return records
+
+    @staticmethod
+    def _encode_records(records):
+        """
+        (snapshot line or None, appended lines), serialized right away.
+        """
+        snapshot = None
+        if records[0][0] == "snapshot":
+            snapshot = _encode(records[0])
+            records = records[1:]
+        return snapshot, "".join(_encode(record) for record in records)
+
+    def _write(self, lines):
+        snapshot, appended = lines
+        if snapshot is not None:
+            self._write_snapshot(snapshot)
+        if not appended:
+            return
+        with open(self.path, "a") as f:
+            f.write(appended)
+
+    def _write_snapshot(self, line):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Replace the file in one step so it's never half written
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(line)
+        os.replace(tmp_path, self.path)
+
+    def _start_worker(self):
+        # Called with self._lock held
+        if self._queue is not None:
+            return
+        self._queue = queue.Queue()
+        worker = threading.Thread(target=self._work, args=(self._queue,), daemon=True)
+        worker.start()
+        # Don't lose the last turn when the process exits
+        atexit.register(self.flush)
+
+    def _work(self, lines_queue):
+        skipping = False  # after a failure, appends are useless until the next snapshot
+        while True:
+            lines = lines_queue.get()
+            try:
+                if lines is None:
+                    return
+                if skipping and lines[0] is None:
+                    continue
+                skipping = False
+                self._write(lines)
+            except Exception as e:
+                skipping = True
+                with self._lock:
+                    self._failed = True
+                print(f"Failed to save conversation history to {self.path}: {e}")
+            finally:
+                lines_queue.task_done()
+
+
+def _state(message):
+    return (
+        message,
+        message.get("content"),
+        message.get("format"),
+        message.get("role"),
+        message.get("type"),
+    )
+
+
+def _same(written, current):
+    if written[0] is current[0]:
+        # Same dict: changed in place only if its content or format was replaced
+        return written[1] is current[1] and written[2] is current[2]
+    # A new dict (e.g. the whole list was replaced) that may still be equal
+    return written[1:] == current[1:] and written[0] == current[0]
+
+
+def _encode(record):
+    op = record[0]
+    if op == "snapshot":
+        data = {"op": "snapshot", "messages": record[1]}
+    elif op == "message":
+        data = {"op": "message", "message": record[1]}
+    elif op == "update":
+        data = {"op": "update", "index": record[1], "message": record[2]}
+    else:
+        data = {"op": "truncate", "length": record[1]}
+    return json.dumps(data) + "\n"
@@ -1,9 +1,21 @@
+import os
 import re
 
+# Preserve critical error information
+ERROR_PATTERN = re.compile(r'\b(error|warning|exception|traceback)\b', re.IGNORECASE)
+
+# Context kept around each error match, extended to whole lines
+ERROR_CONTEXT_BEFORE = 200
+ERROR_CONTEXT_AFTER = 800
+
+# Longest error keyword, so a match can't start further back than this from the end
+LONGEST_KEYWORD = 9
+
+
 def truncate_output(data, max_output_chars=5000, add_scrollbars=False):
     """
     Truncate output data while preserving error context.
-    
+
     Args:
         data: The input string to truncate
         max_output_chars: Maximum number of characters to keep (default 5000)
@@ -12,50 +24,236 @@ def truncate_output(data, max_output_chars=5000, add_scrollbars=False):
     if not data:
         return data
 
-    # Preserve critical error information
-    error_pattern = r'\b(error|warning|exception|traceback)\b'
-    error_matches = list(re.finditer(error_pattern, data, re.IGNORECASE))
-    
+    error_matches = list(ERROR_PATTERN.finditer(data))
+
     # If no truncation needed, return original
     if len(data) <= max_output_chars:
         return data
-        
+
     # Collect error context with improved ranges
     error_context = []
     for match in error_matches:
         # Capture more context around errors
-        start = max(0, match.start() - 200)  # Increased from 100
-        end = min(len(data), match.end() + 800)  # Increased from 500
+        start = max(0, match.start() - ERROR_CONTEXT_BEFORE)  # Increased from 100
+        end = min(len(data), match.end() + ERROR_CONTEXT_AFTER)  # Increased from 500
         # Get complete lines containing the error
         while start > 0 and data[start] != '\n':
             start -= 1
         while end < len(data) and data[end] != '\n':
             end += 1
         error_context.append(data[start:end])
-    
+
+    return _truncated_view(
+        data, data, error_context, len(data), data.count('\n') + 1, max_output_chars
+    )
+
+
+def _truncated_view(head, tail, error_context, length, total_lines, max_output_chars, note=None):
+    """
+    Builds the truncated output from the first and last max_output_chars
+    characters of the data (`head` and `tail`) and its error context.
+    """
     # Basic truncation showing both start and end
     if error_context:
         # With errors, show error context and remaining space
         error_content = '\n'.join(error_context)
         available_chars = max_output_chars - len(error_content) - 100  # Buffer for messages
         if available_chars > 0:
-            start_portion = data[:available_chars//3]
-            end_portion = data[-available_chars*2//3:]
+            start_portion = head[:available_chars//3]
+            end_portion = tail[-(available_chars*2//3):] if available_chars*2//3 else ""
             truncated = f"{start_portion}\n...\n{error_content}\n...\n{end_portion}"
         else:
             truncated = error_content
     else:
         # Without errors, show beginning and end of content
-        start_portion = data[:max_output_chars//3]
-        end_portion = data[-max_output_chars*2//3:]
+        start_portion = head[:max_output_chars//3]
+        end_portion = tail[-(max_output_chars*2//3):]
         truncated = f"{start_portion}\n...\n{end_portion}"
-    
+
     # Add truncation notification
-    if len(truncated) < len(data):
-        total_lines = data.count('\n') + 1
+    if len(truncated) < length:
         shown_lines = truncated.count('\n') + 1
-        message = f"\n\n[Output truncated from {total_lines} to {shown_lines} lines. Total characters: {len(data)}, Shown: {len(truncated)}]"
+        message = f"\n\n[Output truncated from {total_lines} to {shown_lines} lines. Total characters: {length}, Shown: {len(truncated)}]"
         message += "\n[Use output redirection (>) or paging (|less) for full content]"
+        if note:
+            message += f"\n{note}"
         truncated += message
 
     return truncated
+
+
+class OutputAccumulator:
+    """
+    Streaming version of truncate_output.
+
+    Console output arrives in many small chunks. Instead of re-truncating the
+    whole accumulated string after every chunk (quadratic in the output size),
+    this keeps a bounded head, a bounded tail and the error context windows,
+    each updated in O(chunk), and builds the same view as
+    truncate_output(full_output) from them.
+
+    Two bounds make it differ from truncate_output on pathological output:
+    error context stops extending to the line boundary after `line_limit`
+    characters, and only the most recent contexts that fit in
+    `max_error_chars` are kept.
+
+    If `spill_path` is given, the full output is written there once it
+    exceeds max_output_chars, and the truncated view points to it.
+    """
+
+    def __init__(self, max_output_chars=5000, spill_path=None, max_error_chars=None, line_limit=1000):
+        self.max_output_chars = max_output_chars
+        self.max_error_chars = max_error_chars or 2 * max_output_chars
+        self.line_limit = line_limit
+        self.spill_path = spill_path
+        self.length = 0
+        self.newlines = 0
+
+        self._head = ""
+        self._tail = []  # chunks, trimmed to the last max_output_chars lazily
+        self._tail_length = 0
+
+        # Recent data, from absolute offset _recent_start, for finding error context
+        self._recent = ""
+        self._recent_start = 0
+        self._scanned = 0  # matches starting before this offset have been handled
+        self._pending = []  # [start, end_from, searched] error contexts waiting for their line end
+        self._contexts = []
+        self._context_chars = 0
+
+        self._spill = None
+
+    def append(self, text):
+        if not text:
+            return
+        self.length += len(text)
+        self.newlines += text.count('\n')
+
+        if len(self._head) < self.max_output_chars:
+            self._head += text[: self.max_output_chars - len(self._head)]
+
+        self._tail.append(text)
+        self._tail_length += len(text)
+        if self._tail_length > 2 * self.max_output_chars:
+            tail = "".join(self._tail)[-self.max_output_chars:]
+            self._tail = [tail]
+            self._tail_length = len(tail)
+
+        self._recent += text
+        self._scan()
+        self._resolve()
+        self._trim_recent()
+
+        if self.spill_path:
+            self._write_spill(text)
+
+    def view(self):
+        """The truncated output, as truncate_output would return it."""
+        if self.length <= self.max_output_chars:
+            return self._head
+
+        # Matches at the very end and contexts still waiting for their line end
+        # are cut off at the current end, without changing the stored state
+        pending = self._pending + self._matches(final=True)
+        contexts = self._contexts + [self._context_text(start, None) for start, _, _ in pending]
+        while sum(len(c) + 1 for c in contexts) > self.max_error_chars and len(contexts) > 1:
+            contexts.pop(0)
+
+        note = f"[Full output saved to {self.spill_path}]" if self._spill else None
+        return _truncated_view(
+            self._head,
+            "".join(self._tail),
+            contexts,
+            self.length,
+            self.newlines + 1,
+            self.max_output_chars,
+            note,
+        )
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def _scan(self):
+        self._pending.extend(self._matches(final=False))
+        # Later matches start at least this far back from the end
+        self._scanned = max(self._scanned, self.length - LONGEST_KEYWORD - 1)
+
+    def _matches(self, final):
+        """
+        Error contexts for matches after _scanned, as [start, end_from, searched].
+
+        A match ending at the very end of the data might continue in the next
+        chunk ("error" -> "errors"), so unless `final` it's left for later.
+        """
+        offset = self._recent_start
+        found = []
+        for match in ERROR_PATTERN.finditer(self._recent, self._scanned - offset):
+            match_start, match_end = match.start() + offset, match.end() + offset
+            if match_end >= self.length and not final:
+                break
+            found.append(self._context_for(match_start, match_end))
+            if not final:
+                self._scanned = match_end
+        return found
+
+    def _context_for(self, match_start, match_end):
+        start = max(0, match_start - ERROR_CONTEXT_BEFORE)
+        lower = max(self._recent_start, start - self.line_limit)
+        # Extend to the start of the line
+        while start > lower and self._recent[start - self._recent_start] != '\n':
+            start -= 1
+        end_from = match_end + ERROR_CONTEXT_AFTER
+        return [start, end_from, end_from]
+
+    def _resolve(self):
+        offset = self._recent_start
+        while self._pending:
+            start, end_from, searched = self._pending[0]
+            if end_from >= self.length:
+                break
+            newline = self._recent.find('\n', searched - offset)
+            if newline != -1:
+                end = newline + offset
+            elif self.length - end_from > self.line_limit:
+                end = end_from + self.line_limit
+            else:
+                self._pending[0][2] = self.length
+                break
+            self._pending.pop(0)
+            self._keep_context(self._context_text(start, end))
+
+    def _context_text(self, start, end):
+        offset = self._recent_start
+        return self._recent[start - offset : None if end is None else end - offset]
+
+    def _keep_context(self, context):
+        self._contexts.append(context)
+        self._context_chars += len(context) + 1
+        # Keep the most recent errors
+        while self._context_chars > self.max_error_chars and len(self._contexts) > 1:
+            self._context_chars -= len(self._contexts.pop(0)) + 1
+
+    def _trim_recent(self):
+        # Keep what the next match could need for its context, and pending contexts
+        keep_from = self._scanned - ERROR_CONTEXT_BEFORE - self.line_limit
+        if self._pending:
+            keep_from = min(keep_from, self._pending[0][0])
+        drop = keep_from - self._recent_start
+        # Trim in large steps so the copying is amortized
+        if drop > len(self._recent) // 2 and drop > 0:
+            self._recent = self._recent[drop:]
+            self._recent_start = keep_from
+
+    def _write_spill(self, text):
+        if self._spill is None:
+            if self.length <= self.max_output_chars:
+                return
+            # First time over the limit: everything before this chunk is in the head
+            previous = self.length - len(text)
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            self._spill = open(self.spill_path, "w", encoding="utf-8")
+            self._spill.write(self._head)
+            self._spill.write(text[self.max_output_chars - previous :])
+        else:
+            self._spill.write(text)
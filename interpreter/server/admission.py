@@ -0,0 +1,200 @@
+"""
+Rate limiting and admission control for Open Interpreter HTTP Server
+
+突发的聊天请求会同时创建解释器实例和内核，服务器在过载时越来越慢而不是拒绝请求。
+这里提供两层保护：按客户端和按会话的内存令牌桶限流，以及在实例、LLM 调度队列或
+CPU 饱和时立即拒绝（或按配置短暂等待）新的聊天请求。被拒绝的响应都带有 Retry-After 提示。
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+import psutil
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float  # 令牌桶重新装满还需的秒数
+    retry_after: float  # 被拒绝时需要等待的秒数
+
+
+class TokenBucket:
+    """按分钟匀速补充的令牌桶"""
+
+    def __init__(self, rate_per_minute: int, capacity: Optional[int] = None):
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> bool:
+        """取一个令牌；令牌不足时返回 False"""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate else float("inf")
+
+    def reset_after(self) -> float:
+        return max(0.0, (self.capacity - self.tokens) / self.rate) if self.rate else 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """按键（客户端地址、会话 ID）划分的令牌桶"""
+
+    def __init__(self, limit_per_minute: int, max_keys: int = 10000):
+        """
+        Args:
+            limit_per_minute: 每个键每分钟允许的请求数，0 表示不限制
+            max_keys: 最多跟踪的键数，超出时丢弃最久未用的桶
+        """
+        self.limit = max(0, limit_per_minute)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def check(self, key: str) -> RateLimitResult:
+        """为 key 消耗一个请求配额"""
+        if not self.enabled:
+            return RateLimitResult(True, 0, 0, 0.0, 0.0)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.limit)
+                # 被丢弃的桶都是最久未用的，其中的令牌通常已经补满
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            allowed = bucket.take()
+            return RateLimitResult(
+                allowed,
+                self.limit,
+                int(bucket.tokens),
+                bucket.reset_after(),
+                0.0 if allowed else bucket.retry_after()
+            )
+
+
+class AdmissionController:
+    """资源饱和时拒绝新的聊天请求"""
+
+    # CPU 使用率的采样间隔（秒），避免每个请求都读取一次
+    CPU_SAMPLE_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        max_active_turns: int = 0,
+        max_llm_queue: int = 0,
+        max_cpu_percent: float = 0,
+        max_wait: float = 0,
+        active_turns: Callable[[], int] = lambda: 0,
+        llm_queue_depth: Callable[[], int] = lambda: 0,
+        retry_after: int = 5,
+    ):
+        """
+        Args:
+            max_active_turns: 同时进行的聊天轮次上限，0 表示不限制
+            max_llm_queue: LLM 调度器中等待的请求数上限，0 表示不限制
+            max_cpu_percent: CPU 使用率上限（百分比），0 表示不检查
+            max_wait: 饱和时最多等待多久（秒）再拒绝，0（默认）表示立即拒绝；
+                等待会占用请求线程，只应设置得很短
+            active_turns: 返回当前进行中的聊天轮次数
+            llm_queue_depth: 返回 LLM 调度器中等待的请求数
+            retry_after: 被拒绝时建议的重试间隔（秒）
+        """
+        self.max_active_turns = max_active_turns
+        self.max_llm_queue = max_llm_queue
+        self.max_cpu_percent = max_cpu_percent
+        self.max_wait = max_wait
+        self.active_turns = active_turns
+        self.llm_queue_depth = llm_queue_depth
+        self.retry_after = retry_after
+        self._cpu_percent = 0.0
+        self._cpu_sampled = 0.0
+        self._lock = threading.Lock()
+        self._released = threading.Condition()
+        self._stats = {"admitted": 0, "rejected": 0, "delayed": 0}
+
+    def saturation(self, needs_instance: bool = True) -> Optional[str]:
+        """
+        返回饱和的资源名称；未饱和时返回 None
+
+        Args:
+            needs_instance: 请求是否需要新的解释器实例（会话已有实例时不检查实例上限）
+        """
+        if needs_instance and self.max_active_turns and self.active_turns() >= self.max_active_turns:
+            return "instances"
+        if self.max_llm_queue and self.llm_queue_depth() >= self.max_llm_queue:
+            return "llm"
+        if self.max_cpu_percent and self._sample_cpu() >= self.max_cpu_percent:
+            return "cpu"
+        return None
+
+    def admit(self, needs_instance: bool = True) -> Optional[str]:
+        """
+        准入检查；饱和时默认立即拒绝，设置了 max_wait 时在条件变量上等待资源释放
+
+        Returns:
+            None 表示准入，否则为饱和的资源名称
+        """
+        reason = self.saturation(needs_instance)
+        if reason is not None and self.max_wait > 0:
+            deadline = time.monotonic() + self.max_wait
+            with self._released:
+                while reason is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # 对话结束时由 notify 唤醒；LLM 队列和 CPU 没有通知，最多每秒重新检查一次
+                    self._released.wait(min(remaining, self.CPU_SAMPLE_INTERVAL))
+                    reason = self.saturation(needs_instance)
+            if reason is None:
+                self._count("delayed")
+        self._count("admitted" if reason is None else "rejected")
+        return reason
+
+    def notify(self) -> None:
+        """有对话结束、资源释放时唤醒等待准入的请求"""
+        with self._released:
+            self._released.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cpu_percent"] = self._cpu_percent
+        return stats
+
+    def _sample_cpu(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._cpu_sampled >= self.CPU_SAMPLE_INTERVAL:
+                # interval=None 不阻塞，返回距上次调用以来的平均使用率
+                self._cpu_percent = psutil.cpu_percent(interval=None)
+                self._cpu_sampled = now
+            return self._cpu_percent
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After 只接受整数秒"""
+    return str(max(1, math.ceil(seconds)))
@@ -2,19 +2,29 @@
 Flask application factory for Open Interpreter HTTP Server
 """
 
+import atexit
 import os
 import pkg_resources
 import threading
+import time
 from typing import Optional, Union
 
-from flask import Flask, jsonify
+import platformdirs
+import psutil
+from flask import Flask, g, jsonify, request
 import interpreter
 from interpreter import OpenInterpreter
+from interpreter.core.llm.cache import DiskResponseCache, MemoryResponseCache
+from interpreter.core.llm.scheduler import scheduler as llm_scheduler
 
 from .config import Config
 from .errors import ConfigurationError, format_error_response
-from .log_config import setup_logging, log_error
+from .log_config import configure_payload_logging, setup_logging, log_error
 from .session import SessionManager  # 直接从 session.py 导入
+from .pool import InterpreterPool
+from .metrics import REQUEST_LATENCY, metrics, timed_code_runner, timed_llm_completions
+from .timing import RequestTimeline, SlowRequestLog
+from .admission import AdmissionController, RateLimiter, retry_after_header
 from .routes import chat_bp, session_bp, health_bp, openai_bp  # 移除 openai_bp
 
 def configure_interpreter_instance(interpreter_instance: Union[OpenInterpreter, 'interpreter'], app: Flask) -> None:
@@ -41,8 +51,20 @@ def configure_interpreter_instance(interpreter_instance: Union[OpenInterpreter,
     interpreter_instance.llm.context_window = app.config['CONTEXT_WINDOW']
     interpreter_instance.llm.max_tokens = app.config['MAX_TOKENS']
     interpreter_instance.computer.import_computer_api = True
+    # 所有实例共享同一个响应缓存
+    interpreter_instance.llm.cache = getattr(app, 'llm_cache', None)
 
     
+    # 记录 LLM 和代码执行耗时（同一实例重复配置时不重复包装）
+    if not hasattr(interpreter_instance.llm.completions, '__wrapped__'):
+        interpreter_instance.llm.completions = timed_llm_completions(interpreter_instance.llm.completions)
+    if not hasattr(interpreter_instance.computer.run, '__wrapped__'):
+        interpreter_instance.computer.run = timed_code_runner(interpreter_instance.computer.run)
+    
+    # 客户端断开时由 SessionManager.cancel_turn 设置，core 和 Jupyter 内核会据此停止
+    if not hasattr(interpreter_instance, 'stop_event'):
+        interpreter_instance.stop_event = threading.Event()
+    
     # 基础配置
     interpreter_instance.conversation_history = True    
     # 设置安全模式
@@ -54,6 +76,61 @@ def configure_interpreter_instance(interpreter_instance: Union[OpenInterpreter,
         app.logger.warning("Interpreter instance missing safe_mode property. Adding property and setting to 'off'.")
         setattr(interpreter_instance, 'safe_mode', 'off')
 
+def create_interpreter_pool(app: Flask) -> InterpreterPool:
+    """
+    创建预热的解释器实例池，池中实例与默认实例使用相同配置
+    
+    Args:
+        app: Flask应用实例
+    """
+    def build_interpreter():
+        interpreter_instance = OpenInterpreter()
+        configure_interpreter_instance(interpreter_instance, app)
+        return interpreter_instance
+    
+    return InterpreterPool(
+        build_interpreter,
+        size=app.config.get('INTERPRETER_POOL_SIZE', 2),
+        warm_kernel=app.config.get('INTERPRETER_POOL_WARM_KERNEL', True)
+    )
+
+def configure_llm_scheduler(app: Flask) -> None:
+    """
+    按配置设置进程内共享的 LLM 调度器的速率预算
+    
+    LLM_RATE_LIMITS 形如 {"default": {"rpm": 60, "tpm": 90000}, "gpt-4o": {"rpm": 500}}
+    
+    Args:
+        app: Flask应用实例
+    """
+    for model, limits in (app.config.get('LLM_RATE_LIMITS') or {}).items():
+        llm_scheduler.configure(model, rpm=limits.get('rpm'), tpm=limits.get('tpm'))
+        app.logger.info(f"LLM rate limit for {model}: rpm={limits.get('rpm')} tpm={limits.get('tpm')}")
+
+def create_llm_cache(app: Flask) -> Optional[Union[MemoryResponseCache, DiskResponseCache]]:
+    """
+    按 LLM_CACHE 创建 LLM 响应缓存，none 时返回 None
+    
+    Args:
+        app: Flask应用实例
+    """
+    backend = app.config.get('LLM_CACHE', 'none')
+    ttl = app.config.get('LLM_CACHE_TTL', 3600) or None
+    size = app.config.get('LLM_CACHE_SIZE', 256)
+    if backend == 'memory':
+        cache = MemoryResponseCache(max_entries=size, ttl=ttl)
+    elif backend == 'disk':
+        path = app.config.get('LLM_CACHE_DIR') or os.path.join(
+            platformdirs.user_config_dir("open-interpreter"), "llm_cache"
+        )
+        cache = DiskResponseCache(path, max_entries=size, ttl=ttl)
+    elif backend in ('none', '', None):
+        return None
+    else:
+        raise ConfigurationError(f"Unknown LLM_CACHE backend: {backend}")
+    app.logger.info(f"LLM response cache: {backend} (size={size}, ttl={ttl})")
+    return cache
+
 def setup_interpreter(app: Flask, interpreter_instance: Optional[Union[OpenInterpreter, 'interpreter']]) -> None:
     """
     配置解释器实例
@@ -121,6 +198,130 @@ def register_blueprints(app: Flask) -> None:
     app.register_blueprint(health_bp)
     app.register_blueprint(openai_bp)  # 启用 OpenAI 兼容接口
 
+def register_metrics(app: Flask) -> None:
+    """
+    记录每个请求的耗时并注册运行状态仪表
+    
+    Args:
+        app: Flask应用实例
+    """
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+    
+    @app.after_request
+    def record_latency(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        labels = (
+            request.method,
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            str(response.status_code)
+        )
+        # 在响应关闭时记录，流式响应也包含完整的发送时间
+        response.call_on_close(
+            lambda: REQUEST_LATENCY.observe(time.perf_counter() - started, *labels)
+        )
+        return response
+    
+    session_manager = app.session_manager
+    process = psutil.Process()
+    metrics.gauge('oi_active_instances', 'Interpreter instances bound to sessions',
+                  lambda: len(session_manager.interpreter_instances))
+    metrics.gauge('oi_pooled_instances', 'Pre-warmed idle interpreter instances',
+                  lambda: session_manager.pool.stats()['idle'])
+    metrics.gauge('oi_queued_chat_requests', 'Chat requests waiting for their session turn',
+                  lambda: session_manager.turn_queue.stats()['queued'])
+    metrics.gauge('oi_queued_llm_requests', 'LLM requests waiting in the shared scheduler',
+                  lambda: llm_scheduler.stats()['queue_depth'])
+    metrics.gauge('oi_resident_sessions', 'Sessions loaded in memory',
+                  lambda: len(session_manager.sessions.resident_items()))
+    metrics.gauge('oi_resident_memory_bytes', 'Resident memory of the server process',
+                  lambda: process.memory_info().rss)
+
+def register_request_timing(app: Flask) -> None:
+    """
+    为每个请求记录阶段时间线，通过 Server-Timing 响应头返回，并保留慢请求
+    
+    Args:
+        app: Flask应用实例
+    """
+    app.slow_requests = SlowRequestLog(
+        size=app.config.get('SLOW_REQUEST_LOG_SIZE', 100),
+        threshold=app.config.get('SLOW_REQUEST_THRESHOLD', 1.0)
+    )
+    
+    @app.before_request
+    def start_timeline():
+        g.timeline = RequestTimeline(request.method, request.path)
+    
+    @app.after_request
+    def add_server_timing(response):
+        timeline = g.get('timeline')
+        if timeline is None:
+            return response
+        # 流式响应只能包含响应头发出前的阶段，完整时间线记录在慢请求日志中
+        response.headers['Server-Timing'] = timeline.header()
+        response.call_on_close(lambda: app.slow_requests.record(timeline))
+        return response
+
+def register_rate_limits(app: Flask) -> None:
+    """
+    按客户端限流，并创建聊天接口使用的会话限流器和准入控制器
+    
+    Args:
+        app: Flask应用实例
+    """
+    app.rate_limiter = RateLimiter(app.config.get('RATE_LIMIT', 60))
+    app.session_rate_limiter = RateLimiter(app.config.get('SESSION_RATE_LIMIT', 10))
+    
+    session_manager = app.session_manager
+    app.admission = AdmissionController(
+        max_active_turns=app.config.get('ADMISSION_MAX_ACTIVE_TURNS', app.config.get('MAX_ACTIVE_INSTANCES', 3)),
+        max_llm_queue=app.config.get('ADMISSION_MAX_LLM_QUEUE', 0),
+        max_cpu_percent=app.config.get('ADMISSION_MAX_CPU_PERCENT', 0),
+        max_wait=app.config.get('ADMISSION_MAX_WAIT', 0),
+        active_turns=lambda: len(session_manager.turn_queue.held),
+        llm_queue_depth=lambda: llm_scheduler.stats()['queue_depth'],
+        retry_after=app.config.get('ADMISSION_RETRY_AFTER', 5)
+    )
+    # 对话结束时唤醒等待准入的请求（仅在 ADMISSION_MAX_WAIT > 0 时有请求等待）
+    session_manager.turn_queue.on_release = app.admission.notify
+    
+    # 健康检查和指标由监控系统频繁轮询，不参与限流
+    exempt_endpoints = {'health.health_check', 'health.metrics_endpoint'}
+    
+    @app.before_request
+    def limit_client():
+        if not app.rate_limiter.enabled or request.endpoint in exempt_endpoints:
+            return None
+        result = app.rate_limiter.check(request.remote_addr or 'unknown')
+        g.rate_limit = result
+        if result.allowed:
+            return None
+        app.logger.warning(f"Rate limit exceeded for client {request.remote_addr}")
+        retry_after = retry_after_header(result.retry_after)
+        return jsonify({
+            "error": {
+                "message": "请求过于频繁，请稍后再试",
+                "code": "rate_limited",
+                "details": {
+                    "limit": result.limit,
+                    "retry_after": int(retry_after)
+                }
+            }
+        }), 429, {'Retry-After': retry_after}
+    
+    @app.after_request
+    def add_rate_limit_headers(response):
+        result = g.get('rate_limit')
+        if result is not None:
+            response.headers['X-RateLimit-Limit'] = str(result.limit)
+            response.headers['X-RateLimit-Remaining'] = str(result.remaining)
+            response.headers['X-RateLimit-Reset'] = str(int(result.reset))
+        return response
+
 def register_error_handlers(app: Flask) -> None:
     """
     注册错误处理器
@@ -156,23 +357,45 @@ def create_app(config=None):
         log_level = app.config.get('LOG_LEVEL', 'INFO')
         app.logger = setup_logging(
             app_name="interpreter_server",
-            log_level=log_level
+            log_level=log_level,
+            queue_size=app.config.get('LOG_QUEUE_SIZE', 10000)
+        )
+        configure_payload_logging(
+            max_chars=app.config.get('LOG_PAYLOAD_MAX_CHARS', 2000),
+            sample_rate=app.config.get('LOG_PAYLOAD_SAMPLE_RATE', 0.1)
         )
         
         app.logger.info("Initializing application...")
         
-        # 4. 初始化会话管理器
+        # 4. 初始化 LLM 响应缓存（实例池中的实例在创建时引用它）和会话管理器
+        app.llm_cache = create_llm_cache(app)
         app.session_manager = SessionManager(
+            storage_path=app.config.get('SESSION_STORAGE_PATH') or None,
             max_active_instances=app.config.get('MAX_ACTIVE_INSTANCES', 3),
             session_timeout=app.config.get('INSTANCE_TIMEOUT', 3600),
-            cleanup_interval=app.config.get('CLEANUP_INTERVAL', 300)
+            cleanup_interval=app.config.get('CLEANUP_INTERVAL', 300),
+            compact_threshold=app.config.get('SESSION_COMPACT_THRESHOLD', 1000),
+            fsync_interval=app.config.get('SESSION_FSYNC_INTERVAL', 1.0),
+            flush_interval=app.config.get('SESSION_FLUSH_INTERVAL', 1.0),
+            max_resident_sessions=app.config.get('SESSION_CACHE_SIZE', 256),
+            pool=create_interpreter_pool(app),
+            queue_max_depth=app.config.get('SESSION_QUEUE_MAX_DEPTH', 8),
+            queue_max_wait=app.config.get('SESSION_QUEUE_MAX_WAIT', 120.0),
+            storage_backend=app.config.get('SESSION_STORAGE_BACKEND', 'journal'),
+            sqlite_path=app.config.get('SESSION_SQLITE_PATH') or None
         )
+        # 进程退出前写入所有延迟的会话修改
+        atexit.register(app.session_manager.close)
         
-        # 5. 设置解释器
+        # 5. 设置解释器及共享的 LLM 调度器
+        configure_llm_scheduler(app)
         setup_interpreter(app, None)
         
         # 6. 注册蓝图和错误处理
         register_blueprints(app)
+        register_metrics(app)
+        register_request_timing(app)
+        register_rate_limits(app)
         register_error_handlers(app)
         
         app.logger.info("Application initialization complete")
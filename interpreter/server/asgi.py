@@ -0,0 +1,210 @@
+"""
+ASGI entry point for Open Interpreter HTTP Server
+
+waitress 为每个请求占用一个线程直到响应结束，长时间的流式聊天会把固定大小的线程池
+占满。这里把 Flask 应用包装成 ASGI 应用：连接、请求体读取和响应发送都在事件循环中
+完成，只有调用 Flask 应用和生成下一个响应块时才占用有界线程池中的线程。等待客户端
+读取数据或排队等待线程的连接只占用套接字。
+
+用法::
+
+    uvicorn --factory interpreter.server.asgi:create_asgi_app
+"""
+
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from .log_config import logger
+
+# 迭代结束的哨兵值
+_END = object()
+
+
+class WSGIToASGI:
+    """在有界线程池中运行 WSGI 应用的 ASGI 适配器"""
+
+    def __init__(self, wsgi_app: Callable, max_workers: int = 32):
+        """
+        Args:
+            wsgi_app: Flask 应用
+            max_workers: 执行解释器工作的最大线程数
+        """
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-worker")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._handle_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1000})
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle_http(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        body = await self._read_body(receive)
+        if body is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        # 同一请求的所有调用共享一个上下文，stream_with_context 推入的请求上下文在
+        # 不同的工作线程之间保持有效
+        context = contextvars.copy_context()
+        response: Dict[str, Any] = {}
+        written: List[bytes] = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if exc_info and response.get("started"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+            ]
+            return written.append
+
+        def run(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        # 应用执行期间也监听断开，路由据此中止解释器的工作（见 disconnect.py）
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        environ = self._build_environ(scope, body)
+        environ["asgi.client_disconnected"] = disconnected.done
+        try:
+            iterable = await run(self.wsgi_app, environ, start_response)
+        except Exception as e:
+            logger.error(f"Error calling WSGI application: {str(e)}", exc_info=True)
+            disconnected.cancel()
+            await self._send_error(send)
+            return
+
+        try:
+            iterator = iter(iterable)
+            while True:
+                next_chunk = run(next, iterator, _END)
+                done, _ = await asyncio.wait(
+                    {next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_chunk not in done:
+                    # 正在生成的块无法中断，等它结束后关闭迭代器
+                    await asyncio.wait({next_chunk})
+                    next_chunk.exception()
+                    break
+                chunk = next_chunk.result()
+                if not response.get("started"):
+                    response["started"] = True
+                    await send({
+                        "type": "http.response.start",
+                        "status": response.get("status", 500),
+                        "headers": response.get("headers", []),
+                    })
+                data = b"".join(written) + (chunk if chunk is not _END else b"")
+                written.clear()
+                if chunk is _END:
+                    await send({"type": "http.response.body", "body": data, "more_body": False})
+                    break
+                if data:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+        except Exception as e:
+            logger.error(f"Error streaming WSGI response: {str(e)}", exc_info=True)
+            if not response.get("started"):
+                await self._send_error(send)
+        finally:
+            disconnected.cancel()
+            if hasattr(iterable, "close"):
+                try:
+                    await run(iterable.close)
+                except Exception as e:
+                    logger.error(f"Error closing WSGI response: {str(e)}")
+
+    async def _read_body(self, receive: Callable) -> Optional[bytes]:
+        """读取完整的请求体；客户端在此期间断开时返回 None"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    async def _wait_disconnect(self, receive: Callable) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def _send_error(self, send: Callable) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        })
+        await send({"type": "http.response.body", "body": b"Internal Server Error"})
+
+    def _build_environ(self, scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+        """根据 ASGI scope 构造 WSGI environ"""
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": unquote(scope["path"], errors="surrogateescape").encode("utf8", "surrogateescape").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1")
+            value = value.decode("latin1")
+            if name == "content-type":
+                key = "CONTENT_TYPE"
+            elif name == "content-length":
+                key = "CONTENT_LENGTH"
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+            if key in environ:
+                value = f"{environ[key]},{value}"
+            environ[key] = value
+        return environ
+
+
+def create_asgi_app(app=None, max_workers: Optional[int] = None) -> WSGIToASGI:
+    """
+    创建 ASGI 应用
+
+    Args:
+        app: 已创建的 Flask 应用，默认调用 create_app 创建
+        max_workers: 工作线程数，默认读取 ASGI_MAX_WORKERS 配置
+    """
+    if app is None:
+        from .app import create_app
+        app = create_app()
+    if max_workers is None:
+        max_workers = app.config.get('ASGI_MAX_WORKERS', 32)
+    logger.info(f"Serving application over ASGI with {max_workers} worker threads")
+    return WSGIToASGI(app, max_workers=max_workers)
@@ -18,7 +18,8 @@ from .log_config import setup_logging
               default='INFO',
               type=click.Choice(['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], case_sensitive=False),
               help='设置日志级别')
-def main(host, port, debug, log_level):
+@click.option('--asgi', is_flag=True, help='使用 uvicorn 以 ASGI 模式运行，流式连接不再独占线程')
+def main(host, port, debug, log_level, asgi):
     """启动 Open Interpreter HTTP Server"""
     logger = None
     try:
@@ -61,9 +62,16 @@ def main(host, port, debug, log_level):
             logger.info(f"  Port: {port}")
             logger.info(f"  Debug: {debug}")
             logger.info(f"  Log Level: {log_level}")
+            logger.info(f"  ASGI: {asgi}")
             
             try:
-                serve(app, host=host, port=port)
+                if asgi:
+                    import uvicorn
+                    from .asgi import create_asgi_app
+                    uvicorn.run(create_asgi_app(app), host=host, port=port, log_level=log_level.lower())
+                else:
+                    # channel_request_lookahead 让 waitress 在应用执行期间发现客户端断开
+                    serve(app, host=host, port=port, channel_request_lookahead=1)
             except Exception as e:
                 logger.error(f"Server failed to start: {str(e)}", exc_info=True)
                 raise
@@ -2,6 +2,7 @@
 服务器配置模块
 """
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -20,6 +21,9 @@ class Config:
         # 日志设置
         self.LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
         self.LOG_DIR = 'logs'
+        self.LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))                   # 日志队列长度，满时丢弃
+        self.LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))       # 请求/响应体日志的最大长度
+        self.LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))  # DEBUG 级别下记录请求/响应体的比例
         
         # 会话设置
         self.SESSION_DIR = 'sessions'
@@ -28,21 +32,51 @@ class Config:
         
         # 锁设置
         self.LOCK_TIMEOUT = 5  # 锁等待超时时间（秒）
+        self.SESSION_QUEUE_MAX_DEPTH = int(os.getenv("SESSION_QUEUE_MAX_DEPTH", "8"))       # 每个会话最多排队的请求数
+        self.SESSION_QUEUE_MAX_WAIT = float(os.getenv("SESSION_QUEUE_MAX_WAIT", "120"))    # 排队最长等待时间（秒）
         
         # LLM设置
         self.DEFAULT_MODEL = os.getenv('LITELLM_MODEL', 'gpt-3.5-turbo')
         self.CONTEXT_WINDOW = 10000
         self.MAX_TOKENS = int(os.getenv('MAX_TOKENS', 4096))
         self.TEMPERATURE = float(os.getenv('TEMPERATURE', 0.7))
+        self.LLM_RATE_LIMITS = json.loads(os.getenv('LLM_RATE_LIMITS', '{}'))  # 按模型的 rpm/tpm 预算，所有会话共享
+        self.LLM_CACHE = os.getenv('LLM_CACHE', 'none').lower()        # 确定性请求的响应缓存：none、memory 或 disk
+        self.LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '3600'))  # 缓存有效期（秒），0 表示不过期
+        self.LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '256'))   # 最多缓存的响应数
+        self.LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', '')             # disk 缓存目录，默认为系统配置目录下的 llm_cache
         
         # 速率限制
         self.RATE_LIMIT = int(os.getenv('RATE_LIMIT_PER_MINUTE', 60))
         self.SESSION_RATE_LIMIT = int(os.getenv('SESSION_RATE_LIMIT_PER_MINUTE', 10))
         
+        # 准入控制：资源饱和时拒绝新的对话，0 表示不检查
+        self.ADMISSION_MAX_ACTIVE_TURNS = int(os.getenv("ADMISSION_MAX_ACTIVE_TURNS", os.getenv("MAX_ACTIVE_INSTANCES", "3")))  # 同时进行的对话数
+        self.ADMISSION_MAX_LLM_QUEUE = int(os.getenv("ADMISSION_MAX_LLM_QUEUE", "0"))         # LLM 调度器中等待的请求数
+        self.ADMISSION_MAX_CPU_PERCENT = float(os.getenv("ADMISSION_MAX_CPU_PERCENT", "0"))   # CPU 使用率（百分比）
+        self.ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "0"))                # 饱和时最多等待多久再拒绝（秒），0 表示立即拒绝
+        self.ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))            # 拒绝时建议的重试间隔（秒）
+        
+        # 请求耗时
+        self.SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "1.0"))  # 慢请求阈值（秒）
+        self.SLOW_REQUEST_LOG_SIZE = int(os.getenv("SLOW_REQUEST_LOG_SIZE", "100"))      # 保留的慢请求数
+        
         # 实例管理配置
         self.MAX_ACTIVE_INSTANCES = int(os.getenv("MAX_ACTIVE_INSTANCES", "3"))
         self.INSTANCE_TIMEOUT = int(os.getenv("INSTANCE_TIMEOUT", "3600"))  # 1小时
         self.CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "300"))   # 5分钟
+        self.INTERPRETER_POOL_SIZE = int(os.getenv("INTERPRETER_POOL_SIZE", "2"))  # 预热的空闲实例数
+        self.INTERPRETER_POOL_WARM_KERNEL = os.getenv("INTERPRETER_POOL_WARM_KERNEL", "True").lower() == "true"
+        self.ASGI_MAX_WORKERS = int(os.getenv("ASGI_MAX_WORKERS", "32"))  # ASGI 模式下执行解释器工作的线程数
+        
+        # 会话持久化配置
+        self.SESSION_COMPACT_THRESHOLD = int(os.getenv("SESSION_COMPACT_THRESHOLD", "1000"))  # 追加多少条记录后压缩
+        self.SESSION_FSYNC_INTERVAL = float(os.getenv("SESSION_FSYNC_INTERVAL", "1.0"))       # fsync 合并间隔（秒）
+        self.SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "1.0"))       # 延迟写盘间隔（秒）
+        self.SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))                 # 常驻内存的会话数
+        self.SESSION_STORAGE_PATH = os.getenv("SESSION_STORAGE_PATH", "")                        # 默认为系统配置目录下的 conversations
+        self.SESSION_STORAGE_BACKEND = os.getenv("SESSION_STORAGE_BACKEND", "journal")           # journal 或 sqlite
+        self.SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "")                          # 默认为会话目录下的 sessions.db
     
     @classmethod
     def from_env(cls):
@@ -0,0 +1,173 @@
+"""
+Client disconnect detection for Open Interpreter HTTP Server
+
+客户端断开（丢弃流式连接或请求超时）后，解释器仍会继续调用 LLM、运行代码直到本轮
+结束，期间一直占用会话锁。这里按服务器类型探测客户端是否已断开：
+
+    waitress   environ["waitress.client_disconnected"]（需要 channel_request_lookahead > 0）
+    ASGI 模式   environ["asgi.client_disconnected"]（由 asgi.py 提供）
+    werkzeug   对 environ["werkzeug.socket"] 做非阻塞的 MSG_PEEK
+
+所有请求的探测由同一个后台线程（DisconnectMonitor）轮询，而不是每个请求一个线程；
+DisconnectWatcher 在请求期间登记到该线程，发现断开时调用一次回调。
+"""
+
+import select
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+from .log_config import logger
+
+CLIENT_DISCONNECTED_KEYS = ("waitress.client_disconnected", "asgi.client_disconnected")
+
+
+def client_disconnect_probe(environ: Dict[str, Any]) -> Optional[Callable[[], bool]]:
+    """
+    返回检查客户端是否已断开的函数；服务器不支持时返回 None
+
+    必须在请求上下文中调用，返回的函数可以在其他线程中使用
+    """
+    for key in CLIENT_DISCONNECTED_KEYS:
+        probe = environ.get(key)
+        if callable(probe):
+            return probe
+    sock = environ.get("werkzeug.socket")
+    if sock is not None:
+        return lambda: _socket_closed(sock)
+    return None
+
+
+def _socket_closed(sock: socket.socket) -> bool:
+    """对端已关闭连接时套接字可读且读到 EOF"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+class DisconnectMonitor:
+    """用一个后台线程轮询所有登记的 DisconnectWatcher，没有登记时线程空闲等待"""
+
+    def __init__(self, interval: float = 0.2):
+        """
+        Args:
+            interval: 轮询间隔（秒）
+        """
+        self.interval = interval
+        self._watchers: Set["DisconnectWatcher"] = set()
+        self._changed = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, watcher: "DisconnectWatcher") -> None:
+        with self._changed:
+            self._watchers.add(watcher)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="disconnect-monitor", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def remove(self, watcher: "DisconnectWatcher") -> None:
+        with self._changed:
+            self._watchers.discard(watcher)
+
+    def __len__(self) -> int:
+        return len(self._watchers)
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                while not self._watchers:
+                    self._changed.wait()
+                watchers = list(self._watchers)
+            for watcher in watchers:
+                if watcher.check():
+                    self.remove(watcher)
+                    # 回调（如终止正在运行的代码）可能较慢，不耽误其他请求的探测
+                    threading.Thread(target=watcher.fire, daemon=True).start()
+            time.sleep(self.interval)
+
+
+_monitor = DisconnectMonitor()
+
+
+class DisconnectWatcher:
+    """在代码块执行期间由共享的 DisconnectMonitor 探测客户端连接，断开时调用 on_disconnect"""
+
+    def __init__(
+        self,
+        probe: Optional[Callable[[], bool]],
+        on_disconnect: Callable[[], None],
+        monitor: Optional[DisconnectMonitor] = None,
+    ):
+        """
+        Args:
+            probe: client_disconnect_probe 的返回值，None 表示不检测
+            on_disconnect: 发现断开时在后台线程中调用一次
+            monitor: 负责轮询的 DisconnectMonitor，默认使用进程内共享的一个
+        """
+        self.probe = probe
+        self.on_disconnect = on_disconnect
+        self.monitor = monitor if monitor is not None else _monitor
+        self.disconnected = False
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def __enter__(self) -> "DisconnectWatcher":
+        if self.probe is not None:
+            self.monitor.add(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        # 等待进行中的回调结束，之后 disconnected 不再变化
+        self.monitor.remove(self)
+        with self._lock:
+            self._stopped = True
+
+    def check(self) -> bool:
+        """客户端是否已断开；探测出错时也视为不再需要探测"""
+        try:
+            return bool(self.probe())
+        except Exception as e:
+            logger.error(f"Error checking client connection: {str(e)}")
+            self.monitor.remove(self)
+            return False
+
+    def fire(self) -> None:
+        """请求仍在进行时标记断开并调用回调"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self.disconnected = True
+            try:
+                self.on_disconnect()
+            except Exception as e:
+                logger.error(f"Error handling client disconnect: {str(e)}")
+
+
+class TurnGuard:
+    """
+    一轮对话只能以一种方式结束：正常完成，或在客户端断开时被中止
+
+    断开回调可能在对话刚结束、轮询线程退出之前触发，这时已经完成的轮次不再被中止
+    """
+
+    def __init__(self, cancel: Callable[[], None]):
+        self._cancel = cancel
+        self._ended = threading.Lock()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """作为 DisconnectWatcher 的回调：本轮尚未结束时中止它"""
+        if self._ended.acquire(blocking=False):
+            self.cancelled = True
+            self._cancel()
+
+    def finish(self) -> bool:
+        """标记本轮正常结束；已被中止时返回 False"""
+        return self._ended.acquire(blocking=False)
@@ -0,0 +1,130 @@
+"""
+Deadline-based expiry scheduler for Open Interpreter HTTP Server
+
+会话和解释器实例的过期不依赖定期扫描全部会话：ExpiryScheduler 用按截止时间
+排序的最小堆记录每个会话的过期时间（数值时间戳），续期只需压入一条
+新记录（O(log n)），旧记录在弹出时按版本惰性丢弃；后台线程精确地睡到最早的截止
+时间，到期即处理。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .log_config import logger
+
+
+def to_timestamp(value: Any) -> float:
+    """把数值或 ISO 格式的时间统一转换为时间戳"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ExpiryScheduler:
+    """按截止时间触发回调的最小堆调度器"""
+
+    def __init__(self, on_expire: Callable[[str], None], compact_min: int = 1024):
+        """
+        Args:
+            on_expire: 到期时在调度线程中调用，参数为键
+            compact_min: 堆中过期记录超过此数量且多于有效记录时重建堆
+        """
+        self.on_expire = on_expire
+        self.compact_min = compact_min
+        self._heap: List[Tuple[float, int, str]] = []
+        self._deadlines: Dict[str, Tuple[float, int]] = {}  # 键 -> (截止时间, 版本)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, key: str, deadline: float) -> None:
+        """设置（或续期）键的截止时间"""
+        with self._condition:
+            entry = (deadline, next(self._sequence))
+            self._deadlines[key] = entry
+            heapq.heappush(self._heap, (entry[0], entry[1], key))
+            # 新的截止时间成为最早的一个时唤醒调度线程重新计时
+            if self._heap[0][2] == key and self._heap[0][1] == entry[1]:
+                self._condition.notify()
+            self._maybe_compact()
+
+    def schedule_many(self, items: Iterable[Tuple[str, float]]) -> None:
+        """批量设置截止时间（启动时使用，O(n) 建堆）"""
+        with self._condition:
+            for key, deadline in items:
+                entry = (deadline, next(self._sequence))
+                self._deadlines[key] = entry
+                self._heap.append((entry[0], entry[1], key))
+            heapq.heapify(self._heap)
+            self._condition.notify()
+
+    def cancel(self, key: str) -> None:
+        """取消键的截止时间（堆中的记录在弹出时丢弃）"""
+        with self._condition:
+            self._deadlines.pop(key, None)
+
+    def deadline_of(self, key: str) -> Optional[float]:
+        entry = self._deadlines.get(key)
+        return entry[0] if entry is not None else None
+
+    def pop_expired(self, now: Optional[float] = None) -> List[str]:
+        """取出所有已到期的键"""
+        now = time.time() if now is None else now
+        expired = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, sequence, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == (deadline, sequence):
+                    del self._deadlines[key]
+                    expired.append(key)
+        return expired
+
+    def start(self) -> None:
+        """启动调度线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+            # 回调在锁外执行，回调中可以再次 touch
+            for key in self.pop_expired():
+                try:
+                    self.on_expire(key)
+                except Exception as e:
+                    logger.error(f"Error expiring {key}: {str(e)}")
+
+    def _maybe_compact(self) -> None:
+        """频繁续期会在堆中留下大量过期记录，超过有效记录数时重建"""
+        stale = len(self._heap) - len(self._deadlines)
+        if stale > max(self.compact_min, len(self._deadlines)):
+            self._heap = [(deadline, sequence, key) for key, (deadline, sequence) in self._deadlines.items()]
+            heapq.heapify(self._heap)
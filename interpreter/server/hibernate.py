@@ -0,0 +1,156 @@
+"""
+Interpreter hibernation for Open Interpreter HTTP Server
+
+实例数达到上限时，被移出的解释器不再连同会话一起删除，而是把它的状态写成快照：
+消息、解释器与 LLM 设置，以及 Python 内核中可以 pickle 的全局变量。会话下次
+获取解释器时从快照透明恢复。
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+from .log_config import logger
+
+# 需要保存的解释器与 LLM 设置（不保存 api_key，避免把密钥写到磁盘）
+INTERPRETER_SETTINGS = [
+    "auto_run", "loop", "safe_mode", "os", "max_output", "custom_instructions",
+    "system_message", "conversation_filename",
+]
+LLM_SETTINGS = [
+    "model", "temperature", "context_window", "max_tokens", "api_base",
+    "api_version", "supports_vision", "supports_functions",
+]
+
+# 在内核中执行：逐个保存可 pickle 的用户变量以及已导入模块的别名
+# （避免出现 "computer" 一词，否则终端会先导入 computer API）
+SAVE_KERNEL_CODE = """
+def _oi_save_state(path):
+    import pickle, types
+    state = {{"variables": {{}}, "modules": {{}}}}
+    for name, value in list(globals().items()):
+        if name.startswith("_") or name in ("In", "Out", "get_ipython", "exit", "quit"):
+            continue
+        if isinstance(value, types.ModuleType):
+            state["modules"][name] = value.__name__
+            continue
+        # 内核中定义的函数和类按引用 pickle，恢复时无法加载
+        if isinstance(value, (types.FunctionType, type)) and value.__module__ == "__main__":
+            continue
+        if type(value).__module__.startswith("interpreter"):
+            continue
+        try:
+            state["variables"][name] = pickle.dumps(value)
+        except Exception:
+            pass
+    with open(path, "wb") as f:
+        pickle.dump(state, f)
+_oi_save_state({path!r})
+del _oi_save_state
+""".strip()
+
+RESTORE_KERNEL_CODE = """
+def _oi_restore_state(path):
+    import pickle, importlib
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    for name, module in state["modules"].items():
+        try:
+            globals()[name] = importlib.import_module(module)
+        except Exception:
+            pass
+    for name, value in state["variables"].items():
+        try:
+            globals()[name] = pickle.loads(value)
+        except Exception:
+            pass
+_oi_restore_state({path!r})
+del _oi_restore_state
+""".strip()
+
+
+class InterpreterHibernator:
+    """解释器状态快照的保存与恢复"""
+
+    def __init__(self, storage_path: Path):
+        self.storage_path = Path(storage_path) / "hibernated"
+
+    def _state_path(self, session_id: str) -> Path:
+        return self.storage_path / f"{session_id}.json"
+
+    def _kernel_path(self, session_id: str) -> Path:
+        return self.storage_path / f"{session_id}.kernel.pkl"
+
+    def exists(self, session_id: str) -> bool:
+        """会话是否有休眠快照"""
+        return self._state_path(session_id).exists()
+
+    def save(self, session_id: str, interpreter: Any) -> None:
+        """保存解释器状态"""
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        state: Dict[str, Any] = {
+            "messages": interpreter.messages,
+            "interpreter": {
+                name: getattr(interpreter, name)
+                for name in INTERPRETER_SETTINGS if hasattr(interpreter, name)
+            },
+            "llm": {
+                name: getattr(interpreter.llm, name)
+                for name in LLM_SETTINGS if hasattr(interpreter.llm, name)
+            },
+            "kernel": self._save_kernel(session_id, interpreter),
+        }
+        tmp_path = self._state_path(session_id).with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self._state_path(session_id))
+
+    def restore(self, session_id: str, interpreter: Any) -> bool:
+        """从快照恢复解释器状态，成功后删除快照"""
+        state_path = self._state_path(session_id)
+        if not state_path.exists():
+            return False
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        for name, value in state.get("interpreter", {}).items():
+            setattr(interpreter, name, value)
+        for name, value in state.get("llm", {}).items():
+            setattr(interpreter.llm, name, value)
+        interpreter.messages = state.get("messages", [])
+
+        if state.get("kernel"):
+            kernel_path = self._kernel_path(session_id)
+            try:
+                interpreter.computer.run(
+                    "python", RESTORE_KERNEL_CODE.format(path=str(kernel_path)), display=False
+                )
+            except Exception as e:
+                logger.warning(f"Failed to restore kernel variables for session {session_id}: {str(e)}")
+
+        self.delete(session_id)
+        return True
+
+    def delete(self, session_id: str) -> None:
+        """删除会话的休眠快照"""
+        for path in (self._state_path(session_id), self._kernel_path(session_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _save_kernel(self, session_id: str, interpreter: Any) -> bool:
+        """保存 Python 内核变量；内核未启动时跳过"""
+        active_languages = getattr(interpreter.computer.terminal, "_active_languages", {})
+        if "python" not in active_languages:
+            return False
+        kernel_path = self._kernel_path(session_id)
+        try:
+            interpreter.computer.run(
+                "python", SAVE_KERNEL_CODE.format(path=str(kernel_path)), display=False
+            )
+        except Exception as e:
+            logger.warning(f"Failed to save kernel variables for session {session_id}: {str(e)}")
+            return False
+        return kernel_path.exists()
@@ -0,0 +1,260 @@
+"""
+Append-only journal storage for Open Interpreter HTTP Server sessions
+
+每个会话对应一个 `<session_id>.jsonl` 文件，每行一条记录：
+
+    {"op": "snapshot", "session": {...}}   完整会话快照（创建或压缩时写入）
+    {"op": "message", "message": {...}}    追加一条消息
+    {"op": "update", "fields": {...}}      覆盖会话的顶层字段
+
+加载时按顺序重放记录即可得到会话的最新状态。追加的记录数超过快照大小后
+重新写入快照（压缩），因此每条消息的持久化成本不随会话长度增长。
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..core.utils.conversation_history import HISTORY_SUFFIX
+from .log_config import logger
+from .storage import SessionStore
+
+JOURNAL_SUFFIX = ".jsonl"
+
+
+class SessionJournal(SessionStore):
+    """基于追加写的会话存储"""
+
+    def __init__(
+        self,
+        storage_path: Path,
+        compact_threshold: int = 1000,
+        fsync_interval: float = 1.0,
+        fsync_batch: int = 64,
+        max_open_files: int = 64,
+    ):
+        """
+        Args:
+            storage_path: 会话文件所在目录
+            compact_threshold: 触发压缩所需的最少追加记录数
+            fsync_interval: 两次 fsync 之间的最长间隔（秒），0 表示每次写入都 fsync
+            fsync_batch: 累计多少次未同步写入后立即 fsync
+            max_open_files: 保持打开的日志文件句柄上限
+        """
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.compact_threshold = compact_threshold
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.max_open_files = max_open_files
+
+        self._lock = threading.RLock()
+        self._handles: "OrderedDict[str, Any]" = OrderedDict()
+        self._unsynced: Dict[str, int] = {}
+        self._last_sync = time.monotonic()
+        # 每个会话自上次快照以来追加的记录数，以及快照中的消息数
+        self._appended: Dict[str, int] = {}
+        self._snapshot_size: Dict[str, int] = {}
+
+    def path_for(self, session_id: str) -> Path:
+        """获取会话日志文件路径"""
+        return self.storage_path / f"{session_id}{JOURNAL_SUFFIX}"
+
+    def exists(self, session_id: str) -> bool:
+        """会话是否已有日志文件"""
+        return self.path_for(session_id).exists()
+
+    def append_many(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        """按顺序追加多条记录，一次写入（调用方保证日志文件已包含快照）"""
+        if not records:
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._lock:
+            f = self._get_handle(session_id)
+            f.write(lines)
+            f.flush()
+            self._appended[session_id] = self._appended.get(session_id, 0) + len(records)
+            self._unsynced[session_id] = self._unsynced.get(session_id, 0) + len(records)
+            self._maybe_sync()
+
+    def needs_compaction(self, session_id: str) -> bool:
+        """追加记录数超过阈值和快照大小时需要压缩，保证摊还写入成本恒定"""
+        appended = self._appended.get(session_id, 0)
+        return appended >= max(self.compact_threshold, self._snapshot_size.get(session_id, 0))
+
+    def compact(self, session_id: str, session: Dict[str, Any]) -> None:
+        """将会话完整状态写成新的快照，原子替换旧日志"""
+        path = self.path_for(session_id)
+        tmp_path = path.with_suffix(JOURNAL_SUFFIX + ".tmp")
+        line = json.dumps({"op": "snapshot", "session": session}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._close_handle(session_id)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._fsync_dir()
+            self._appended[session_id] = 0
+            self._snapshot_size[session_id] = len(session.get("messages") or [])
+            self._unsynced.pop(session_id, None)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """重放日志，返回会话的最新状态"""
+        path = self.path_for(session_id)
+        if not path.exists():
+            return None
+        with self._lock:
+            self._repair_tail(path)
+            session, appended, snapshot_size = self._replay(path)
+            if session is not None:
+                self._appended[session_id] = appended
+                self._snapshot_size[session_id] = snapshot_size
+        return session
+
+    def iter_session_ids(self) -> Iterator[str]:
+        """遍历所有存在日志文件的会话ID（命令行的 `.history.jsonl` 对话历史不是会话日志）"""
+        for path in self.storage_path.glob(f"*{JOURNAL_SUFFIX}"):
+            if not path.name.endswith(HISTORY_SUFFIX):
+                yield path.stem
+
+    def size_of(self, session_id: str) -> int:
+        try:
+            return self.path_for(session_id).stat().st_size
+        except OSError:
+            return 0
+
+    def open_index(self):
+        """存储目录下的摘要索引文件"""
+        from .session_index import SessionIndex
+        return SessionIndex(self.storage_path)
+
+    def delete(self, session_id: str) -> None:
+        """删除会话日志"""
+        with self._lock:
+            self._close_handle(session_id)
+            self._appended.pop(session_id, None)
+            self._snapshot_size.pop(session_id, None)
+            self._unsynced.pop(session_id, None)
+            path = self.path_for(session_id)
+            if path.exists():
+                path.unlink()
+
+    def sync(self) -> None:
+        """将所有未同步的写入刷到磁盘"""
+        with self._lock:
+            for session_id in list(self._unsynced):
+                f = self._handles.get(session_id)
+                if f is not None:
+                    try:
+                        os.fsync(f.fileno())
+                    except OSError as e:
+                        logger.error(f"Error syncing journal {session_id}: {str(e)}")
+            self._unsynced.clear()
+            self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """同步并关闭所有文件句柄"""
+        with self._lock:
+            self.sync()
+            for session_id in list(self._handles):
+                self._close_handle(session_id)
+
+    def _maybe_sync(self) -> None:
+        """按时间间隔或批量大小合并 fsync"""
+        pending = sum(self._unsynced.values())
+        if (
+            pending >= self.fsync_batch
+            or time.monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self.sync()
+
+    def _get_handle(self, session_id: str):
+        f = self._handles.get(session_id)
+        if f is not None:
+            self._handles.move_to_end(session_id)
+            return f
+        while len(self._handles) >= self.max_open_files:
+            oldest = next(iter(self._handles))
+            self._close_handle(oldest)
+        f = open(self.path_for(session_id), "a", encoding="utf-8")
+        self._handles[session_id] = f
+        return f
+
+    def _close_handle(self, session_id: str) -> None:
+        f = self._handles.pop(session_id, None)
+        if f is None:
+            return
+        try:
+            if self._unsynced.pop(session_id, None):
+                f.flush()
+                os.fsync(f.fileno())
+            f.close()
+        except OSError as e:
+            logger.error(f"Error closing journal {session_id}: {str(e)}")
+
+    def _fsync_dir(self) -> None:
+        """确保 rename 本身落盘（Windows 不支持目录 fsync）"""
+        if os.name != "posix":
+            return
+        try:
+            fd = os.open(self.storage_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _repair_tail(path: Path) -> None:
+        """截掉崩溃时未写完的最后一行，避免后续追加的记录与之粘连"""
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+            logger.warning(f"Truncated partial journal record in {path.name}")
+
+    @staticmethod
+    def _replay(path: Path) -> Tuple[Optional[Dict[str, Any]], int, int]:
+        """按顺序应用日志记录，跳过崩溃时写了一半的行"""
+        session = None
+        appended = 0
+        snapshot_size = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt journal record {path.name}:{lineno}")
+                    continue
+
+                op = record.get("op")
+                if op == "snapshot":
+                    session = record.get("session") or {}
+                    appended = 0
+                    snapshot_size = len(session.get("messages") or [])
+                    continue
+                if session is None:
+                    logger.warning(f"Journal record before snapshot in {path.name}:{lineno}")
+                    continue
+                if op == "message":
+                    session.setdefault("messages", []).append(record.get("message"))
+                elif op == "update":
+                    session.update(record.get("fields") or {})
+                appended += 1
+        return session, appended, snapshot_size
@@ -1,14 +1,22 @@
 """
 Logging configuration for Open Interpreter HTTP Server
+
+日志记录经由队列交给后台监听线程写文件和控制台，请求线程只负责入队；消息使用
+延迟格式化，请求和响应体按采样率记录，并截断其中的长字符串（如 base64 图片）和
+长列表（如完整的对话历史）。
 """
 
+import atexit
+import json
 import logging
 import os
+import queue
+import random
 import sys
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 class ServerFormatter(logging.Formatter):
     """自定义日志格式化器"""
@@ -32,15 +40,101 @@ class DailyRotatingFileHandler(RotatingFileHandler):
         backupCount = 5
         super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount)
 
+class NonBlockingQueueHandler(QueueHandler):
+    """只负责入队的处理器；队列满时丢弃记录而不是阻塞请求线程"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 不在请求线程中格式化，消息和异常堆栈由监听线程中的处理器格式化
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class TruncatedPayload:
+    """请求/响应体的延迟截断表示，只在日志真正输出时才序列化"""
+    def __init__(self, payload: Any, max_chars: int = 2000, max_items: int = 20):
+        self.payload = payload
+        self.max_chars = max_chars
+        self.max_items = max_items
+
+    def _truncate(self, value: Any, depth: int = 0) -> Any:
+        if isinstance(value, str):
+            limit = max(self.max_chars // 4, 64)
+            if len(value) > limit:
+                return f"{value[:limit]}...(+{len(value) - limit} chars)"
+            return value
+        if depth >= 6:
+            return "..."
+        if isinstance(value, dict):
+            return {key: self._truncate(item, depth + 1) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            items = [self._truncate(item, depth + 1) for item in value[-self.max_items:]]
+            if len(value) > self.max_items:
+                items.insert(0, f"...({len(value) - self.max_items} earlier items)")
+            return items
+        return value
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self._truncate(self.payload), ensure_ascii=False, default=str)
+        except Exception as e:
+            text = f"<unserializable payload: {str(e)}>"
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}...(+{len(text) - self.max_chars} chars)"
+        return text
+
 # 创建 logger
 logger = logging.getLogger('interpreter_server')
 
+# 各 logger 对应的后台监听线程
+_listeners: Dict[str, QueueListener] = {}
+
+# 请求/响应体的记录方式
+_payload_settings = {"max_chars": 2000, "sample_rate": 0.1}
+
+def configure_payload_logging(max_chars: int = 2000, sample_rate: float = 0.1) -> None:
+    """设置请求/响应体的截断长度和采样率"""
+    _payload_settings["max_chars"] = max_chars
+    _payload_settings["sample_rate"] = sample_rate
+
+def log_payload(label: str, payload: Any, target: Optional[logging.Logger] = None) -> None:
+    """在 DEBUG 级别按采样率记录截断后的请求/响应体"""
+    target = target or logger
+    if not target.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= _payload_settings["sample_rate"]:
+        return
+    target.debug("%s: %s", label, TruncatedPayload(payload, _payload_settings["max_chars"]))
+
+def shutdown_logging() -> None:
+    """停止所有监听线程，写完队列中剩余的日志"""
+    while _listeners:
+        _, listener = _listeners.popitem()
+        try:
+            listener.stop()
+        except Exception:
+            pass
+        for handler in listener.handlers:
+            try:
+                handler.close()
+            except Exception:
+                pass
+
+atexit.register(shutdown_logging)
+
 def setup_logging(
     app_name: str,
     log_level: str = 'INFO',
-    log_dir: Optional[str] = None
+    log_dir: Optional[str] = None,
+    queue_size: int = 10000
 ) -> logging.Logger:
-    """Configure enhanced logging with both file and rich console handlers"""
+    """Configure queue-backed logging with file and console handlers written by a listener thread"""
     global logger
     
     # 初始化处理器变量
@@ -56,6 +150,11 @@ def setup_logging(
         logger.setLevel(log_level_num)
         
         # Prevent duplicate handlers
+        previous = _listeners.pop(app_name, None)
+        if previous is not None:
+            previous.stop()
+            for handler in previous.handlers:
+                handler.close()
         if logger.hasHandlers():
             logger.handlers.clear()
         
@@ -79,10 +178,15 @@ def setup_logging(
         
         console_handler = ServerRichHandler(level=log_level_num)
         
-        # Add handlers
-        logger.addHandler(error_handler)
-        logger.addHandler(info_handler)
-        logger.addHandler(console_handler)
+        # 请求线程只入队，由监听线程写文件和控制台
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        listener = QueueListener(
+            log_queue, error_handler, info_handler, console_handler,
+            respect_handler_level=True
+        )
+        listener.start()
+        _listeners[app_name] = listener
+        logger.addHandler(NonBlockingQueueHandler(log_queue))
         
         return logger
         
@@ -98,27 +202,29 @@ def setup_logging(
 
 def log_request_info(request) -> None:
     """记录请求信息"""
-    logger.info(f"Request: {request.method} {request.url}")
-    logger.debug(f"Headers: {dict(request.headers)}")
-    # 只在非 GET 请求且内容类型为 JSON 时解析 JSON 数据
+    logger.info("Request: %s %s", request.method, request.url)
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Headers: %s", dict(request.headers))
+    # 只在非 GET 请求且内容类型为 JSON 时记录 JSON 数据
     if request.method != 'GET' and request.is_json:
-        try:
-            logger.debug(f"JSON Data: {request.get_json()}")
-        except Exception as e:
-            logger.warning(f"Failed to parse JSON data: {str(e)}")
+        log_payload("JSON Data", request.get_json(silent=True))
 
 def log_response_info(response) -> None:
     """记录响应信息"""
-    logger.info(f"Response Status: {response.status_code}")
-    logger.debug(f"Response Headers: {dict(response.headers)}")
-    if response.is_json:
-        try:
-            logger.debug(f"Response Data: {response.get_json()}")
-        except Exception as e:
-            logger.warning(f"Failed to parse response JSON data: {str(e)}")
+    logger.info("Response Status: %s", response.status_code)
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Response Headers: %s", dict(response.headers))
+    # 流式响应不能提前读取响应体
+    if response.is_json and not response.is_streamed:
+        log_payload("Response Data", response.get_json(silent=True))
 
 def log_error(error: Exception) -> None:
     """记录错误信息"""
     logger.error(str(error), exc_info=True)
 
-__all__ = ['logger', 'setup_logging', 'log_request_info', 'log_response_info', 'log_error']
\ No newline at end of file
+__all__ = [
+    'logger', 'setup_logging', 'shutdown_logging', 'configure_payload_logging',
+    'log_payload', 'log_request_info', 'log_response_info', 'log_error'
+]
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+In-process metrics for Open Interpreter HTTP Server
+
+轻量的直方图和仪表，在请求路径上只做一次二分查找和几次加法，通过 /v1/metrics
+以 Prometheus 文本格式导出。
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .timing import record_phase
+
+# 覆盖从毫秒级的写盘到分钟级的 LLM 调用
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """按标签分组的直方图"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """记录一个观测值；标签值按 labelnames 的顺序传入"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # 各个桶的计数、+Inf 桶计数、总和
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """记录代码块的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """各标签组合的观测次数和总和"""
+        with self._lock:
+            return {
+                labels: {"count": sum(series[:-1]), "sum": series[-1]}
+                for labels, series in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(series_items):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {series[-1]}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """导出时才通过回调读取当前值的仪表"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {float(self.callback())}")
+        except Exception:
+            # 数据源暂不可用时只输出说明
+            pass
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标注册表"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        """获取或创建直方图"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(name, documentation, labelnames, buckets)
+            return histogram
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        """注册仪表；同名仪表会被替换（例如重新创建应用时）"""
+        with self._lock:
+            gauge = self._gauges[name] = Gauge(name, documentation, callback)
+            return gauge
+
+    def get(self, name: str) -> Optional[Histogram]:
+        return self._histograms.get(name)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            collectors = list(self._histograms.values()) + list(self._gauges.values())
+        lines: List[str] = []
+        for collector in collectors:
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    "oi_http_request_duration_seconds", "HTTP request latency by route, including streamed bodies",
+    ("method", "route", "status")
+)
+LLM_FIRST_TOKEN = metrics.histogram(
+    "oi_llm_time_to_first_token_seconds", "Time from LLM request to first streamed chunk", ("model",)
+)
+LLM_TOTAL = metrics.histogram(
+    "oi_llm_request_duration_seconds", "Total LLM request time", ("model",)
+)
+CODE_EXECUTION = metrics.histogram(
+    "oi_code_execution_seconds", "Code execution time by language", ("language",)
+)
+SESSION_LOCK_WAIT = metrics.histogram(
+    "oi_session_lock_wait_seconds", "Time chat requests wait for their session turn"
+)
+PERSISTENCE_WRITE = metrics.histogram(
+    "oi_persistence_write_seconds", "Session persistence write time by operation", ("operation",)
+)
+
+
+def timed_llm_completions(completions: Callable) -> Callable:
+    """包装 llm.completions，记录首个响应块的延迟和总耗时"""
+    @functools.wraps(completions)
+    def wrapper(**params):
+        model = str(params.get("model", "unknown"))
+        started = time.perf_counter()
+        first = True
+        try:
+            for chunk in completions(**params):
+                if first:
+                    LLM_FIRST_TOKEN.observe(time.perf_counter() - started, model)
+                    first = False
+                yield chunk
+        finally:
+            elapsed = time.perf_counter() - started
+            LLM_TOTAL.observe(elapsed, model)
+            record_phase("llm", elapsed)
+    return wrapper
+
+
+def timed_code_runner(run: Callable) -> Callable:
+    """包装 computer.run，按语言记录代码执行时间"""
+    @functools.wraps(run)
+    def wrapper(language, code, *args, **kwargs):
+        if not kwargs.get("stream"):
+            started = time.perf_counter()
+            try:
+                return run(language, code, *args, **kwargs)
+            finally:
+                _observe_code(language, time.perf_counter() - started)
+
+        def stream():
+            started = time.perf_counter()
+            try:
+                yield from run(language, code, *args, **kwargs)
+            finally:
+                _observe_code(language, time.perf_counter() - started)
+        return stream()
+    return wrapper
+
+
+def _observe_code(language, seconds: float) -> None:
+    CODE_EXECUTION.observe(seconds, str(language))
+    record_phase("code", seconds)
@@ -0,0 +1,130 @@
+"""
+Pre-warmed interpreter instance pool for Open Interpreter HTTP Server
+
+构造 OpenInterpreter 需要创建全部 Computer 工具，首次运行 Python 还要启动 Jupyter
+内核，这些开销都落在新会话的第一次请求上。InterpreterPool 在后台线程中预先构造
+并预热实例，会话创建时直接取用，释放时回收。
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .log_config import logger
+
+# 代码中包含 "computer" 时，终端会在内核中预先导入 computer API
+WARMUP_CODE = "# warm up the kernel and the computer API\npass"
+
+
+class InterpreterPool:
+    """预热的解释器实例池"""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 2,
+        warm_kernel: bool = True,
+    ):
+        """
+        Args:
+            factory: 创建并配置好一个解释器实例的函数
+            size: 保持空闲的预热实例数量，0 表示不预热，每次按需创建
+            warm_kernel: 是否预先启动 Python 内核
+        """
+        self.factory = factory
+        self.size = max(0, size)
+        self.warm_kernel = warm_kernel
+
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._retired: "queue.Queue[Any]" = queue.Queue()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "recycled": 0}
+
+        self._worker = threading.Thread(target=self._maintain, daemon=True)
+        self._worker.start()
+        self._wakeup.set()
+
+    def acquire(self) -> Any:
+        """取出一个实例；池为空时在当前线程同步创建"""
+        try:
+            instance = self._idle.get_nowait()
+            self._count("hits")
+        except queue.Empty:
+            self._count("misses")
+            instance = self._create(warm=False)
+        self._wakeup.set()
+        return instance
+
+    def release(self, instance: Any) -> None:
+        """
+        归还实例：交给后台线程终止其语言内核，池中由新建的实例补充
+
+        绑定过会话的实例即使没有消息也可能带有会话专属的设置（请求指定的模型、
+        从休眠快照恢复的状态等），因此一律回收，不放回池中给下一个会话使用
+        """
+        if instance is None:
+            return
+        self._retired.put(instance)
+        self._count("recycled")
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, int]:
+        """池的命中率等指标"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+    def close(self) -> None:
+        """停止后台线程并终止所有空闲实例"""
+        self._stop.set()
+        self._wakeup.set()
+        while True:
+            try:
+                self._retired.put(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._drain_retired()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _create(self, warm: bool) -> Any:
+        instance = self.factory()
+        self._count("created")
+        if warm and self.warm_kernel:
+            try:
+                instance.computer.run("python", WARMUP_CODE, display=False)
+            except Exception as e:
+                logger.warning(f"Failed to warm up interpreter kernel: {str(e)}")
+        return instance
+
+    def _maintain(self) -> None:
+        """后台线程：终止回收的实例，并把空闲实例补充到 size 个"""
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._drain_retired()
+            while not self._stop.is_set() and self._idle.qsize() < self.size:
+                try:
+                    self._idle.put(self._create(warm=True))
+                except Exception as e:
+                    logger.error(f"Failed to pre-create interpreter instance: {str(e)}")
+                    # 避免创建持续失败时空转
+                    self._stop.wait(5)
+                    break
+
+    def _drain_retired(self) -> None:
+        while True:
+            try:
+                instance = self._retired.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                instance.computer.terminate()
+            except Exception as e:
+                logger.warning(f"Error terminating recycled interpreter: {str(e)}")
@@ -6,10 +6,11 @@
 import json
 import uuid
 import time
+import threading
 from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
 from ..message import Message, StreamingChunk
 from ..errors import ValidationError, format_error_response
-from ..log_config import log_error
+from ..log_config import log_error, log_payload
 from ..utils import (
     convert_interpreter_to_openai,
     convert_openai_to_interpreter,
@@ -17,15 +18,182 @@ from ..utils import (
     format_stream_chunk,
 )
 from ..message_processor import MessageProcessor
+from ..session_queue import SessionQueueFull
+from ..admission import retry_after_header
+from ..disconnect import DisconnectWatcher, TurnGuard, client_disconnect_probe
+from ..timing import current_timeline, phase
 
 bp = Blueprint('chat', __name__)
 
+def admit_chat_request(session_manager, session_id):
+    """
+    聊天请求的会话限流和准入控制
+    
+    Returns:
+        None 表示可以继续；被限流或服务器饱和时返回错误响应
+    """
+    result = current_app.session_rate_limiter.check(session_id)
+    if not result.allowed:
+        retry_after = retry_after_header(result.retry_after)
+        current_app.logger.warning(f"Session rate limit exceeded for session {session_id}")
+        return jsonify({
+            "error": {
+                "message": "该会话的请求过于频繁，请稍后再试",
+                "code": "session_rate_limited",
+                "details": {
+                    "limit": result.limit,
+                    "retry_after": int(retry_after),
+                    "session_id": session_id
+                }
+            }
+        }), 429, {'Retry-After': retry_after}
+    
+    # 会话已有实例或正在对话时排在会话自己的队列中，不会再占用新的实例
+    admission = current_app.admission
+    needs_instance = (
+        session_id not in session_manager.interpreter_instances
+        and session_id not in session_manager.turn_queue.held
+    )
+    reason = admission.admit(needs_instance)
+    if reason is not None:
+        current_app.logger.warning(f"Rejecting chat request for session {session_id}: {reason} saturated")
+        return jsonify({
+            "error": {
+                "message": "服务器繁忙，请稍后再试",
+                "code": "server_overloaded",
+                "details": {
+                    "retry_after": admission.retry_after,
+                    "saturated": reason,
+                    "session_id": session_id
+                }
+            }
+        }), 503, {'Retry-After': str(admission.retry_after)}
+    return None
+
+def wait_for_session_turn(session_manager, session_id):
+    """
+    排队等待会话的聊天轮次
+    
+    Returns:
+        (排队位置, None)；队列已满或等待超时时返回 (None, 错误响应)
+    """
+    retry_after = 5
+    try:
+        position = session_manager.wait_for_turn(session_id)
+    except SessionQueueFull as e:
+        current_app.logger.warning(f"Chat queue full for session {session_id} ({e.depth} waiting)")
+        return None, (jsonify({
+            "error": {
+                "message": "会话排队的请求过多，请稍后再试",
+                "code": "session_queue_full",
+                "details": {
+                    "retry_after": retry_after,
+                    "queue_depth": e.depth,
+                    "session_id": session_id
+                }
+            }
+        }), 429, {'Retry-After': str(retry_after)})
+    if position is None:
+        current_app.logger.warning(f"Chat request timed out waiting in queue for session {session_id}")
+        return None, (jsonify({
+            "error": {
+                "message": "会话正忙，请稍后再试",
+                "code": "session_busy",
+                "details": {
+                    "retry_after": retry_after,
+                    "status": "locked",
+                    "queue_depth": session_manager.turn_queue.queue_length(session_id),
+                    "session_id": session_id
+                }
+            }
+        }), 423, {'Retry-After': str(retry_after)})
+    return position, None
+
+def client_closed_response(session_id):
+    """客户端已断开，响应不会被读取，只用于记录日志和指标"""
+    return jsonify({
+        "error": {
+            "message": "客户端已断开连接，本轮对话已中止",
+            "code": "client_closed_request",
+            "details": {
+                "session_id": session_id
+            }
+        }
+    }), 499
+
+def _stream_chat_response(interpreter_instance, message_content, session_manager, session_id):
+    """
+    以 SSE 流式返回解释器产生的 LMC 消息块
+    
+    每个事件附带计时信息（距请求开始和距上一块的毫秒数）。会话锁在流结束、出错或
+    客户端断开时释放（call_on_close 保证即使生成器从未开始迭代也会释放）。解释器长时间
+    没有输出时（等待 LLM、运行代码）也会检测客户端是否断开，断开时立即中止本轮。
+    """
+    turn_start = len(interpreter_instance.messages)
+    probe = client_disconnect_probe(request.environ)
+    chunks = interpreter_instance.chat(message_content, stream=True, display=False)
+    started = time.monotonic()
+    release_once = threading.Lock()
+    # call_on_close 执行时应用上下文可能已经弹出
+    logger = current_app.logger
+    
+    def release_lock():
+        if release_once.acquire(blocking=False):
+            logger.info(f"Releasing session lock for session {session_id}")
+            session_manager.release_session_lock(session_id)
+    
+    def cancel_turn():
+        # 流已结束并释放了锁时不再中止
+        if release_once.acquire(blocking=False):
+            session_manager.cancel_turn(
+                session_id, interpreter_instance, turn_start,
+                {'role': 'user', 'type': 'message', 'content': message_content}
+            )
+    
+    def generate():
+        last = started
+        try:
+            with DisconnectWatcher(probe, cancel_turn):
+                for chunk in chunks:
+                    now = time.monotonic()
+                    event = dict(chunk)
+                    event["timing"] = {
+                        "elapsed_ms": round((now - started) * 1000, 1),
+                        "delta_ms": round((now - last) * 1000, 1)
+                    }
+                    last = now
+                    yield f"data: {json.dumps(event, default=str)}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            logger.error(f"Error in chat stream for session {session_id}: {str(e)}", exc_info=True)
+            error_event = {"role": "assistant", "type": "error", "content": str(e)}
+            yield f"data: {json.dumps(error_event)}\n\n"
+        finally:
+            # 客户端断开时关闭解释器的生成器，停止后续的 LLM 调用和代码执行
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            with phase("persist"):
+                session_manager.record_turn(session_id, interpreter_instance, turn_start)
+            release_lock()
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(release_lock)
+    return response
+
 @bp.route('/v1/chat', methods=['POST'])
 def chat():
     """Chat endpoint that handles both streaming and non-streaming responses"""
     # 初始化lock_acquired变量，确保在所有执行路径中都有定义
     lock_acquired = False
     session_id = None
+    stream = False
     
     try:
         data = request.get_json()
@@ -34,7 +202,7 @@ def chat():
         session_id = data.get('session_id')
         
         # 获取请求数据
-        current_app.logger.debug(f"Received request data: {data}")
+        log_payload("Received request data", data, current_app.logger)
         
         if data is None:
             current_app.logger.error("Invalid request: empty data")
@@ -64,41 +232,29 @@ def chat():
             session_id = session['session_id']
             current_app.logger.debug(f"Created new session: {session_id}")
         
-        # 尝试获取会话锁
-        if not session_manager.acquire_session_lock(session_id, timeout=5.0):
-            current_app.logger.warning(f"Chat request blocked by another ongoing request in session {session_id}")
-            return jsonify({
-                "error": {
-                    "message": "会话正忙，请稍后再试",
-                    "code": "session_busy",
-                    "details": {
-                        "retry_after": 5,
-                        "status": "locked",
-                        "session_id": session_id
-                    }
-                }
-            }), 423
+        # 会话限流，服务器饱和时拒绝新的对话
+        with phase("admission"):
+            rejected_response = admit_chat_request(session_manager, session_id)
+        if rejected_response is not None:
+            return rejected_response
+        
+        # 排队获取会话锁，前一轮结束时按到达顺序依次开始
+        with phase("queue"):
+            queue_position, busy_response = wait_for_session_turn(session_manager, session_id)
+        if busy_response is not None:
+            return busy_response
         
         # 标记锁已被获取
         lock_acquired = True
-        current_app.logger.info(f"Session lock acquired for session {session_id}")
+        current_app.logger.info(f"Session lock acquired for session {session_id} (queue position {queue_position})")
         
         current_app.logger.info(f"Processing chat request with {len(messages)} messages for session {session_id}")
         
-        # 加载会话消息
-        session_messages = session_manager.get_messages(session_id)
-        if session_messages:
-            current_app.logger.debug(f"Loaded {len(session_messages)} messages from session")
-            # 确保所有消息都是字典格式
-            session_messages = [msg.to_dict() if isinstance(msg, Message) else msg for msg in session_messages]
-            messages = [msg.to_dict() if isinstance(msg, Message) else msg for msg in messages]
-            messages = session_messages + messages
-        else:
-            # 如果没有历史消息，确保当前消息是字典格式
-            messages = [msg.to_dict() if isinstance(msg, Message) else msg for msg in messages]
+        messages = [msg.to_dict() if isinstance(msg, Message) else msg for msg in messages]
         
         # 获取interpreter实例
-        interpreter_instance = session_manager.get_interpreter(session_id)
+        with phase("interpreter"):
+            interpreter_instance = session_manager.get_interpreter(session_id)
         if not interpreter_instance:
             current_app.logger.error(f"No interpreter instance found for session {session_id}")
             return jsonify({
@@ -124,45 +280,60 @@ def chat():
         else:
             last_message_content = str(last_message)
             
-        # 设置历史消息
-        if len(messages) > 1:  # 如果有历史消息
-            interpreter_instance.messages = []  # 先清空
-            for msg in messages[:-1]:
-                if isinstance(msg, str):
-                    msg_dict = {
-                        'role': 'user',
-                        'type': 'message',
-                        'content': msg
-                    }
-                elif isinstance(msg, dict):
-                    msg_dict = msg
-                elif isinstance(msg, Message):
-                    msg_dict = msg.to_dict()
-                else:
-                    msg_dict = {
-                        'role': 'user',
-                        'type': 'message',
-                        'content': str(msg)
-                    }
-                interpreter_instance.messages.append(msg_dict)
+        # 只把会话中新增的消息同步到实例；客户端历史仅用于初始化空会话
+        history = [
+            msg if isinstance(msg, dict) else {'role': 'user', 'type': 'message', 'content': str(msg)}
+            for msg in messages[:-1]
+        ]
+        with phase("history"):
+            session_manager.sync_interpreter_messages(session_id, interpreter_instance, history)
         
         current_app.logger.debug("Starting chat with interpreter")
+        
+        if stream:
+            # 会话锁由流负责释放
+            response = _stream_chat_response(
+                interpreter_instance, last_message_content, session_manager, session_id
+            )
+            response.headers['X-Session-Queue-Position'] = str(queue_position)
+            lock_acquired = False
+            return response
+        
         # 记录当前消息数量，用于过滤历史消息
         current_message_count = len(interpreter_instance.messages)
         
-        response = interpreter_instance.chat(
-            last_message_content,
-            stream=False,  # 这里改为 False 以便收集所有消息
-            display=False
-        )
+        # 客户端断开（例如请求超时）时中止本轮，保存已有的消息并立即释放会话锁
+        guard = TurnGuard(lambda: session_manager.cancel_turn(
+            session_id, interpreter_instance, current_message_count,
+            {'role': 'user', 'type': 'message', 'content': last_message_content}
+        ))
+        try:
+            with DisconnectWatcher(client_disconnect_probe(request.environ), guard.cancel):
+                response = interpreter_instance.chat(
+                    last_message_content,
+                    stream=False,  # 这里改为 False 以便收集所有消息
+                    display=False
+                )
+        except Exception:
+            # 终止运行中的代码可能让对话抛出异常，已断开的客户端不需要它
+            if guard.finish():
+                raise
+        else:
+            guard.finish()
+        if guard.cancelled:
+            lock_acquired = False
+            # 会话锁已由 cancel_turn 释放，停下的实例交给实例池回收
+            session_manager.record_turn(session_id, interpreter_instance, current_message_count)
+            return client_closed_response(session_id)
+        
+        # 只处理本轮新生成并已记录的消息，跳过历史消息
+        with phase("persist"):
+            new_messages = session_manager.record_turn(session_id, interpreter_instance, current_message_count)
         
         response_messages = []
         # 用于收集代码和执行结果
         code_messages = []
         
-        # 只处理新生成的消息，跳过历史消息
-        new_messages = interpreter_instance.messages[current_message_count:]
-        
         # 遍历生成的所有消息
         for msg in new_messages:
             if msg["role"] in ["assistant", "computer"]:
@@ -203,20 +374,27 @@ def chat():
             }
         }
         
+        # 按需在响应体中附带各阶段耗时
+        timeline = current_timeline()
+        if data.get('timings') and timeline is not None:
+            chat_response["timings"] = timeline.to_dict()
+        
         current_app.logger.debug(f"Returning chat response with {len(code_messages)} code messages and {len(response_messages)} text messages")
-        return jsonify(chat_response)
+        return jsonify(chat_response), 200, {'X-Session-Queue-Position': str(queue_position)}
         
     except Exception as e:
         # 确保在发生异常时也释放锁
         if lock_acquired and session_id:
             current_app.logger.info(f"Releasing session lock for session {session_id} due to exception")
             session_manager.release_session_lock(session_id)
+            # 避免 finally 再次释放时把已移交给下一个请求的轮次释放掉
+            lock_acquired = False
         current_app.logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
         log_error(e)
         error_response, status_code = format_error_response(e)
         return jsonify(error_response), status_code
     finally:
-        # 确保在流式响应结束时释放锁
-        if not stream and lock_acquired and session_id:
+        # 流式响应的锁已交给响应本身释放
+        if lock_acquired and session_id:
             current_app.logger.info(f"Releasing session lock for session {session_id}")
             session_manager.release_session_lock(session_id)
@@ -2,10 +2,12 @@
 健康检查路由模块
 """
 
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, Response
 from ..log_config import log_error
 from ..errors import format_error_response
 from ..utils import get_system_info, format_size
+from ..metrics import metrics
+from interpreter.core.llm.scheduler import scheduler as llm_scheduler
 
 bp = Blueprint('health', __name__)
 
@@ -83,6 +85,19 @@ def health_check():
                     "max": max_count,
                     "active": active_count
                 }
+                pool = getattr(current_app.session_manager, 'pool', None)
+                if pool is not None:
+                    response["instances"]["pool"] = pool.stats()
+                turn_queue = getattr(current_app.session_manager, 'turn_queue', None)
+                if turn_queue is not None:
+                    response["instances"]["queue"] = turn_queue.stats()
+                response["instances"]["llm_scheduler"] = llm_scheduler.stats()
+                llm_cache = getattr(current_app, 'llm_cache', None)
+                if llm_cache is not None:
+                    response["instances"]["llm_cache"] = llm_cache.stats()
+                admission = getattr(current_app, 'admission', None)
+                if admission is not None:
+                    response["instances"]["admission"] = admission.stats()
             except:
                 response["instances"] = {
                     "status": "unavailable"
@@ -105,4 +120,20 @@ def health_check():
     except Exception as e:
         log_error(e)
         error_response, status_code = format_error_response(e)
-        return jsonify(error_response), status_code
\ No newline at end of file
+        return jsonify(error_response), status_code
+
+@bp.route('/v1/metrics', methods=['GET'])
+def metrics_endpoint():
+    """以 Prometheus 文本格式导出运行指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/v1/debug/slow-requests', methods=['GET'])
+def slow_requests():
+    """最近超过阈值的慢请求及其阶段耗时，按耗时降序"""
+    limit = request.args.get('limit', type=int)
+    slow_log = getattr(current_app, 'slow_requests', None)
+    entries = slow_log.entries(limit) if slow_log is not None else []
+    return jsonify({
+        "threshold_ms": slow_log.threshold * 1000 if slow_log is not None else None,
+        "requests": entries
+    })
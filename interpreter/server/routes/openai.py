@@ -1,8 +1,14 @@
 """OpenAI兼容接口路由处理"""
-from flask import Blueprint, request, jsonify, Response, current_app
-from ..message import Message
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
+from ..message import Message, StreamingChunk
 from ..errors import ValidationError, format_error_response
+from ..log_config import log_error
+from ..message_processor import MessageProcessor
 from ..utils import convert_openai_to_interpreter, format_openai_stream_chunk
+from ..timing import current_timeline, phase
+from ..disconnect import DisconnectWatcher, TurnGuard, client_disconnect_probe
+from .chat import admit_chat_request, client_closed_response, wait_for_session_turn
+import threading
 import uuid
 import time
 
@@ -26,6 +32,9 @@ def chat_completions():
     """
     if not request.is_json:
         raise ValidationError("Content-Type must be application/json")
+    
+    lock_acquired = False
+    session_id = None
         
     try:
         data = request.get_json()
@@ -46,8 +55,21 @@ def chat_completions():
             session = session_manager.create_session()
             session_id = session['session_id']
         
+        with phase("admission"):
+            rejected_response = admit_chat_request(session_manager, session_id)
+        if rejected_response is not None:
+            return rejected_response
+        
+        # 与 /v1/chat 共用会话的轮次队列，同一实例上不会并发对话
+        with phase("queue"):
+            queue_position, busy_response = wait_for_session_turn(session_manager, session_id)
+        if busy_response is not None:
+            return busy_response
+        lock_acquired = True
+        
         # 获取interpreter实例
-        interpreter_instance = session_manager.get_interpreter(session_id)
+        with phase("interpreter"):
+            interpreter_instance = session_manager.get_interpreter(session_id)
         if not interpreter_instance:
             current_app.logger.error(f"No interpreter instance found for session {session_id}")
             return jsonify({
@@ -67,37 +89,63 @@ def chat_completions():
         current_app.logger.info(f"Processing chat completions request with {len(messages)} messages for session {session_id}")
         interpreter_instance.auto_run = True
 
-        # 加载会话消息
-        session_messages = session_manager.get_messages(session_id)
-        if session_messages:
-            if isinstance(session_messages, dict):
-                session_messages = [session_messages]
-            elif not isinstance(session_messages, list):
-                session_messages = []
-            messages = session_messages + (messages if isinstance(messages, list) else [messages])
-        
-        # 转换消息格式并发送请求
+        # 转换消息格式；OpenAI 客户端每次发送完整历史，会话已有消息时只追加增量
         interpreter_messages = convert_openai_to_interpreter(messages)
-        interpreter_instance.messages = [msg.to_dict() for msg in interpreter_messages[:-1]]  # 加载历史消息
-        response = interpreter_instance.chat(interpreter_messages[-1].content, stream=stream)
+        with phase("history"):
+            session_manager.sync_interpreter_messages(
+                session_id, interpreter_instance, [msg.to_dict() for msg in interpreter_messages[:-1]]
+            )
+        turn_start = len(interpreter_instance.messages)
+        probe = client_disconnect_probe(request.environ)
+        user_message = {'role': 'user', 'type': 'message', 'content': interpreter_messages[-1].content}
         
         if not stream:
-            result = MessageProcessor.process_response(response, session_manager, session_id)
-            return jsonify(result)
+            # 客户端断开（例如请求超时）时中止本轮，保存已有的消息并立即释放会话锁
+            guard = TurnGuard(lambda: session_manager.cancel_turn(
+                session_id, interpreter_instance, turn_start, user_message
+            ))
+            try:
+                with DisconnectWatcher(probe, guard.cancel):
+                    response = interpreter_instance.chat(interpreter_messages[-1].content, stream=False)
+            except Exception:
+                # 终止运行中的代码可能让对话抛出异常，已断开的客户端不需要它
+                if guard.finish():
+                    raise
+            else:
+                guard.finish()
+            if guard.cancelled:
+                lock_acquired = False
+                # 会话锁已由 cancel_turn 释放，停下的实例交给实例池回收
+                session_manager.record_turn(session_id, interpreter_instance, turn_start)
+                return client_closed_response(session_id)
+            
+            with phase("persist"):
+                session_manager.record_turn(session_id, interpreter_instance, turn_start)
+            result = MessageProcessor.process_response(response)
+            timeline = current_timeline()
+            if data.get('timings') and timeline is not None:
+                result["timings"] = timeline.to_dict()
+            return jsonify(result), 200, {'X-Session-Queue-Position': str(queue_position)}
+        
+        response = interpreter_instance.chat(interpreter_messages[-1].content, stream=True)
+        release_once = threading.Lock()
+        def release_lock():
+            if release_once.acquire(blocking=False):
+                session_manager.release_session_lock(session_id)
+        
+        def cancel_turn():
+            # 流已结束并释放了锁时不再中止
+            if release_once.acquire(blocking=False):
+                session_manager.cancel_turn(session_id, interpreter_instance, turn_start, user_message)
         
         def generate_stream():
             """生成OpenAI格式的流式响应"""
             try:
-                for chunk in response:
-                    chunk = StreamingChunk.from_dict(chunk)
-                    if chunk.type == 'message':
-                        session_manager.add_message(session_id, Message(
-                            role=chunk.role,
-                            type=chunk.type,
-                            content=chunk.content,
-                            format=chunk.format
-                        ).to_dict())
-                    yield format_openai_stream_chunk(chunk)
+                # 解释器长时间没有输出时也检测客户端是否断开
+                with DisconnectWatcher(probe, cancel_turn):
+                    for chunk in response:
+                        chunk = StreamingChunk.from_dict(chunk)
+                        yield format_openai_stream_chunk(chunk)
             except Exception as e:
                 current_app.logger.error(f"Error in stream generation: {str(e)}", exc_info=True)
                 error_chunk = StreamingChunk(
@@ -107,18 +155,35 @@ def chat_completions():
                     recipient='user'
                 )
                 yield format_openai_stream_chunk(error_chunk)
+            finally:
+                # 流结束后一次性写入本轮的完整消息，而不是逐块保存
+                with phase("persist"):
+                    session_manager.record_turn(session_id, interpreter_instance, turn_start)
+                release_lock()
         
-        return Response(
+        stream_response = Response(
             stream_with_context(generate_stream()),
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
+                'X-Accel-Buffering': 'no',
+                'X-Session-Queue-Position': str(queue_position)
             }
         )
+        # 生成器从未开始迭代（客户端提前断开）时也要释放会话锁
+        stream_response.call_on_close(release_lock)
+        lock_acquired = False
+        return stream_response
             
     except Exception as e:
+        if lock_acquired:
+            session_manager.release_session_lock(session_id)
+            lock_acquired = False
         current_app.logger.error(f"Error processing chat completions request: {str(e)}", exc_info=True)
         log_error(e)
         error_response, status_code = format_error_response(e)
-        return jsonify(error_response), status_code 
\ No newline at end of file
+        return jsonify(error_response), status_code
+    finally:
+        # 流式响应的锁已交给响应本身释放
+        if lock_acquired:
+            session_manager.release_session_lock(session_id) 
\ No newline at end of file
@@ -7,9 +7,51 @@ from flask import Blueprint, jsonify, request, current_app
 from ..errors import ValidationError, format_error_response
 from ..models import SessionCreate, SessionMetadata, Session
 from ..log_config import log_request_info, log_response_info, logger  # 导入 logger
+from ..storage import message_cursor, session_cursor
 
 bp = Blueprint('session', __name__)
 
+# 会话列表默认只返回摘要字段，需要其他字段时通过 fields= 指定
+SUMMARY_FIELDS = ("session_id", "created_at", "last_active", "message_count", "metadata")
+MAX_PAGE_SIZE = 1000
+
+def _page_limit(default: int) -> int:
+    """解析 limit 参数"""
+    limit = request.args.get('limit', default)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValidationError("limit must be an integer")
+    if limit < 1:
+        raise ValidationError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def _paginated(*params) -> bool:
+    """请求是否带有分页参数；不带时返回完整列表，与分页之前的响应一致"""
+    return any(param in request.args for param in ('limit', 'after', 'before') + params)
+
+def _requested_fields():
+    """解析 fields 参数（逗号分隔），未指定时返回 None"""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return tuple(field.strip() for field in fields.split(',') if field.strip())
+
+def _project(item, fields):
+    """只保留指定的字段"""
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+def _page_response(key, items, has_more, first_cursor=None, last_cursor=None):
+    """分页响应：next_cursor 用于 after=，prev_cursor 用于 before="""
+    return {
+        key: items,
+        "has_more": has_more,
+        "next_cursor": last_cursor,
+        "prev_cursor": first_cursor
+    }
+
 @bp.before_request
 def log_request():
     """记录请求信息"""
@@ -24,10 +66,39 @@ def log_response(response):
 # 基础会话管理路由
 @bp.route('/v1/sessions', methods=['GET'])
 def list_sessions():
-    """获取会话列表"""
+    """
+    获取会话列表
+    
+    不带分页参数时返回全部会话及 total（可用 fields 只取部分字段）；
+    分页查询参数：limit、after/before（上一页返回的游标）、fields（逗号分隔，默认只返回摘要）
+    """
     try:
-        sessions = current_app.session_manager.list_sessions()
-        return jsonify({"sessions": sessions, "total": len(sessions)})
+        session_manager = current_app.session_manager
+        if not _paginated():
+            fields = _requested_fields()
+            if fields is not None:
+                fields = ('session_id',) + tuple(f for f in fields if f != 'session_id')
+            sessions = [_project(session, fields) for session in session_manager.list_sessions()]
+            return jsonify({"sessions": sessions, "total": len(sessions)})
+        summaries, has_more = session_manager.list_sessions_page(
+            _page_limit(50),
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+        fields = _requested_fields() or SUMMARY_FIELDS
+        sessions = []
+        for summary in summaries:
+            item = summary
+            if any(field not in summary for field in fields):
+                # 请求了摘要之外的字段（如 messages）才加载完整会话
+                item = session_manager.sessions.get(summary['session_id']) or summary
+            sessions.append(_project(item, ('session_id',) + tuple(f for f in fields if f != 'session_id')))
+        # 游标基于摘要计算，与返回的字段无关
+        return jsonify(_page_response(
+            "sessions", sessions, has_more,
+            session_cursor(summaries[0]) if summaries else None,
+            session_cursor(summaries[-1]) if summaries else None
+        ))
     except Exception as e:
         logger.error("Failed to list sessions", exc_info=True)
         error_response, status_code = format_error_response(e)
@@ -83,7 +154,7 @@ def manage_session(session_id):
             elif isinstance(session['metadata'], dict) and 'metadata' in session['metadata']:
                 session['metadata'] = session['metadata']['metadata']
                 
-            return jsonify(session)
+            return jsonify(_project(session, _requested_fields()))
             
         elif request.method == 'PATCH':
             data = request.get_json()
@@ -106,21 +177,55 @@ def manage_session(session_id):
 # 会话消息管理路由
 @bp.route('/v1/sessions/<session_id>/messages', methods=['GET', 'POST', 'DELETE'])
 def manage_messages(session_id):
-    """管理会话消息"""
+    """
+    管理会话消息
+    
+    GET 查询参数：limit、after/before（游标）、since（消息ID，只返回其后的新消息）、fields；
+    不带 limit、after、before、since 时返回完整的消息历史
+    """
     try:
+        if request.method == 'GET' and not _paginated('since'):
+            messages = current_app.session_manager.get_messages(session_id)
+            if messages is None:
+                logger.debug(f"Session not found when accessing messages: {session_id}")
+                return jsonify({"error": "Session not found"}), 404
+            fields = _requested_fields()
+            return jsonify({
+                "messages": [_project(message, fields) for message in messages],
+                "last_message_id": messages[-1].get('id') if messages else None
+            })
+
+        if request.method == 'GET':
+            # 分页读取，不加载整个会话
+            since = request.args.get('since')
+            page = current_app.session_manager.get_messages_page(
+                session_id,
+                _page_limit(100),
+                after=request.args.get('after'),
+                before=request.args.get('before'),
+                since=since
+            )
+            if page is None:
+                logger.debug(f"Session not found when accessing messages: {session_id}")
+                return jsonify({"error": "Session not found"}), 404
+            messages, has_more = page
+            fields = _requested_fields()
+            response = _page_response(
+                "messages", [_project(message, fields) for message in messages], has_more,
+                message_cursor(messages[0]) if messages else None,
+                message_cursor(messages[-1]) if messages else None
+            )
+            # 轮询时下次用 since=last_message_id
+            response["last_message_id"] = messages[-1].get('id') if messages else since
+            return jsonify(response)
+        
         # 首先检查会话是否存在
         session = current_app.session_manager.get_session(session_id)
         if not session:
             logger.debug(f"Session not found when accessing messages: {session_id}")
             return jsonify({"error": "Session not found"}), 404
             
-        if request.method == 'GET':
-            messages = current_app.session_manager.get_messages(session_id)
-            if messages is None:
-                messages = []
-            return jsonify({"messages": messages})
-            
-        elif request.method == 'POST':
+        if request.method == 'POST':
             message = request.get_json()
             success = current_app.session_manager.add_message(session_id, message)
             return jsonify({"success": success})
@@ -14,10 +14,20 @@ import platformdirs
 import os
 import time
 import threading
+import weakref
 
 # 只导入需要的类，避免循环依赖
+from ..core.utils.conversation_history import HISTORY_SUFFIX, load_conversation
 from .log_config import setup_logging
 from .models import MessageBase, Session
+from .errors import ValidationError
+from .storage import create_session_store, decode_cursor
+from .session_index import LazySessionDict, summarize_session
+from .pool import InterpreterPool
+from .hibernate import InterpreterHibernator
+from .session_queue import SessionTurnQueue, SessionQueueFull
+from .expiry import ExpiryScheduler, to_timestamp
+from .metrics import PERSISTENCE_WRITE, SESSION_LOCK_WAIT
 
 # 获取logger实例
 logger = setup_logging('interpreter_server')
@@ -27,6 +37,9 @@ MessageType = Literal["message", "code", "image", "console", "file", "confirmati
 MessageFormat = Literal["output", "path", "base64.png", "base64.jpeg", "python", "javascript", "shell", "html", "active_line", "execution"]
 MessageRecipient = Literal["user", "assistant"]
 
+# 只在服务端存储中使用、不传给解释器的消息字段
+SERVER_MESSAGE_FIELDS = ("id", "seq", "created_at")
+
 def get_storage_path(subdirectory=None):
     """Get the storage path for Open Interpreter"""
     config_dir = platformdirs.user_config_dir("open-interpreter")
@@ -202,7 +215,16 @@ class SessionManager:
                  storage_path: str = None, 
                  session_timeout: int = 3600,
                  cleanup_interval: int = 300,
-                 max_active_instances: int = 3):
+                 max_active_instances: int = 3,
+                 compact_threshold: int = 1000,
+                 fsync_interval: float = 1.0,
+                 flush_interval: float = 1.0,
+                 max_resident_sessions: int = 256,
+                 pool: Optional[InterpreterPool] = None,
+                 queue_max_depth: int = 8,
+                 queue_max_wait: float = 120.0,
+                 storage_backend: str = "journal",
+                 sqlite_path: Optional[str] = None):
         # 使用 platformdirs 获取系统配置目录
         if storage_path is None:
             storage_path = platformdirs.user_config_dir("open-interpreter")
@@ -210,54 +232,195 @@ class SessionManager:
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
-        self.sessions: Dict[str, Dict] = {}
+        # 会话存储后端：默认为追加写日志，sqlite 后端可由多个进程共享
+        self.store = create_session_store(
+            storage_backend,
+            self.storage_path,
+            compact_threshold=compact_threshold,
+            fsync_interval=fsync_interval,
+            sqlite_path=sqlite_path
+        )
+        
         self.session_timeout = session_timeout
+        # 保留以兼容旧配置：过期由调度器按截止时间精确触发，不再定期扫描
         self.cleanup_interval = cleanup_interval
-        self.session_locks: Dict[str, threading.Lock] = {}
+        self.session_locks: Dict[str, threading.RLock] = {}  # 保护单个会话的消息列表与同步计数
         self.interpreter_instances: Dict[str, Any] = {}
-        self._chat_locks: Dict[str, threading.Lock] = {}  # 专用于聊天操作的锁
         self.max_active_instances = max_active_instances
         self.instance_last_used = {}  # 记录实例最后使用时间
+        self._synced_counts: Dict[str, int] = {}  # 实例中已包含的会话消息数量
+        self._cancelled = weakref.WeakSet()  # 客户端断开后被中止、已从会话摘下的实例
+        self._hibernating: Dict[str, threading.Event] = {}  # 已摘下、正在写休眠快照的会话
+        self._restoring: Dict[str, threading.Event] = {}  # 已占位、正在创建或从快照恢复实例的会话
+        
+        # 解释器实例池；未提供时按需同步创建
+        self.pool = pool if pool is not None else InterpreterPool(self._build_interpreter, size=0)
         
-        self._active_locks = set()
-        self._lock_timeout = 30  # 30秒锁超时
+        # 超出实例上限时休眠最久未用的实例，而不是删除其会话
+        self.hibernator = InterpreterHibernator(self.storage_path)
+        
+        # 聊天轮次按会话排队，上一轮结束时直接交给下一个请求
+        self.turn_queue = SessionTurnQueue(max_depth=queue_max_depth)
+        self.queue_max_wait = queue_max_wait
+        self._active_locks = self.turn_queue.held
         
         # 确保所有锁都被正确初始化
-        self._instances_lock = threading.Lock()
+        # create_session 持有该锁时会经由 optimize_interpreter_instances 再次获取，必须可重入
+        self._instances_lock = threading.RLock()
         self._sessions_lock = threading.Lock()
         self.lock = threading.Lock()
         
-        # 启动清理线程
-        self.cleanup_thread = threading.Thread(target=self._cleanup_expired_sessions, daemon=True)
-        self.cleanup_thread.start()
+        # 会话映射：启动时只加载摘要索引，消息内容按需加载并按 LRU 移出内存
+        self.session_index = self.store.open_index()
+        self.sessions = LazySessionDict(
+            self.session_index,
+            loader=self._read_session,
+            max_resident=max_resident_sessions,
+            size_of=self._session_file_size,
+            is_pinned=self._is_session_pinned,
+            is_stale=self.store.is_stale
+        )
+        
+        # 延迟写入：只在内存中记录变更，由后台线程合并写盘
+        self.flush_interval = flush_interval
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._dirty_lock = threading.Lock()
+        self._flusher_stop = threading.Event()
+        
+        # 会话过期调度：按截止时间排序的最小堆，活动时续期
+        self.expiry = ExpiryScheduler(self._expire_session)
+        
+        # 启动写盘线程
+        self.flusher_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher_thread.start()
         
         # 加载持久化的会话
         self._load_persisted_sessions()
+        
+        # 索引加载完成后启动过期调度线程
+        self.expiry.start()
 
     def _get_session_file_path(self, session_id: str) -> Path:
-        """获取会话文件路径"""
+        """获取旧格式（整文件JSON）会话文件路径"""
         return self.storage_path / f"{session_id}.json"
 
+    def _get_history_file_path(self, session_id: str) -> Path:
+        """获取命令行对话历史文件（`.history.jsonl`）路径"""
+        return self.storage_path / f"{session_id}{HISTORY_SUFFIX}"
+
     def _save_session_messages(self, session_id: str, messages: List[Dict]) -> None:
         """保存会话消息到文件"""
-        try:
-            file_path = self._get_session_file_path(session_id)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"Error saving session {session_id}: {str(e)}")
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        session['messages'] = messages
+        self._journal_update(session_id, session, {'messages': messages})
 
     def _load_session_messages(self, session_id: str) -> List[Dict]:
         """从文件加载会话消息"""
+        session = self._read_session(session_id)
+        if session:
+            return session.get('messages', [])
+        return []
+
+    def _journal_message(self, session_id: str, session: Dict, message: Dict) -> None:
+        """将一条新消息追加到会话日志"""
+        self._journal_records(session_id, session, [{"op": "message", "message": message}])
+
+    def _journal_update(self, session_id: str, session: Dict, fields: Dict) -> None:
+        """将会话字段更新追加到会话日志"""
+        self._journal_records(session_id, session, [{"op": "update", "fields": fields}])
+
+    def _journal_records(self, session_id: str, session: Dict, records: List[Dict]) -> None:
+        """
+        追加日志记录（记录对应的修改必须已经应用到内存中的 session）
+        没有日志（旧格式会话）或日志过长时直接改写为快照
+        """
         try:
-            file_path = self._get_session_file_path(session_id)
-            if file_path.exists():
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    messages = json.load(f)
-                    return messages if isinstance(messages, list) else []
+            if not self.store.exists(session_id):
+                self._persist_session(session_id, session)
+                return
+            with PERSISTENCE_WRITE.time("append"):
+                self.store.append_many(session_id, records)
+            if self.store.needs_compaction(session_id):
+                self._persist_session(session_id, session)
         except Exception as e:
-            logger.error(f"Error loading session {session_id}: {str(e)}")
-        return []
+            logger.error(f"Error journaling session {session_id}: {str(e)}")
+        finally:
+            self.sessions.mark_changed(session_id)
+
+    def _read_session(self, session_id: str) -> Optional[Dict]:
+        """从磁盘读取完整会话（日志优先，其次是旧格式文件）"""
+        try:
+            session = self.store.load(session_id)
+            if session is not None:
+                return session
+            session_file = self._get_session_file_path(session_id)
+            if session_file.exists():
+                return self._load_legacy_session(session_file)
+            history_file = self._get_history_file_path(session_id)
+            if history_file.exists():
+                return self._load_history_session(session_id, history_file)
+        except Exception as e:
+            logger.error(f"Error reading session {session_id}: {str(e)}")
+        return None
+
+    def _load_history_session(self, session_id: str, history_file: Path) -> Optional[Dict]:
+        """将命令行保存的对话历史作为会话导入"""
+        messages = load_conversation(str(history_file))
+        if messages is None:
+            return None
+        return {
+            'session_id': session_id,
+            'created_at': datetime.now().isoformat(),
+            'messages': messages,
+            'last_active': time.time(),
+            'metadata': {}
+        }
+
+    def _load_legacy_session(self, session_file: Path) -> Optional[Dict]:
+        """读取旧格式（整文件JSON）的会话"""
+        with open(session_file, 'r', encoding='utf-8') as f:
+            session_data = json.load(f)
+            
+        # 处理旧格式的会话文件（直接是消息列表）
+        if isinstance(session_data, list):
+            return {
+                'session_id': session_file.stem,
+                'created_at': datetime.now().isoformat(),
+                'messages': session_data,
+                'last_active': time.time(),
+                'metadata': {}
+            }
+        if isinstance(session_data, dict):
+            session_data.setdefault('session_id', session_file.stem)
+            if isinstance(session_data.get('last_active'), str):
+                session_data['last_active'] = to_timestamp(session_data['last_active'])
+            return session_data
+        return None
+
+    def _session_file_size(self, session_id: str) -> int:
+        """会话在磁盘上占用的字节数"""
+        size = self.store.size_of(session_id)
+        if size:
+            return size
+        for path in (self._get_session_file_path(session_id), self._get_history_file_path(session_id)):
+            try:
+                return path.stat().st_size
+            except OSError:
+                continue
+        return 0
+
+    def _message_lock(self, session_id: str) -> threading.RLock:
+        """会话消息锁：追加消息与更新实例同步计数必须一起完成"""
+        lock = self.session_locks.get(session_id)
+        if lock is None:
+            lock = self.session_locks.setdefault(session_id, threading.RLock())
+        return lock
+
+    def _is_session_pinned(self, session_id: str) -> bool:
+        """正在使用的会话不从内存中移出，避免持有旧引用的请求与新加载的副本分叉"""
+        return session_id in self.interpreter_instances or session_id in self._active_locks
 
     def add_message(self, session_id: str, message: Dict[str, Any]) -> bool:
         """添加消息到会话并持久化存储"""
@@ -275,19 +438,88 @@ class SessionManager:
                 "created_at": datetime.now().isoformat()
             }
 
-            # 更新会话消息
-            if 'messages' not in session:
-                session['messages'] = []
-            session['messages'].append(msg_data)
-            session['last_active'] = time.time()
+            with self._message_lock(session_id):
+                # 更新会话消息
+                if 'messages' not in session:
+                    session['messages'] = []
+                session['messages'].append(self._stamp_message(session, msg_data))
+                session['last_active'] = time.time()
 
-            # 持久化保存
-            self._persist_session(session_id, session)
+                # 持久化保存（只追加这一条消息）
+                self._journal_message(session_id, session, msg_data)
             return True
         except Exception as e:
             logger.error(f"Error adding message to session {session_id}: {str(e)}")
             return False
 
+    @staticmethod
+    def _stamp_message(session: Dict, message: Dict) -> Dict:
+        """为即将追加的消息分配 id 和序号（序号即消息在会话中的位置）"""
+        message['seq'] = len(session['messages'])
+        message.setdefault('id', f"msg_{uuid.uuid4().hex}")
+        return message
+
+    @staticmethod
+    def _to_lmc(message: Dict) -> Dict:
+        """去掉服务端字段，得到解释器使用的 LMC 消息"""
+        return {k: v for k, v in message.items() if k not in SERVER_MESSAGE_FIELDS and v is not None}
+
+    def sync_interpreter_messages(self, session_id: str, interpreter: Any, history: Optional[List[Dict]] = None) -> None:
+        """
+        把实例中尚未包含的会话消息追加到 interpreter.messages，只处理增量
+
+        会话还没有任何消息时，用客户端提供的历史初始化会话；此后以服务端存储的
+        历史为准，客户端重复发送的历史会被忽略。
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            return
+        with self._message_lock(session_id):
+            messages = session.setdefault('messages', [])
+            if history and not messages:
+                self.merge_messages(session_id, history)
+            synced = self._synced_counts.get(session_id, 0)
+            if synced > len(messages):
+                # 会话消息被整体替换过，重新加载
+                interpreter.messages = []
+                synced = 0
+            for message in messages[synced:]:
+                interpreter.messages.append(self._to_lmc(message))
+            self._synced_counts[session_id] = len(messages)
+
+    def record_turn(self, session_id: str, interpreter: Any, start: int) -> List[Dict[str, Any]]:
+        """
+        把本轮对话中实例新增的消息（interpreter.messages[start:]）写入会话
+        被 cancel_turn 中止的轮次已在中止时保存，这里只把停下的实例交给实例池回收
+
+        Returns:
+            本轮记录的消息；之后 interpreter.messages 可能被替换为会话中的消息，
+            响应应使用这里返回的列表
+        """
+        if interpreter in self._cancelled:
+            self._cancelled.discard(interpreter)
+            if getattr(interpreter, 'stop_event', None) is not None:
+                interpreter.stop_event.clear()
+            self.pool.release(interpreter)
+            return []
+        new_messages = [dict(message) for message in interpreter.messages[start:]]
+        if not new_messages:
+            return new_messages
+        try:
+            session = self.get_session(session_id)
+            if session is None:
+                raise ValueError("Session not found")
+            with self._message_lock(session_id):
+                # 本轮进行期间有消息被直接添加到会话时，实例中的顺序与会话不再一致
+                interleaved = len(session.get('messages', [])) != self._synced_counts.get(session_id, 0)
+                self.merge_messages(session_id, new_messages)
+                if interleaved:
+                    interpreter.messages = [self._to_lmc(message) for message in session['messages']]
+                self._synced_counts[session_id] = len(session['messages'])
+        except Exception as e:
+            logger.error(f"Error recording turn for session {session_id}: {str(e)}")
+        return new_messages
+
     def get_messages(self, session_id: str) -> Optional[List[Dict]]:
         """获取会话的消息列表"""
         try:
@@ -301,112 +533,189 @@ class SessionManager:
             logger.error(f"Error getting messages for session {session_id}: {str(e)}", exc_info=True)
             return None
 
-    def _cleanup_expired_sessions(self):
-        """优化清理过期会话的逻辑"""
-        while True:
+    def _mark_dirty(self, session_id: str, fields: Dict[str, Any]) -> None:
+        """记录待写盘的字段，同一会话的多次修改在下次刷新时合并为一条记录"""
+        with self._dirty_lock:
+            self._dirty.setdefault(session_id, {}).update(fields)
+
+    def _flush_loop(self):
+        """后台写盘线程：按 flush_interval 周期刷新脏会话"""
+        while not self._flusher_stop.wait(self.flush_interval):
             try:
-                # 获取需要清理的会话列表
-                to_cleanup = []
-                # 确保_instances_lock存在
-                if not hasattr(self, '_instances_lock'):
-                    self._instances_lock = threading.Lock()
-                    
-                with self._instances_lock:
-                    current_time = time.time()
-                    expired_sessions = [
-                        session_id
-                        for session_id, last_used in self.instance_last_used.items()
-                        if current_time - last_used > self.session_timeout
-                    ]
-                    to_cleanup.extend(expired_sessions)
-                
-                # 在锁外执行清理
-                for session_id in to_cleanup:
-                    self._cleanup_instance(session_id)
-                    
-                time.sleep(self.cleanup_interval)
+                self.flush()
             except Exception as e:
-                logger.error(f"Error in cleanup thread: {str(e)}")
-                time.sleep(self.cleanup_interval)
+                logger.error(f"Error in flusher thread: {str(e)}")
+
+    def flush(self) -> None:
+        """将所有延迟的会话修改写入日志并刷盘（关闭服务前调用）"""
+        with self._dirty_lock:
+            pending, self._dirty = self._dirty, {}
+        for session_id, fields in pending.items():
+            if session_id not in self.sessions:
+                continue  # 会话已被删除
+            session = self.sessions.peek(session_id)
+            if session is not None:
+                self._journal_update(session_id, session, fields)
+            elif self.store.exists(session_id):
+                # 已移出内存的会话直接追加记录，无需重新加载
+                self.store.append(session_id, {"op": "update", "fields": fields})
+                self.sessions.touch_summary(session_id, fields)
+        with PERSISTENCE_WRITE.time("sync"):
+            self.sessions.flush_index()
+            self.store.sync()
+
+    def close(self) -> None:
+        """停止写盘线程并刷新所有待写数据"""
+        self._flusher_stop.set()
+        self.expiry.stop()
+        self.flush()
+        self.session_index.close()
+        self.store.close()
+        self.pool.close()
+
+    def _touch(self, session_id: str, now: Optional[float] = None) -> None:
+        """会话有活动时顺延过期时间"""
+        self.expiry.touch(session_id, (time.time() if now is None else now) + self.session_timeout)
+
+    def _expire_session(self, session_id: str) -> bool:
+        """
+        调度器回调：会话到期时释放实例并删除会话
+
+        Returns:
+            会话是否被删除（仍在使用或已被续期时只顺延过期时间）
+        """
+        try:
+            # 进行中的聊天轮次不打断，从现在起重新计时
+            if session_id in self._active_locks:
+                self._touch(session_id)
+                return False
+            # 截止时间只在 get_session 等入口续期，以会话和实例的实际活动时间为准
+            # （sqlite 后端下会话也可能被其他进程续期）
+            last_active = max(
+                to_timestamp(self._last_active_of(session_id)),
+                self.instance_last_used.get(session_id, 0)
+            )
+            deadline = last_active + self.session_timeout
+            if deadline > time.time():
+                self.expiry.touch(session_id, deadline)
+                return False
+            logger.info(f"Session expired: {session_id}")
+            if session_id in self.interpreter_instances:
+                self._cleanup_instance(session_id)
+            else:
+                with self.lock:
+                    self._remove_session(session_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error expiring session {session_id}: {str(e)}")
+            return False
 
     def _load_persisted_sessions(self):
-        """加载持久化的会话数据"""
+        """
+        加载持久化的会话索引
+        只校对索引与磁盘上的会话文件名，不读取消息内容；索引缺失的会话（首次启动、
+        旧格式文件或索引损坏）才读取一次并补充摘要
+        """
         try:
-            for session_file in self.storage_path.glob("*.json"):
+            on_disk = {path.stem for path in self.storage_path.glob("*.json")}
+            on_disk.update(
+                path.name[:-len(HISTORY_SUFFIX)]
+                for path in self.storage_path.glob(f"*{HISTORY_SUFFIX}")
+            )
+            on_disk.update(self.store.iter_session_ids())
+
+            # 丢弃文件已不存在的索引项
+            for session_id in list(self.session_index.entries):
+                if session_id not in on_disk:
+                    self.session_index.remove(session_id)
+
+            for session_id in on_disk - set(self.session_index.entries):
                 try:
-                    with open(session_file, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                        
-                    # 处理旧格式的会话文件（直接是消息列表）
-                    if isinstance(session_data, list):
-                        session_id = session_file.stem
-                        session = {
-                            'session_id': session_id,
-                            'created_at': datetime.now().isoformat(),
-                            'messages': session_data,
-                            'last_active': time.time(),
-                            'metadata': {}
-                        }
-                        self.sessions[session_id] = session
-                    else:
-                        # 新格式的会话文件
-                        session_id = session_data.get('session_id') or session_file.stem
-                        if self._is_session_valid(session_data.get('last_active', time.time())):
-                            self.sessions[session_id] = session_data
-                            
+                    session = self._read_session(session_id)
+                    if session:
+                        if not self.store.exists(session_id):
+                            # 旧格式的会话文件迁移到当前的存储后端
+                            self._persist_session(session_id, session)
+                        self.session_index.put(
+                            summarize_session(session, self._session_file_size(session_id))
+                        )
                 except Exception as e:
-                    logger.error(f"Error loading session file {session_file}: {str(e)}")
+                    logger.error(f"Error indexing session {session_id}: {str(e)}")
                     continue
-                    
+
+            # 按索引中的最后活动时间安排过期
+            self.expiry.schedule_many(
+                (session_id, to_timestamp(summary.get('last_active')) + self.session_timeout)
+                for session_id, summary in self.session_index.entries.items()
+            )
+
+            logger.info(f"Indexed {len(self.session_index.entries)} persisted sessions")
         except Exception as e:
             logger.error(f"Error loading persisted sessions: {str(e)}")
 
     def _is_session_valid(self, last_active) -> bool:
         """检查会话是否有效"""
-        try:
-            if isinstance(last_active, str):
-                last_active = datetime.fromisoformat(last_active).timestamp()
-            return (time.time() - float(last_active)) < self.session_timeout
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error validating session timestamp: {str(e)}")
+        return (time.time() - to_timestamp(last_active)) < self.session_timeout
+
+    def _is_session_expired(self, session_id: str) -> bool:
+        """
+        检查会话是否已过期
+        调度器中的截止时间未到即有效；否则按实际的最后活动时间确认（可能已被
+        其他进程续期），仍有效时重新安排过期
+        """
+        deadline = self.expiry.deadline_of(session_id)
+        if deadline is not None and deadline > time.time():
             return False
+        last_active = to_timestamp(self._last_active_of(session_id))
+        if not self._is_session_valid(last_active):
+            return True
+        self.expiry.touch(session_id, last_active + self.session_timeout)
+        return False
 
     def cleanup_expired_sessions(self):
-        """清理过期会话"""
-        with self.lock:
-            current_time = time.time()
-            expired_sessions = [
-                session_id for session_id, session in self.sessions.items()
-                if not self._is_session_valid(session.get('last_active', 0))
-            ]
-            
-            for session_id in expired_sessions:
-                self._remove_session(session_id)
-                
-            return len(expired_sessions)
+        """立即处理所有已到期的会话（通常由调度线程自动完成）"""
+        expired_sessions = self.expiry.pop_expired()
+        return sum(1 for session_id in expired_sessions if self._expire_session(session_id))
+
+    def _last_active_of(self, session_id: str):
+        """会话最后活动时间（优先使用内存中的最新值）"""
+        session = self.sessions.peek(session_id)
+        if session is None:
+            session = self.sessions.summary(session_id) or {}
+        return session.get('last_active', 0)
 
     def _remove_session(self, session_id: str):
         """删除会话及其持久化文件"""
         try:
+            self.expiry.cancel(session_id)
             self.sessions.pop(session_id, None)
-            session_file = self.storage_path / f"{session_id}.json"
-            if session_file.exists():
-                session_file.unlink()
+            self._synced_counts.pop(session_id, None)
+            self.session_locks.pop(session_id, None)
+            self._delete_session_files(session_id)
         except Exception as e:
             logger.error(f"Error removing session {session_id}: {str(e)}")
 
+    def _delete_session_files(self, session_id: str) -> None:
+        """删除会话日志、旧格式的会话文件、导入的对话历史以及休眠快照"""
+        self.store.delete(session_id)
+        self.hibernator.delete(session_id)
+        for session_file in (self._get_session_file_path(session_id), self._get_history_file_path(session_id)):
+            if session_file.exists():
+                session_file.unlink()
+
     def save_all_sessions(self):
-        """保存所有活动会话"""
+        """保存所有活动会话（压缩为快照）并刷盘"""
         with self.lock:
-            for session_id, session_data in self.sessions.items():
+            # 未在内存中的会话在移出前已全部写入日志
+            for session_id, session_data in self.sessions.resident_items():
                 self._persist_session(session_id, session_data)
+        self.store.sync()
 
     def _persist_session(self, session_id: str, session_data: Dict):
-        """持久化单个会话"""
+        """将单个会话完整写成日志快照"""
         try:
-            session_file = self.storage_path / f"{session_id}.json"
-            with open(session_file, 'w') as f:
-                json.dump(session_data, f)
+            with PERSISTENCE_WRITE.time("compact"):
+                self.store.compact(session_id, session_data)
         except Exception as e:
             logger.error(f"Error persisting session {session_id}: {str(e)}")
 
@@ -427,15 +736,19 @@ class SessionManager:
         }
         
         try:
-            # 创建解释器实例
-            from interpreter import OpenInterpreter
-            interpreter_instance = OpenInterpreter()
-            interpreter_instance.conversation_history = True
-            self.interpreter_instances[session_id] = interpreter_instance
+            # 从实例池取出解释器实例，必要时先休眠最久未用的实例
+            interpreter_instance = self.pool.acquire()
+            with self._instances_lock:
+                detached = self.optimize_interpreter_instances(session_id)
+                self.interpreter_instances[session_id] = interpreter_instance
+                self.instance_last_used[session_id] = time.time()
+                self._synced_counts[session_id] = 0
+            self._hibernate_instances(detached)
+            self._touch(session_id, session['last_active'])
             
             # 保存会话数据
             self.sessions[session_id] = session
-            self.session_locks[session_id] = threading.Lock()
+            self.session_locks[session_id] = threading.RLock()
             self._persist_session(session_id, session)
             
             logger.info(f"Created new session: {session_id}")
@@ -448,21 +761,19 @@ class SessionManager:
     def get_session(self, session_id: str) -> Optional[Dict]:
         """获取会话信息（无锁快速路径）"""
         try:
+            # 过期会话直接根据索引摘要判断，不必加载消息内容
+            if session_id in self.sessions and self._is_session_expired(session_id):
+                logger.debug(f"Session expired: {session_id}")
+                return None
             session = self.sessions.get(session_id)
-            if session and self._is_session_valid(session.get('last_active', 0)):
-                # 异步更新最后活动时间
-                def update_last_active():
-                    session['last_active'] = time.time()
-                    self._persist_session(session_id, session)
-                threading.Thread(target=update_last_active, daemon=True).start()
+            if session:
+                # 只更新内存，由写盘线程合并持久化
+                session['last_active'] = time.time()
+                self._touch(session_id, session['last_active'])
+                self._mark_dirty(session_id, {'last_active': session['last_active']})
                 return session
             
-            # 如果会话不存在或已过期，记录日志并返回 None
-            if not session:
-                logger.debug(f"Session not found: {session_id}")
-            elif not self._is_session_valid(session.get('last_active', 0)):
-                logger.debug(f"Session expired: {session_id}")
-            
+            logger.debug(f"Session not found: {session_id}")
             return None
         except Exception as e:
             # 记录详细错误信息，但仍然返回 None 而不是抛出异常
@@ -475,26 +786,139 @@ class SessionManager:
         if session:
             session.update(updates)
             session['last_active'] = time.time()
-            self._persist_session(session_id, session)
+            self._journal_update(session_id, session, {**updates, 'last_active': session['last_active']})
             return session
         return None
 
     def list_sessions(self) -> List[Dict]:
         """列出所有有效会话（快速路径）"""
         try:
-            # 快速拷贝会话列表，避免长时间持有锁
+            # 先用索引摘要过滤，只加载有效会话
             with self._sessions_lock:
-                sessions = list(self.sessions.values())
+                session_ids = [
+                    summary['session_id'] for summary in self.sessions.summaries()
+                    if not self._is_session_expired(summary['session_id'])
+                ]
             
-            # 在锁外部处理过滤
-            return [
-                session for session in sessions
-                if self._is_session_valid(session.get('last_active', 0))
-            ]
+            sessions = []
+            for session_id in session_ids:
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    sessions.append(session)
+            return sessions
         except Exception as e:
             logger.error(f"Error listing sessions: {str(e)}")
             return []
 
+    def list_sessions_page(self, limit: int = 50, after: Optional[str] = None,
+                           before: Optional[str] = None) -> Tuple[List[Dict], bool]:
+        """
+        分页列出有效会话的摘要（按创建时间从新到旧），不加载消息内容
+        
+        Args:
+            limit: 每页数量
+            after: 返回该游标之后（更早创建）的会话
+            before: 返回该游标之前（更晚创建）的会话
+        
+        Returns:
+            (会话摘要列表, 该方向上是否还有更多)
+        
+        Raises:
+            ValidationError: 游标无效
+        """
+        try:
+            summaries, has_more = self.session_index.page(
+                limit, after=after, before=before, active_since=time.time() - self.session_timeout
+            )
+            # 内存中的会话比索引摘要新（摘要由写盘线程延迟刷新）
+            for i, summary in enumerate(summaries):
+                session = self.sessions.peek(summary['session_id'])
+                if session is not None:
+                    summaries[i] = {
+                        **summary,
+                        'last_active': session.get('last_active', summary.get('last_active')),
+                        'message_count': len(session.get('messages') or []),
+                        'metadata': session.get('metadata') or {}
+                    }
+            return summaries, has_more
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except Exception as e:
+            logger.error(f"Error listing sessions: {str(e)}")
+            return [], False
+
+    def get_messages_page(self, session_id: str, limit: int = 100, after: Optional[str] = None,
+                          before: Optional[str] = None, since: Optional[str] = None) -> Optional[Tuple[List[Dict], bool]]:
+        """
+        分页获取会话消息（按序号从旧到新）
+        
+        Args:
+            limit: 每页数量
+            after: 返回该游标之后的消息
+            before: 返回该游标之前、紧邻游标的消息
+            since: 消息ID，返回该消息之后的新消息（用于轮询）
+        
+        Returns:
+            (消息列表, 该方向上是否还有更多)；会话不存在或已过期时返回 None
+        
+        Raises:
+            ValidationError: 游标无效，或 since 指定的消息不存在
+        """
+        if session_id not in self.sessions or self._is_session_expired(session_id):
+            return None
+        after_seq = self._cursor_seq(after)
+        before_seq = self._cursor_seq(before)
+        if since:
+            after_seq = self._find_message_seq(session_id, since)
+            if after_seq is None:
+                raise ValidationError(f"Unknown message id: {since}")
+        
+        # 支持按页读取的存储直接查询，不加载整个会话
+        read_page = getattr(self.store, 'get_messages', None)
+        if read_page is not None:
+            return read_page(session_id, limit, after_seq, before_seq)
+        
+        session = self.get_session(session_id)
+        if session is None:
+            return None
+        messages = session.get('messages', [])
+        # 消息的序号即其在会话中的位置
+        start = after_seq + 1 if after_seq is not None else 0
+        end = min(before_seq, len(messages)) if before_seq is not None else len(messages)
+        if before_seq is not None and after_seq is None:
+            first = max(start, end - limit)
+            page, has_more = messages[first:end], first > start
+        else:
+            last = min(end, start + limit)
+            page, has_more = messages[start:last], last < end
+            first = start
+        return [
+            message if 'seq' in message else {**message, 'seq': first + offset}
+            for offset, message in enumerate(page)
+        ], has_more
+
+    @staticmethod
+    def _cursor_seq(cursor: Optional[str]) -> Optional[int]:
+        """从消息游标中取出序号"""
+        try:
+            position = decode_cursor(cursor, 1)
+            return int(position[0]) if position else None
+        except (TypeError, ValueError):
+            raise ValidationError(f"Invalid cursor: {cursor}")
+
+    def _find_message_seq(self, session_id: str, message_id: str) -> Optional[int]:
+        """根据消息ID查找序号"""
+        find = getattr(self.store, 'find_message_seq', None)
+        if find is not None:
+            return find(session_id, message_id)
+        session = self.get_session(session_id)
+        messages = session.get('messages', []) if session else []
+        # 轮询的消息通常在末尾附近，从后往前找
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].get('id') == message_id:
+                return index
+        return None
+
     def get_session_messages(self, session_id: str) -> List[Dict]:
         """获取会话消息历史"""
         session = self.get_session(session_id)
@@ -502,28 +926,31 @@ class SessionManager:
             return session.get('messages', [])
         return []
 
+    def wait_for_turn(self, session_id: str, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        排队等待会话的聊天轮次
+
+        Returns:
+            排队时前面还有多少个请求；等待超过 timeout（默认 queue_max_wait）返回 None
+
+        Raises:
+            SessionQueueFull: 会话的等待队列已满
+        """
+        with SESSION_LOCK_WAIT.time():
+            position = self.turn_queue.acquire(
+                session_id, self.queue_max_wait if timeout is None else timeout
+            )
+        if position is not None:
+            self.instance_last_used[session_id] = time.time()
+            self._touch(session_id, self.instance_last_used[session_id])
+        return position
+
     def acquire_session_lock(self, session_id: str, timeout: float = 5.0) -> bool:
         """获取会话锁（只用于聊天操作）"""
         try:
-            if session_id in self._active_locks:
-                # 检查是否超时
-                lock_time = self.instance_last_used.get(session_id, 0)
-                if time.time() - lock_time > self._lock_timeout:
-                    self.release_session_lock(session_id)
-                else:
-                    return False
-
-            # 创建或获取聊天锁
-            if session_id not in self._chat_locks:
-                self._chat_locks[session_id] = threading.Lock()
-            
-            # 尝试获取锁
-            if self._chat_locks[session_id].acquire(timeout=timeout):
-                self._active_locks.add(session_id)
-                self.instance_last_used[session_id] = time.time()
-                return True
+            return self.wait_for_turn(session_id, timeout) is not None
+        except SessionQueueFull:
             return False
-            
         except Exception as e:
             logger.error(f"Lock acquisition failed: {str(e)}")
             return False
@@ -531,17 +958,55 @@ class SessionManager:
     def release_session_lock(self, session_id: str) -> None:
         """释放会话锁，仅用于聊天操作"""
         try:
-            if session_id in self._active_locks:
-                self._active_locks.remove(session_id)
-                
-            if session_id in self._chat_locks:
-                try:
-                    self._chat_locks[session_id].release()
-                except RuntimeError:
-                    pass  # 忽略重复释放的错误
+            self.turn_queue.release(session_id)
         except Exception as e:
             logger.error(f"Lock release failed: {str(e)}")
 
+    def cancel_turn(self, session_id: str, interpreter: Any, start: Optional[int] = None,
+                    user_message: Optional[Dict[str, Any]] = None) -> None:
+        """
+        客户端断开时中止会话正在进行的对话并立即释放会话锁
+
+        把实例从会话上摘下，先保存本轮的用户消息和已经产生的部分输出（interpreter.messages[start:]），
+        再释放会话锁：会话的下一轮使用新实例并从已保存的消息恢复，不会与它并发。之后设置
+        stop_event 中断 LLM 流，并终止正在运行的代码；阻塞中的 LLM 请求无法打断，实例在它
+        返回后停下，由 record_turn 交给实例池回收。
+
+        Args:
+            start: 本轮开始时 interpreter.messages 的长度，None 表示不保存本轮消息
+            user_message: 本轮的用户消息，实例还没来得及记录它时（对话尚未开始）单独保存
+        """
+        stop_event = getattr(interpreter, 'stop_event', None)
+        if stop_event is not None:
+            stop_event.set()
+        with self._instances_lock:
+            if self.interpreter_instances.get(session_id) is interpreter:
+                del self.interpreter_instances[session_id]
+                self.instance_last_used.pop(session_id, None)
+                self._synced_counts.pop(session_id, None)
+        self._cancelled.add(interpreter)
+
+        if start is not None:
+            try:
+                partial = [dict(message) for message in interpreter.messages[start:]]
+                if user_message is not None and not (partial and partial[0].get('role') == 'user'):
+                    partial.insert(0, dict(user_message))
+                if partial:
+                    with self._message_lock(session_id):
+                        self.merge_messages(session_id, partial)
+            except Exception as e:
+                logger.error(f"Error saving cancelled turn for session {session_id}: {str(e)}")
+
+        logger.info(f"Cancelled chat turn for session {session_id} after client disconnect")
+        self.release_session_lock(session_id)
+
+        # 会话锁已释放，终止代码可能需要一些时间
+        try:
+            interpreter.computer.terminal.stop()
+            interpreter.computer.terminate()
+        except Exception as e:
+            logger.debug(f"Failed to stop running code for session {session_id}: {str(e)}")
+
     def get_or_create_session(self, session_id: Optional[str] = None) -> Tuple[Dict, bool]:
         """Get existing session or create new one
         Returns:
@@ -558,26 +1023,32 @@ class SessionManager:
         session = self.get_session(session_id)
         if session:
             session['metadata'].update(metadata)
-            self._persist_session(session_id, session)
+            self._journal_update(session_id, session, {'metadata': session['metadata']})
 
     def merge_messages(self, session_id: str, new_messages: List[Dict[str, Any]]) -> None:
         """Merge new messages into existing session while maintaining context"""
         session = self.get_session(session_id)
         if session:
+            stamped = []
             for message in new_messages:
+                message = self._stamp_message(session, dict(message))
                 session['messages'].append(message)
+                stamped.append(message)
             session['last_active'] = time.time()
-            self._persist_session(session_id, session)
+            records = [{"op": "message", "message": message} for message in stamped]
+            records.append({"op": "update", "fields": {'last_active': session['last_active']}})
+            self._journal_records(session_id, session, records)
         else:
             raise ValueError("Session not found")
 
     def get_interpreter(self, session_id: str) -> Optional[Any]:
-        """获取会话对应的interpreter实例（优化锁的使用）"""
+        """
+        获取会话对应的interpreter实例（优化锁的使用）
+
+        创建或从快照恢复实例较慢（恢复时在内核中反序列化变量），只在锁内为会话占位，
+        在锁外完成后再放入 interpreter_instances，不阻塞其他会话获取已有的实例
+        """
         try:
-            # 确保_instances_lock存在
-            if not hasattr(self, '_instances_lock'):
-                self._instances_lock = threading.Lock()
-                
             # 快速路径：检查实例是否存在
             interpreter = self.interpreter_instances.get(session_id)
             if interpreter is not None:
@@ -586,18 +1057,38 @@ class SessionManager:
                 return interpreter
             
             # 慢路径：需要创建新实例
-            with self._instances_lock:
-                # 双重检查，避免竞态条件
-                interpreter = self.interpreter_instances.get(session_id)
-                if interpreter is not None:
-                    self.instance_last_used[session_id] = time.time()
-                    return interpreter
-                    
-                logger.info(f"Creating new interpreter instance for session {session_id}")
-                self.optimize_interpreter_instances(session_id)
+            while True:
+                with self._instances_lock:
+                    # 双重检查，避免竞态条件
+                    interpreter = self.interpreter_instances.get(session_id)
+                    if interpreter is not None:
+                        self.instance_last_used[session_id] = time.time()
+                        return interpreter
+                    # 会话的实例正在休眠时，等快照写完再从快照恢复；
+                    # 其他请求正在为该会话创建实例时，等它完成后直接使用
+                    pending = self._hibernating.get(session_id) or self._restoring.get(session_id)
+                    if pending is None:
+                        logger.info(f"Creating new interpreter instance for session {session_id}")
+                        detached = self.optimize_interpreter_instances(session_id)
+                        ready = self._restoring[session_id] = threading.Event()
+                        break
+                pending.wait()
+
+            try:
                 interpreter = self._create_new_interpreter(session_id)
-                self.interpreter_instances[session_id] = interpreter
-                self.instance_last_used[session_id] = time.time()
+                with self._instances_lock:
+                    if session_id in self.sessions:
+                        self.interpreter_instances[session_id] = interpreter
+                        self.instance_last_used[session_id] = time.time()
+                    else:
+                        # 创建期间会话已被删除
+                        self.pool.release(interpreter)
+                        interpreter = None
+            finally:
+                with self._instances_lock:
+                    self._restoring.pop(session_id, None)
+                ready.set()
+                self._hibernate_instances(detached)
                 
             logger.debug(f"Active interpreter instances: {len(self.interpreter_instances)}/{self.max_active_instances}")
             return interpreter
@@ -606,50 +1097,91 @@ class SessionManager:
             logger.error(f"Error getting interpreter: {str(e)}")
             return None
 
-    def _create_new_interpreter(self, session_id: str) -> Any:
-        """创建新的interpreter实例"""
+    def _build_interpreter(self) -> Any:
+        """创建默认配置的interpreter实例（未配置实例池时使用）"""
         from interpreter import OpenInterpreter
         interpreter = OpenInterpreter()
         interpreter.auto_run = True
         interpreter.conversation_history = True
-        # 加载历史消息
+        return interpreter
+
+    def _create_new_interpreter(self, session_id: str) -> Any:
+        """从实例池取出interpreter实例并加载会话历史"""
+        interpreter = self.pool.acquire()
+        # 被休眠的实例从快照恢复，否则加载历史消息
         messages = self._load_session_messages(session_id)
-        if messages:
-            interpreter.messages = messages
+        try:
+            if self.hibernator.restore(session_id, interpreter):
+                logger.info(f"Restored hibernated interpreter for session {session_id}")
+                # 快照中的消息与休眠时已同步的会话消息一致
+                self._synced_counts.setdefault(session_id, len(messages))
+                return interpreter
+        except Exception as e:
+            logger.error(f"Failed to restore hibernated interpreter for session {session_id}: {str(e)}")
+        # 复制一份，避免解释器直接修改会话中存储的消息
+        interpreter.messages = [self._to_lmc(message) for message in messages]
+        self._synced_counts[session_id] = len(messages)
         return interpreter            
 
-    def optimize_interpreter_instances(self, session_id: str) -> None:
-        """优化 interpreter 实例管理"""
+    def optimize_interpreter_instances(self, session_id: str) -> List[Tuple[str, Any]]:
+        """
+        超出实例上限时摘下最久未用的实例，返回 [(session_id, 实例)]
+
+        这里只在锁内摘下实例并标记为休眠中；写快照（在内核中 pickle 变量并写盘）
+        较慢，由调用方在释放锁之后通过 _hibernate_instances 完成
+        """
+        detached = []
         with self.lock:
-            if len(self.interpreter_instances) >= self.max_active_instances:
-                # 找出最不活跃的实例进行清理
-                oldest_session = min(
-                    self.instance_last_used.items(), 
-                    key=lambda x: x[1]
-                )[0]
-                if oldest_session != session_id:
-                    logger.info(
-                        f"Cleaning up inactive interpreter instance for session {oldest_session} "
-                        f"(active instances: {len(self.interpreter_instances)})"
-                    )
-                    self._cleanup_instance(oldest_session)
+            # 正在创建或恢复的实例也占用名额
+            while len(self.interpreter_instances) + len(self._restoring) >= self.max_active_instances:
+                # 找出最不活跃且没有进行中请求的实例
+                candidates = [
+                    sid for sid in self.interpreter_instances
+                    if sid != session_id and sid not in self._active_locks
+                ]
+                if not candidates:
+                    break
+                oldest_session = min(candidates, key=lambda sid: self.instance_last_used.get(sid, 0))
+                logger.info(
+                    f"Hibernating inactive interpreter instance for session {oldest_session} "
+                    f"(active instances: {len(self.interpreter_instances)})"
+                )
+                with self._instances_lock:
+                    interpreter = self.interpreter_instances.pop(oldest_session)
+                    self.instance_last_used.pop(oldest_session, None)
+                    self._hibernating[oldest_session] = threading.Event()
+                detached.append((oldest_session, interpreter))
+        return detached
+
+    def _hibernate_instances(self, detached: List[Tuple[str, Any]]) -> None:
+        """在锁外保存被摘下实例的状态快照，然后释放实例，会话本身保留"""
+        for session_id, interpreter in detached:
+            try:
+                self.hibernator.save(session_id, interpreter)
+                # 写快照期间会话可能已被删除或过期，不留下无主的快照
+                if session_id not in self.sessions:
+                    self.hibernator.delete(session_id)
+            except Exception as e:
+                logger.error(f"Failed to hibernate interpreter for session {session_id}: {str(e)}")
+            finally:
+                with self._instances_lock:
+                    done = self._hibernating.pop(session_id, None)
+                if done is not None:
+                    done.set()
+            self.pool.release(interpreter)
 
     def _cleanup_instance(self, session_id: str) -> None:
         """清理指定会话的interpreter实例（优化锁的使用）"""
         try:
-            # 确保_instances_lock存在
-            if not hasattr(self, '_instances_lock'):
-                self._instances_lock = threading.Lock()
-                
-            # 确保_sessions_lock存在
-            if not hasattr(self, '_sessions_lock'):
-                self._sessions_lock = threading.Lock()
-                
+            self.expiry.cancel(session_id)
             with self._instances_lock:
-                if session_id in self.interpreter_instances:
-                    del self.interpreter_instances[session_id]
+                interpreter = self.interpreter_instances.pop(session_id, None)
                 if session_id in self.instance_last_used:
                     del self.instance_last_used[session_id]
+                self._synced_counts.pop(session_id, None)
+            
+            # 回收实例
+            self.pool.release(interpreter)
             
             # 分开使用会话锁
             with self._sessions_lock:
@@ -659,9 +1191,7 @@ class SessionManager:
             # 异步删除文件
             def delete_file():
                 try:
-                    session_file = self.storage_path / f"{session_id}.json"
-                    if session_file.exists():
-                        session_file.unlink()
+                    self._delete_session_files(session_id)
                 except Exception as e:
                     logger.error(f"Error deleting session file: {str(e)}")
                     
@@ -677,7 +1207,9 @@ class SessionManager:
             # 由于这只是用于监控，即使数据有少许不准确也可接受
             return {
                 "max_instances": self.max_active_instances,
-                "active_instances": len(self.interpreter_instances)
+                "active_instances": len(self.interpreter_instances),
+                "pool": self.pool.stats(),
+                "queue": self.turn_queue.stats()
             }
         except Exception as e:
             logger.error(f"Error getting instances status: {str(e)}")
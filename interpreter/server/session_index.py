@@ -0,0 +1,311 @@
+"""
+Session index and lazy session cache for Open Interpreter HTTP Server
+
+启动时只加载紧凑的会话摘要索引（`sessions.index`），会话的消息内容在首次访问时
+才从磁盘读入，并按 LRU 策略移出内存。
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .expiry import to_timestamp
+from .log_config import logger
+from .storage import decode_cursor
+
+INDEX_FILENAME = "sessions.index"
+
+
+def summarize_session(session: Dict[str, Any], size: int = 0) -> Dict[str, Any]:
+    """从完整会话生成索引摘要"""
+    return {
+        "session_id": session.get("session_id"),
+        "created_at": session.get("created_at"),
+        "last_active": session.get("last_active"),
+        "message_count": len(session.get("messages") or []),
+        "size": size,
+        "metadata": session.get("metadata") or {},
+    }
+
+
+class SessionIndex:
+    """
+    会话摘要索引
+
+    索引文件同样是追加写的 JSONL：每行是一个完整摘要或删除标记，后出现的记录覆盖
+    之前的记录。记录数超过摘要数量的两倍时重写文件。索引可以随时从会话文件重建，
+    因此写入时不做 fsync。
+    """
+
+    def __init__(self, storage_path: Path, compact_min: int = 1000):
+        self.path = Path(storage_path) / INDEX_FILENAME
+        self.compact_min = compact_min
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._records = 0
+        self._file = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self) -> None:
+        """读取索引文件，忽略损坏的行"""
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records += 1
+                    session_id = entry.get("session_id")
+                    if not session_id:
+                        continue
+                    if entry.get("deleted"):
+                        self.entries.pop(session_id, None)
+                    else:
+                        self.entries[session_id] = entry
+        except Exception as e:
+            logger.error(f"Error loading session index: {str(e)}")
+            self.entries = {}
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        """写入或覆盖一个会话摘要"""
+        with self._lock:
+            self.entries[entry["session_id"]] = entry
+            self._append(entry)
+
+    def remove(self, session_id: str) -> None:
+        """删除一个会话摘要"""
+        with self._lock:
+            if self.entries.pop(session_id, None) is not None:
+                self._append({"session_id": session_id, "deleted": True})
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        active_since: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        按创建时间从新到旧分页返回会话摘要
+
+        Args:
+            limit: 每页数量
+            after: 返回列表中位于该游标之后（更早创建）的会话
+            before: 返回列表中位于该游标之前（更晚创建）、紧邻游标的会话
+            active_since: 只返回在此时间戳之后活动过的会话
+
+        Returns:
+            (摘要列表, 该方向上是否还有更多)
+
+        Raises:
+            ValueError: 游标无效
+        """
+        after_key = decode_cursor(after, 2)
+        before_key = decode_cursor(before, 2)
+        with self._lock:
+            entries = list(self.entries.values())
+        matched = [
+            entry for entry in entries
+            if (after_key is None or list(_page_key(entry)) < after_key)
+            and (before_key is None or list(_page_key(entry)) > before_key)
+            and (active_since is None or _last_active(entry) >= active_since)
+        ]
+        matched.sort(key=_page_key, reverse=True)
+        if before_key is not None and after_key is None:
+            return matched[-limit:] if limit else [], len(matched) > limit
+        return matched[:limit], len(matched) > limit
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._records += 1
+            if self._records > max(self.compact_min, 2 * len(self.entries)):
+                self.compact()
+        except Exception as e:
+            logger.error(f"Error writing session index: {str(e)}")
+
+    def compact(self) -> None:
+        """用当前摘要重写索引文件"""
+        with self._lock:
+            self.close()
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._records = len(self.entries)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _page_key(entry: Dict[str, Any]) -> Tuple[str, str]:
+    return (entry.get("created_at") or "", entry.get("session_id") or "")
+
+
+def _last_active(entry: Dict[str, Any]) -> float:
+    return to_timestamp(entry.get("last_active"))
+
+
+class LazySessionDict(MutableMapping):
+    """
+    以索引为键集合的会话映射
+
+    读取不在内存中的会话时通过 loader 从磁盘加载，常驻内存的会话数量超过
+    max_resident 时按 LRU 移出（is_pinned 返回 True 的会话不会被移出）。会话的所有
+    修改都已即时写入日志，因此移出时无需写回，只需刷新其索引摘要。
+    is_stale 返回 True 的会话（已被其他进程修改）在下次访问时重新加载。
+    """
+
+    def __init__(
+        self,
+        index: SessionIndex,
+        loader: Callable[[str], Optional[Dict[str, Any]]],
+        max_resident: int = 256,
+        size_of: Optional[Callable[[str], int]] = None,
+        is_pinned: Optional[Callable[[str], bool]] = None,
+        is_stale: Optional[Callable[[str], bool]] = None,
+    ):
+        self.index = index
+        self.loader = loader
+        self.max_resident = max_resident
+        self.size_of = size_of or (lambda session_id: 0)
+        self.is_pinned = is_pinned or (lambda session_id: False)
+        self.is_stale = is_stale or (lambda session_id: False)
+        self._resident: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._changed = set()
+        self._lock = threading.RLock()
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            session = self._resident.get(session_id)
+            if session is not None and not self.is_pinned(session_id) and self.is_stale(session_id):
+                del self._resident[session_id]
+                session = None
+            if session is not None:
+                self._resident.move_to_end(session_id)
+                # 之前被固定的会话释放后，在下次访问时补做移出
+                self._evict()
+                return session
+            if session_id not in self.index.entries:
+                raise KeyError(session_id)
+
+        # 在锁外读取磁盘，避免慢加载阻塞其他会话
+        session = self.loader(session_id)
+        if session is None:
+            raise KeyError(session_id)
+
+        with self._lock:
+            # 加载期间其他线程可能已经加载过
+            existing = self._resident.get(session_id)
+            if existing is not None:
+                return existing
+            self._resident[session_id] = session
+            self._evict()
+            return session
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]) -> None:
+        with self._lock:
+            self._resident[session_id] = session
+            self._resident.move_to_end(session_id)
+            self.index.put(summarize_session(session, self.size_of(session_id)))
+            self._changed.discard(session_id)
+            self._evict()
+
+    def __delitem__(self, session_id: str) -> None:
+        with self._lock:
+            if session_id not in self.index.entries and session_id not in self._resident:
+                raise KeyError(session_id)
+            self._resident.pop(session_id, None)
+            self._changed.discard(session_id)
+            self.index.remove(session_id)
+
+    def pop(self, session_id: str, *default):
+        """删除会话，返回内存中的会话（不会为此从磁盘加载）"""
+        with self._lock:
+            exists = session_id in self.index.entries or session_id in self._resident
+            session = self._resident.pop(session_id, None)
+            if not exists:
+                if default:
+                    return default[0]
+                raise KeyError(session_id)
+            self._changed.discard(session_id)
+            self.index.remove(session_id)
+            return session if session is not None else (default[0] if default else None)
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._resident or session_id in self.index.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.index.entries))
+
+    def __len__(self) -> int:
+        return len(self.index.entries)
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """仅返回已在内存中的会话，不触发加载"""
+        return self._resident.get(session_id)
+
+    def summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话的索引摘要"""
+        return self.index.entries.get(session_id)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """所有会话摘要的快照"""
+        return list(self.index.entries.values())
+
+    def resident_items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """内存中的会话"""
+        with self._lock:
+            return list(self._resident.items())
+
+    def mark_changed(self, session_id: str) -> None:
+        """标记会话已修改，下次 flush_index 时刷新其摘要"""
+        with self._lock:
+            self._changed.add(session_id)
+
+    def touch_summary(self, session_id: str, fields: Dict[str, Any]) -> None:
+        """更新不在内存中的会话摘要字段"""
+        with self._lock:
+            entry = self.index.entries.get(session_id)
+            if entry is not None:
+                self.index.put({**entry, **{k: v for k, v in fields.items() if k in entry}})
+
+    def flush_index(self) -> None:
+        """将已修改会话的摘要写入索引"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            for session_id in changed:
+                session = self._resident.get(session_id)
+                if session is not None and session_id in self.index.entries:
+                    self.index.put(summarize_session(session, self.size_of(session_id)))
+
+    def _evict(self) -> None:
+        """按 LRU 顺序移出超出容量的会话"""
+        if len(self._resident) <= self.max_resident:
+            return
+        for session_id in list(self._resident):
+            if len(self._resident) <= self.max_resident:
+                break
+            if self.is_pinned(session_id):
+                continue
+            session = self._resident.pop(session_id)
+            if session_id in self._changed:
+                self._changed.discard(session_id)
+                self.index.put(summarize_session(session, self.size_of(session_id)))
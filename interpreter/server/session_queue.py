@@ -0,0 +1,100 @@
+"""
+Per-session FIFO turn queue for Open Interpreter HTTP Server
+
+同一会话同一时间只能进行一轮对话。之前第二个请求在锁上等待超时后返回 423，
+客户端只能盲目重试。SessionTurnQueue 让后到的请求按到达顺序排队，上一轮结束时
+直接把轮次交给队首的请求；队列长度和等待时间都有上限。
+"""
+
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set
+
+from .errors import InterpreterError
+
+
+class SessionQueueFull(InterpreterError):
+    """会话的等待队列已满"""
+
+    def __init__(self, session_id: str, depth: int):
+        super().__init__(f"Too many queued requests for session {session_id}", status_code=429)
+        self.session_id = session_id
+        self.depth = depth
+
+
+class SessionTurnQueue:
+    """按会话划分的公平（FIFO）轮次锁"""
+
+    def __init__(self, max_depth: int = 8):
+        """
+        Args:
+            max_depth: 每个会话最多排队等待的请求数，0 表示不排队
+        """
+        self.max_depth = max(0, max_depth)
+        self.held: Set[str] = set()  # 正在进行对话的会话
+        self._waiters: Dict[str, Deque[threading.Event]] = {}
+        self._lock = threading.Lock()
+        self.on_release: Optional[Callable[[], None]] = None  # 有会话结束对话（进行中的轮次减少）时调用
+
+    def acquire(self, session_id: str, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        获取会话的轮次
+
+        Returns:
+            排队时前面还有多少个请求（0 表示无需等待）；等待超时返回 None
+
+        Raises:
+            SessionQueueFull: 队列已满
+        """
+        with self._lock:
+            waiters = self._waiters.get(session_id)
+            if session_id not in self.held and not waiters:
+                self.held.add(session_id)
+                return 0
+            if waiters is None:
+                waiters = self._waiters[session_id] = deque()
+            if len(waiters) >= self.max_depth:
+                raise SessionQueueFull(session_id, len(waiters))
+            event = threading.Event()
+            waiters.append(event)
+            position = len(waiters)
+
+        # 轮次由 release 直接移交，被唤醒时已经持有
+        if event.wait(timeout):
+            return position
+        with self._lock:
+            if event.is_set():
+                return position
+            waiters.remove(event)
+            if not waiters and self._waiters.get(session_id) is waiters:
+                del self._waiters[session_id]
+        return None
+
+    def release(self, session_id: str) -> None:
+        """结束当前轮次；有请求在排队时直接交给队首的请求"""
+        with self._lock:
+            if session_id not in self.held:
+                return
+            waiters = self._waiters.get(session_id)
+            if waiters:
+                waiters.popleft().set()
+                if not waiters:
+                    del self._waiters[session_id]
+                return
+            self.held.discard(session_id)
+        if self.on_release is not None:
+            self.on_release()
+
+    def queue_length(self, session_id: str) -> int:
+        """会话当前排队等待的请求数"""
+        with self._lock:
+            return len(self._waiters.get(session_id, ()))
+
+    def stats(self) -> Dict[str, int]:
+        """进行中和排队中的请求数"""
+        with self._lock:
+            return {
+                "active": len(self.held),
+                "queued": sum(len(waiters) for waiters in self._waiters.values()),
+                "max_depth": self.max_depth,
+            }
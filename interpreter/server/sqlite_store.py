@@ -0,0 +1,410 @@
+"""
+SQLite session storage for Open Interpreter HTTP Server
+
+会话和消息分别存放在 sessions 和 messages 两张表中，按会话和时间建立索引。数据库
+使用 WAL 模式，读写互不阻塞；写事务用 BEGIN IMMEDIATE 串行化，多个服务进程可以
+共享同一个数据库文件。每次写入都会递增会话的 version，进程据此发现内存中的会话
+副本已被其他进程修改。
+"""
+
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .expiry import to_timestamp
+from .log_config import logger
+from .storage import SessionStore, decode_cursor
+
+# 有独立列的会话字段，其余顶层字段存放在 extra 中
+SESSION_COLUMNS = ("session_id", "created_at", "last_active", "metadata", "messages")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT '',
+    last_active REAL NOT NULL DEFAULT 0,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    extra TEXT NOT NULL DEFAULT '{}',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at, session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    message_id TEXT,
+    created_at TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session_time ON messages (session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages (session_id, message_id);
+"""
+
+
+class SqliteSessionStore(SessionStore):
+    """基于 SQLite 的会话存储"""
+
+    def __init__(self, path, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: 数据库文件路径
+            busy_timeout: 等待其他进程释放写锁的最长时间（秒）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 本进程最后一次读写时各会话的 version
+        self._versions: Dict[str, int] = {}
+
+        # executescript 自行提交，不能放在显式事务中
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用自己的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：由 _transaction 显式控制事务边界
+            conn = sqlite3.connect(
+                str(self.path), timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务；BEGIN IMMEDIATE 立即获取写锁，避免多进程下读后写的死锁"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump_version(self, conn: sqlite3.Connection, session_id: str) -> None:
+        """递增会话版本；期间有其他进程写入时保留旧版本号，使本进程的副本被判为过期"""
+        row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute("UPDATE sessions SET version = version + 1 WHERE session_id = ?", (session_id,))
+        if self._versions.get(session_id, 0) == row["version"]:
+            self._versions[session_id] = row["version"] + 1
+
+    def exists(self, session_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        # 在同一个读事务中读取会话和消息，得到一致的快照
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            messages = [
+                self._message_from_row(message_row)
+                for message_row in conn.execute(
+                    "SELECT seq, body FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+                )
+            ]
+        finally:
+            conn.execute("COMMIT")
+        self._versions[session_id] = row["version"]
+        session = json.loads(row["extra"])
+        session.update({
+            "session_id": row["session_id"],
+            "created_at": row["created_at"],
+            "last_active": row["last_active"],
+            "metadata": json.loads(row["metadata"]),
+            "messages": messages,
+        })
+        return session
+
+    def append_many(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        with self._transaction() as conn:
+            for record in records:
+                op = record.get("op")
+                if op == "message":
+                    self._insert_messages(conn, session_id, [record.get("message") or {}])
+                elif op == "update":
+                    self._update_fields(conn, session_id, record.get("fields") or {})
+            self._bump_version(conn, session_id)
+
+    def compact(self, session_id: str, session: Dict[str, Any]) -> None:
+        """用会话的完整状态替换数据库中的会话和消息"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id) VALUES (?) ON CONFLICT (session_id) DO NOTHING",
+                (session_id,)
+            )
+            self._update_fields(conn, session_id, session)
+            self._bump_version(conn, session_id)
+
+    def delete(self, session_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._versions.pop(session_id, None)
+
+    def iter_session_ids(self) -> Iterator[str]:
+        for row in self._connect().execute("SELECT session_id FROM sessions").fetchall():
+            yield row["session_id"]
+
+    def size_of(self, session_id: str) -> int:
+        row = self._connect().execute(
+            "SELECT size FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row["size"] if row is not None else 0
+
+    def is_stale(self, session_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None and row["version"] != self._versions.get(session_id)
+
+    def get_messages(
+        self,
+        session_id: str,
+        limit: int,
+        after_seq: Optional[int] = None,
+        before_seq: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        按序号分页读取消息，不加载整个会话
+
+        Returns:
+            (按序号排列的消息, 该方向上是否还有更多)
+        """
+        clauses, params = ["session_id = ?"], [session_id]
+        if after_seq is not None:
+            clauses.append("seq > ?")
+            params.append(after_seq)
+        if before_seq is not None:
+            clauses.append("seq < ?")
+            params.append(before_seq)
+        # 只给出 before 时取紧邻游标的一页
+        order = "DESC" if before_seq is not None and after_seq is None else "ASC"
+        rows = self._connect().execute(
+            f"SELECT seq, body FROM messages WHERE {' AND '.join(clauses)} ORDER BY seq {order} LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        messages = [self._message_from_row(row) for row in rows[:limit]]
+        if order == "DESC":
+            messages.reverse()
+        return messages, len(rows) > limit
+
+    def find_message_seq(self, session_id: str, message_id: str) -> Optional[int]:
+        """根据消息 ID 查找其序号"""
+        row = self._connect().execute(
+            "SELECT seq FROM messages WHERE session_id = ? AND message_id = ?", (session_id, message_id)
+        ).fetchone()
+        return row["seq"] if row is not None else None
+
+    def open_index(self) -> "SqliteSessionIndex":
+        return SqliteSessionIndex(self)
+
+    def sync(self) -> None:
+        """把 WAL 中已提交的内容合并回数据库文件（不阻塞读写）"""
+        try:
+            self._connect().execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error as e:
+            logger.error(f"Error checkpointing session database: {str(e)}")
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    @staticmethod
+    def _message_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+        message = json.loads(row["body"])
+        message["seq"] = row["seq"]
+        return message
+
+    def _insert_messages(self, conn: sqlite3.Connection, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """追加消息；序号由数据库分配，多个进程写同一会话时也不会冲突"""
+        row = conn.execute(
+            "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        seq = row["message_count"]
+        size = 0
+        for message in messages:
+            body = json.dumps({k: v for k, v in message.items() if k != "seq"}, ensure_ascii=False)
+            conn.execute(
+                "INSERT INTO messages (session_id, seq, message_id, created_at, body) VALUES (?, ?, ?, ?, ?)",
+                (session_id, seq, message.get("id"), message.get("created_at"), body)
+            )
+            seq += 1
+            size += len(body)
+        conn.execute(
+            "UPDATE sessions SET message_count = ?, size = size + ? WHERE session_id = ?",
+            (seq, size, session_id)
+        )
+
+    def _update_fields(self, conn: sqlite3.Connection, session_id: str, fields: Dict[str, Any]) -> None:
+        """覆盖会话的顶层字段；messages 字段会替换全部消息"""
+        if "created_at" in fields:
+            conn.execute(
+                "UPDATE sessions SET created_at = ? WHERE session_id = ?",
+                (fields["created_at"] or "", session_id)
+            )
+        if "last_active" in fields:
+            conn.execute(
+                "UPDATE sessions SET last_active = ? WHERE session_id = ?",
+                (to_timestamp(fields["last_active"]), session_id)
+            )
+        if "metadata" in fields:
+            conn.execute(
+                "UPDATE sessions SET metadata = ? WHERE session_id = ?",
+                (json.dumps(fields["metadata"] or {}, ensure_ascii=False, default=str), session_id)
+            )
+        extra = {k: v for k, v in fields.items() if k not in SESSION_COLUMNS}
+        if extra:
+            row = conn.execute("SELECT extra FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            merged = {**json.loads(row["extra"]), **extra} if row is not None else extra
+            conn.execute(
+                "UPDATE sessions SET extra = ? WHERE session_id = ?",
+                (json.dumps(merged, ensure_ascii=False, default=str), session_id)
+            )
+        if "messages" in fields:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "UPDATE sessions SET message_count = 0, size = 0 WHERE session_id = ?", (session_id,)
+            )
+            self._insert_messages(conn, session_id, fields["messages"] or [])
+
+
+class _SessionSummaries(Mapping):
+    """以 sessions 表为数据源的只读摘要映射，提供 SessionIndex.entries 的接口"""
+
+    def __init__(self, store: SqliteSessionStore):
+        self.store = store
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        row = self.store._connect().execute(
+            "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return self._summary(row)
+
+    def __contains__(self, session_id) -> bool:
+        return self.store.exists(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.store.iter_session_ids()
+
+    def __len__(self) -> int:
+        return self.store._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def values(self) -> List[Dict[str, Any]]:
+        return [self._summary(row) for row in self.store._connect().execute("SELECT * FROM sessions").fetchall()]
+
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "session_id": row["session_id"],
+            "created_at": row["created_at"],
+            "last_active": row["last_active"],
+            "message_count": row["message_count"],
+            "size": row["size"],
+            "metadata": json.loads(row["metadata"]),
+        }
+
+
+class SqliteSessionIndex:
+    """
+    sessions 表本身就是摘要索引
+
+    与 SessionIndex 接口相同。摘要中的消息数和大小由存储在写入消息时维护，put 只
+    更新创建时间、活动时间和元数据。
+    """
+
+    def __init__(self, store: SqliteSessionStore):
+        self.store = store
+        self.entries = _SessionSummaries(store)
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        try:
+            with self.store._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO sessions (session_id, created_at, last_active, metadata) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET created_at = excluded.created_at, "
+                    "last_active = excluded.last_active, metadata = excluded.metadata",
+                    (
+                        entry["session_id"],
+                        entry.get("created_at") or "",
+                        to_timestamp(entry.get("last_active")),
+                        json.dumps(entry.get("metadata") or {}, ensure_ascii=False, default=str),
+                    )
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing session summary {entry.get('session_id')}: {str(e)}")
+
+    def remove(self, session_id: str) -> None:
+        self.store.delete(session_id)
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        active_since: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """按创建时间从新到旧分页（使用 idx_sessions_created 索引），参数同 SessionIndex.page"""
+        after_key = decode_cursor(after, 2)
+        before_key = decode_cursor(before, 2)
+        clauses, params = [], []
+        if after_key is not None:
+            clauses.append("(created_at, session_id) < (?, ?)")
+            params.extend(after_key)
+        if before_key is not None:
+            clauses.append("(created_at, session_id) > (?, ?)")
+            params.extend(before_key)
+        if active_since is not None:
+            clauses.append("last_active >= ?")
+            params.append(active_since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # 只给出 before 时取紧邻游标的一页
+        backwards = before_key is not None and after_key is None
+        order = "ASC" if backwards else "DESC"
+        rows = self.store._connect().execute(
+            f"SELECT * FROM sessions {where} ORDER BY created_at {order}, session_id {order} LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        entries = [_SessionSummaries._summary(row) for row in rows[:limit]]
+        if backwards:
+            entries.reverse()
+        return entries, len(rows) > limit
+
+    def compact(self) -> None:
+        """数据库无需压缩"""
+
+    def close(self) -> None:
+        """连接由存储统一关闭"""
@@ -0,0 +1,135 @@
+"""
+Pluggable session storage for Open Interpreter HTTP Server
+
+SessionManager 通过 SessionStore 接口持久化会话，记录格式与追加写日志相同：
+
+    {"op": "message", "message": {...}}    追加一条消息
+    {"op": "update", "fields": {...}}      覆盖会话的顶层字段
+
+内置两种实现：
+
+    journal  每个会话一个追加写的 JSONL 文件（默认，见 journal.py）
+    sqlite   单个 SQLite 数据库（WAL 模式），可由多个服务进程共享（见 sqlite_store.py）
+"""
+
+import base64
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class SessionStore:
+    """会话存储后端的接口"""
+
+    def exists(self, session_id: str) -> bool:
+        """会话是否已持久化"""
+        raise NotImplementedError
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取会话的最新状态"""
+        raise NotImplementedError
+
+    def append(self, session_id: str, record: Dict[str, Any]) -> None:
+        """追加一条记录（调用方保证会话已持久化）"""
+        self.append_many(session_id, [record])
+
+    def append_many(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        """按顺序追加多条记录，后端必须实现"""
+        raise NotImplementedError
+
+    def needs_compaction(self, session_id: str) -> bool:
+        """是否需要用完整快照替换累积的记录"""
+        return False
+
+    def compact(self, session_id: str, session: Dict[str, Any]) -> None:
+        """写入会话的完整状态"""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def iter_session_ids(self) -> Iterator[str]:
+        """遍历所有已持久化的会话ID"""
+        raise NotImplementedError
+
+    def size_of(self, session_id: str) -> int:
+        """会话占用的存储字节数"""
+        return 0
+
+    def is_stale(self, session_id: str) -> bool:
+        """内存中的副本是否已被其他进程修改"""
+        return False
+
+    def open_index(self):
+        """会话摘要索引（需提供 entries、put、remove、page、close）"""
+        raise NotImplementedError
+
+    def sync(self) -> None:
+        """将写入刷到磁盘"""
+
+    def close(self) -> None:
+        """关闭存储"""
+
+
+def encode_cursor(*parts: Any) -> str:
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(list(parts), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: Optional[int] = None) -> Optional[List[Any]]:
+    """
+    解析游标，未提供时返回 None
+
+    Raises:
+        ValueError: 游标不是 encode_cursor 生成的（或位置个数不是 size）
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        parts = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(parts, list) or (size is not None and len(parts) != size):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return parts
+
+
+def session_cursor(summary: Dict[str, Any]) -> str:
+    """会话在列表中的位置（按创建时间、会话ID排序）"""
+    return encode_cursor(summary.get("created_at") or "", summary.get("session_id") or "")
+
+
+def message_cursor(message: Dict[str, Any]) -> str:
+    """消息在会话中的位置（序号）"""
+    return encode_cursor(message.get("seq"))
+
+
+def create_session_store(
+    backend: str,
+    storage_path: Path,
+    compact_threshold: int = 1000,
+    fsync_interval: float = 1.0,
+    sqlite_path: Optional[str] = None,
+) -> SessionStore:
+    """
+    按名称创建存储后端
+
+    Args:
+        backend: "journal" 或 "sqlite"
+        storage_path: 会话存储目录
+        compact_threshold: journal 后端触发压缩的记录数
+        fsync_interval: journal 后端的 fsync 合并间隔（秒）
+        sqlite_path: sqlite 后端的数据库文件，默认为存储目录下的 sessions.db
+    """
+    backend = (backend or "journal").lower()
+    if backend == "journal":
+        from .journal import SessionJournal
+        return SessionJournal(
+            storage_path, compact_threshold=compact_threshold, fsync_interval=fsync_interval
+        )
+    if backend == "sqlite":
+        from .sqlite_store import SqliteSessionStore
+        return SqliteSessionStore(sqlite_path or Path(storage_path) / "sessions.db")
+    raise ValueError(f"Unknown session storage backend: {backend}")
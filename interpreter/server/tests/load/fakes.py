@@ -0,0 +1,137 @@
+"""
+Deterministic LLM and code runner stand-ins for load testing
+
+FakeLLM 替换 llm.completions，按配置的首包延迟和 token 速率流式输出预设内容；
+FakeCodeRunner 替换 computer.run，等待固定时间后返回预设输出。两者都保留服务器的
+计时包装，因此 Server-Timing 和 /v1/metrics 中的 llm、code 阶段仍然有效。
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from interpreter.server.metrics import timed_code_runner, timed_llm_completions
+
+# 用户消息包含该标记时，FakeLLM 回复一个代码块以触发代码执行
+RUN_CODE_MARKER = "[run]"
+
+# 以循环结束语收尾，服务器开启 loop 时不会追加 "Proceed" 轮次
+DEFAULT_REPLY = "Here is a short canned answer from the load-test model. The task is done."
+DEFAULT_CODE_REPLY = "Let me run that.\n```python\nprint('hello from the load test')\n```"
+
+
+class FakeLLM:
+    """按固定速率流式输出预设内容的 LLM"""
+
+    def __init__(
+        self,
+        reply: str = DEFAULT_REPLY,
+        code_reply: str = DEFAULT_CODE_REPLY,
+        tokens_per_second: float = 0,
+        first_token_latency: float = 0,
+        chars_per_token: int = 4,
+    ):
+        """
+        Args:
+            reply: 普通回复
+            code_reply: 用户消息包含 RUN_CODE_MARKER 时的回复
+            tokens_per_second: 每秒输出的 token 数，0 表示不限速
+            first_token_latency: 首个 token 之前的等待时间（秒）
+            chars_per_token: 每个 token（响应块）包含的字符数
+        """
+        self.reply = reply
+        self.code_reply = code_reply
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.chars_per_token = max(1, chars_per_token)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, **params) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            self.calls += 1
+        text = self.code_reply if self._wants_code(params.get("messages") or []) else self.reply
+        return self._stream(text)
+
+    def _stream(self, text: str) -> Iterator[Dict[str, Any]]:
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+        for start in range(0, len(text), self.chars_per_token):
+            if interval:
+                time.sleep(interval)
+            yield {"choices": [{"delta": {"content": text[start:start + self.chars_per_token]}}]}
+
+    @staticmethod
+    def _wants_code(messages: List[Dict[str, Any]]) -> bool:
+        # 只看最后一条消息：代码执行后最后一条是输出，此时给出普通回复结束本轮
+        content = messages[-1].get("content") if messages else None
+        return isinstance(content, str) and RUN_CODE_MARKER in content
+
+
+class FakeCodeRunner:
+    """等待固定时间后返回预设输出的代码执行器"""
+
+    def __init__(self, output: str = "hello from the load test\n", delay: float = 0):
+        """
+        Args:
+            output: 每次执行的输出
+            delay: 每次执行耗时（秒）
+        """
+        self.output = output
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, language, code, stream=False, display=False):
+        with self._lock:
+            self.calls += 1
+        if not stream:
+            self._wait()
+            return [{"type": "console", "format": "output", "content": self.output}]
+        return self._stream()
+
+    def _stream(self) -> Iterator[Dict[str, Any]]:
+        yield {"type": "console", "format": "active_line", "content": 1}
+        self._wait()
+        yield {"type": "console", "format": "output", "content": self.output}
+
+    def _wait(self) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+
+
+def install_fakes(interpreter, llm: FakeLLM, runner: FakeCodeRunner, history_path: str = None) -> None:
+    """
+    把解释器实例的 LLM 和代码执行替换为替身
+
+    Args:
+        interpreter: 已由服务器配置好的解释器实例
+        history_path: 对话历史文件的目录，默认不修改
+    """
+    interpreter.llm.completions = timed_llm_completions(llm)
+    interpreter.computer.run = timed_code_runner(runner)
+    # 跳过需要联网的模型能力探测和遥测
+    interpreter.llm.supports_functions = False
+    interpreter.llm.supports_vision = False
+    interpreter.disable_telemetry = True
+    if history_path is not None:
+        interpreter.conversation_history_path = history_path
+
+
+def install_fakes_on_app(app, llm: FakeLLM, runner: FakeCodeRunner, history_path: str = None) -> None:
+    """
+    替换应用的默认实例以及之后从实例池创建的所有实例
+
+    实例池须以 INTERPRETER_POOL_SIZE=0 创建，否则后台线程可能已用原工厂预热了实例
+    """
+    install_fakes(app.interpreter_instance, llm, runner, history_path)
+    pool = app.session_manager.pool
+    factory = pool.factory
+
+    def build_fake_interpreter():
+        interpreter = factory()
+        install_fakes(interpreter, llm, runner, history_path)
+        return interpreter
+
+    pool.factory = build_fake_interpreter
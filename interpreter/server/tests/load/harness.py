@@ -0,0 +1,379 @@
+"""
+Load-test harness for Open Interpreter HTTP Server
+
+用 create_app 在本进程内启动服务器（多线程 WSGI），LLM 和代码执行替换为
+fakes.py 中的确定性替身，然后由 N 个并发客户端各自驱动一个会话，依次运行
+/v1/chat、/v1/chat/completions 和会话接口的场景。每个场景输出延迟的
+p50/p95/p99、吞吐量和进程内存，结果为 JSON，便于保存并与之前的结果对比。
+
+用法：
+
+    python -m interpreter.server.tests.load.harness --sessions 8 --turns 5 --output load.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import psutil
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from interpreter.server import create_app
+
+from .fakes import RUN_CODE_MARKER, FakeCodeRunner, FakeLLM, install_fakes_on_app
+
+
+class Sample(NamedTuple):
+    operation: str
+    latency: float  # 秒，流式请求为读完整个响应的时间
+    first_byte: Optional[float]  # 流式请求收到第一个事件的时间
+    status: int  # 0 表示连接失败
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """线性插值的百分位数，q 取 0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+    return {
+        "p50": ms(percentile(values, 50)),
+        "p95": ms(percentile(values, 95)),
+        "p99": ms(percentile(values, 99)),
+        "mean": ms(sum(values) / len(values)) if values else None,
+        "max": ms(max(values)) if values else None,
+    }
+
+
+def summarize(samples: List[Sample], duration: float) -> Dict[str, Any]:
+    """汇总一个场景的样本（延迟单位为毫秒）"""
+    ok = [s for s in samples if 200 <= s.status < 300]
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 3) if duration > 0 else None,
+        "latency_ms": _latency_summary([s.latency for s in ok]),
+        "operations": {},
+    }
+    first_bytes = [s.first_byte for s in ok if s.first_byte is not None]
+    if first_bytes:
+        summary["first_byte_ms"] = _latency_summary(first_bytes)
+    for operation in sorted({s.operation for s in samples}):
+        op_samples = [s for s in samples if s.operation == operation]
+        op_ok = [s.latency for s in op_samples if 200 <= s.status < 300]
+        summary["operations"][operation] = {
+            "requests": len(op_samples),
+            "errors": len(op_samples) - len(op_ok),
+            "latency_ms": _latency_summary(op_ok),
+        }
+    return summary
+
+
+class MemorySampler:
+    """在后台线程中定期采样进程 RSS"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self._process = psutil.Process(os.getpid())
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.start_rss = self.peak_rss = 0
+
+    def __enter__(self) -> "MemorySampler":
+        self.start_rss = self.peak_rss = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.end_rss = self._rss()
+        self.peak_rss = max(self.peak_rss, self.end_rss)
+
+    def summary(self) -> Dict[str, float]:
+        def mb(value):
+            return round(value / (1024 * 1024), 2)
+        return {
+            "rss_start_mb": mb(self.start_rss),
+            "rss_peak_mb": mb(self.peak_rss),
+            "rss_end_mb": mb(self.end_rss),
+            "rss_delta_mb": mb(self.end_rss - self.start_rss),
+        }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def _rss(self) -> int:
+        return self._process.memory_info().rss
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不输出逐个请求的访问日志"""
+
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+
+class LoadClient:
+    """一个并发用户：独立的 HTTP 连接，记录每个请求的样本"""
+
+    def __init__(self, base_url: str, timeout: float = 300):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.samples: List[Sample] = []
+
+    def call(self, operation: str, method: str, path: str, stream: bool = False, **kwargs) -> Optional[Any]:
+        """发送请求并记录样本；返回解析后的 JSON（流式请求返回事件列表）"""
+        started = time.perf_counter()
+        first_byte = None
+        try:
+            response = self.http.request(
+                method, self.base_url + path, stream=stream, timeout=self.timeout, **kwargs
+            )
+            if stream:
+                body = []
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    body.append(line.decode("utf-8", "replace"))
+            else:
+                body = response.json() if response.content else None
+            status = response.status_code
+        except (requests.RequestException, ValueError):
+            body, status = None, 0
+        self.samples.append(Sample(operation, time.perf_counter() - started, first_byte, status))
+        return body if 200 <= status < 300 else None
+
+    def create_session(self) -> Optional[str]:
+        body = self.call("create_session", "POST", "/v1/sessions", json={"metadata": {"source": "load-test"}})
+        return body.get("session_id") if body else None
+
+    def close(self) -> None:
+        self.http.close()
+
+
+def _prompt(user: int, turn: int, run_code: bool = False) -> str:
+    prompt = f"Load test user {user}, turn {turn}: please answer briefly."
+    return f"{prompt} {RUN_CODE_MARKER}" if run_code else prompt
+
+
+def chat_scenario(client: LoadClient, user: int, turns: int, stream: bool = False, run_code: bool = False) -> None:
+    """在一个会话中连续对话（/v1/chat）"""
+    session_id = client.create_session()
+    if session_id is None:
+        return
+    operation = "chat_stream" if stream else "chat"
+    for turn in range(turns):
+        client.call(operation, "POST", "/v1/chat", stream=stream, json={
+            "session_id": session_id,
+            "stream": stream,
+            "messages": [{"role": "user", "type": "message", "content": _prompt(user, turn, run_code)}],
+        })
+
+
+def openai_scenario(client: LoadClient, user: int, turns: int, stream: bool = False) -> None:
+    """OpenAI 客户端的用法：每轮发送完整的历史（/v1/chat/completions）"""
+    session_id = client.create_session()
+    if session_id is None:
+        return
+    history = [{"role": "system", "content": "You are a load-test assistant."}]
+    operation = "completions_stream" if stream else "completions"
+    for turn in range(turns):
+        history.append({"role": "user", "content": _prompt(user, turn)})
+        body = client.call(operation, "POST", "/v1/chat/completions", stream=stream, json={
+            "session_id": session_id,
+            "stream": stream,
+            "messages": history,
+        })
+        reply = ""
+        if isinstance(body, dict):
+            choices = body.get("choices") or [{}]
+            reply = (choices[0].get("message") or {}).get("content") or ""
+        history.append({"role": "assistant", "content": reply or "ok"})
+
+
+def sessions_scenario(client: LoadClient, user: int, turns: int) -> None:
+    """会话接口：写入消息、分页读取、列出会话，最后删除会话"""
+    session_id = client.create_session()
+    if session_id is None:
+        return
+    for turn in range(turns):
+        client.call("add_message", "POST", f"/v1/sessions/{session_id}/messages", json={
+            "role": "user", "type": "message", "content": _prompt(user, turn),
+        })
+        client.call("get_messages", "GET", f"/v1/sessions/{session_id}/messages", params={"limit": 20})
+        client.call("list_sessions", "GET", "/v1/sessions", params={"limit": 20})
+    client.call("delete_session", "DELETE", f"/v1/sessions/{session_id}")
+
+
+SCENARIOS: Dict[str, Callable[[LoadClient, int, int], None]] = {
+    "chat": chat_scenario,
+    "chat_stream": partial(chat_scenario, stream=True),
+    "chat_code": partial(chat_scenario, run_code=True),
+    "completions": openai_scenario,
+    "completions_stream": partial(openai_scenario, stream=True),
+    "sessions": sessions_scenario,
+}
+
+
+def run_scenario(base_url: str, scenario: Callable[[LoadClient, int, int], None],
+                 sessions: int, turns: int) -> Dict[str, Any]:
+    """并发运行 sessions 个用户，每个用户执行一次场景"""
+    clients = [LoadClient(base_url) for _ in range(sessions)]
+    with MemorySampler() as memory:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            list(executor.map(lambda user: scenario(clients[user], user, turns), range(sessions)))
+        duration = time.perf_counter() - started
+    for client in clients:
+        client.close()
+    summary = summarize([sample for client in clients for sample in client.samples], duration)
+    summary["memory"] = memory.summary()
+    return summary
+
+
+def build_app_config(sessions: int, storage_path: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """压测用的应用配置：关闭限流，实例上限与并发用户数一致"""
+    config = {
+        "LOG_LEVEL": "WARNING",
+        "RATE_LIMIT": 0,
+        "SESSION_RATE_LIMIT": 0,
+        "MAX_ACTIVE_INSTANCES": sessions,
+        "ADMISSION_MAX_ACTIVE_TURNS": sessions,
+        "INTERPRETER_POOL_WARM_KERNEL": False,
+        "SESSION_STORAGE_PATH": storage_path,
+    }
+    config.update(overrides or {})
+    # 替身只能安装到之后创建的实例上，见 install_fakes_on_app
+    config["INTERPRETER_POOL_SIZE"] = 0
+    return config
+
+
+def run_load_test(
+    scenarios: Iterable[str] = tuple(SCENARIOS),
+    sessions: int = 4,
+    turns: int = 3,
+    llm: Optional[FakeLLM] = None,
+    runner: Optional[FakeCodeRunner] = None,
+    config: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    启动服务器并依次运行场景
+
+    Args:
+        scenarios: SCENARIOS 中的场景名称
+        sessions: 并发用户（会话）数
+        turns: 每个会话的对话轮数
+        config: 覆盖默认压测配置的应用配置项
+
+    Returns:
+        JSON 可序列化的报告
+    """
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+    llm = llm or FakeLLM()
+    runner = runner or FakeCodeRunner()
+
+    with tempfile.TemporaryDirectory(prefix="oi-load-") as workdir:
+        app_config = build_app_config(sessions, os.path.join(workdir, "sessions"), config)
+        app = create_app(app_config)
+        install_fakes_on_app(app, llm, runner, history_path=os.path.join(workdir, "history"))
+
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietRequestHandler)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "parameters": {
+                "sessions": sessions,
+                "turns": turns,
+                "tokens_per_second": llm.tokens_per_second,
+                "first_token_latency": llm.first_token_latency,
+                "code_delay": runner.delay,
+                "storage_backend": app.config.get("SESSION_STORAGE_BACKEND"),
+                "config": {key: value for key, value in (config or {}).items()},
+            },
+            "scenarios": {},
+        }
+        try:
+            for name in scenarios:
+                report["scenarios"][name] = run_scenario(base_url, SCENARIOS[name], sessions, turns)
+        finally:
+            server.shutdown()
+            server_thread.join()
+            app.session_manager.close()
+        report["llm_calls"] = llm.calls
+        report["code_runs"] = runner.calls
+        return report
+
+
+def _parse_config(items: List[str]) -> Dict[str, Any]:
+    config = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the Open Interpreter HTTP server with stub LLM and code runner")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated scenarios ({', '.join(SCENARIOS)})")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="fake LLM streaming rate, 0 for unthrottled")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="fake LLM delay before the first token (s)")
+    parser.add_argument("--code-delay", type=float, default=0.05, help="fake code execution time (s)")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="app config override, value parsed as JSON when possible")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        scenarios=[name.strip() for name in args.scenarios.split(",") if name.strip()],
+        sessions=args.sessions,
+        turns=args.turns,
+        llm=FakeLLM(tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency),
+        runner=FakeCodeRunner(delay=args.code_delay),
+        config=_parse_config(args.config),
+    )
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    errors = sum(scenario["errors"] for scenario in report["scenarios"].values())
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
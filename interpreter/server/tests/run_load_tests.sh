@@ -0,0 +1,14 @@
+#!/bin/bash
+
+echo "Starting load tests..."
+
+# The harness starts its own server with a stub LLM and code runner,
+# so no running server or API key is needed.
+# Extra arguments are passed through, e.g. --sessions 16 --turns 5
+OUTPUT=${LOAD_TEST_OUTPUT:-load-test-report.json}
+
+python -m interpreter.server.tests.load.harness --output "$OUTPUT" "$@"
+STATUS=$?
+
+echo "Load test report written to $OUTPUT"
+exit $STATUS
@@ -0,0 +1,113 @@
+"""
+Per-request phase timing for Open Interpreter HTTP Server
+
+每个请求在 flask.g 上记录一条阶段时间线（排队、加载历史、获取解释器、LLM、代码
+执行、持久化等），以 Server-Timing 响应头返回；超过阈值的慢请求保存在环形缓冲区中
+供查询。
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import g, has_request_context
+
+
+class RequestTimeline:
+    """一次请求的阶段耗时（同名阶段累加）"""
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.phases: "OrderedDict[str, float]" = OrderedDict()
+        self.total: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self) -> float:
+        """请求结束，固定总耗时"""
+        if self.total is None:
+            self.total = self.elapsed()
+        return self.total
+
+    def header(self) -> str:
+        """Server-Timing 响应头"""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={(self.total or self.elapsed()) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "total_ms": round((self.total or self.elapsed()) * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        }
+
+
+class SlowRequestLog:
+    """保存最近的慢请求时间线的环形缓冲区"""
+
+    def __init__(self, size: int = 100, threshold: float = 1.0):
+        """
+        Args:
+            size: 最多保存的请求数
+            threshold: 慢请求阈值（秒）
+        """
+        self.threshold = threshold
+        self._entries: deque = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+
+    def record(self, timeline: RequestTimeline) -> None:
+        if timeline.finish() >= self.threshold:
+            with self._lock:
+                self._entries.append(timeline.to_dict())
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按耗时从高到低返回"""
+        with self._lock:
+            entries = sorted(self._entries, key=lambda entry: entry["total_ms"], reverse=True)
+        return entries[:limit] if limit else entries
+
+
+def current_timeline() -> Optional[RequestTimeline]:
+    """当前请求的时间线；不在请求中时返回 None"""
+    if not has_request_context():
+        return None
+    return g.get("timeline")
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """把耗时计入当前请求的阶段（不在请求中时忽略）"""
+    timeline = current_timeline()
+    if timeline is not None:
+        timeline.add(name, seconds)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """记录代码块在当前请求中的耗时"""
+    timeline = current_timeline()
+    if timeline is None:
+        yield
+        return
+    with timeline.phase(name):
+        yield
@@ -2,13 +2,17 @@
 This file handles conversations.
 """
 
-import json
 import os
 import platform
 import subprocess
 
 import inquirer
 
+from ..core.utils.conversation_history import (
+    conversation_name,
+    is_conversation_file,
+    load_conversation,
+)
 from .render_past_conversation import render_past_conversation
 from .utils.local_storage_path import get_storage_path
 
@@ -30,9 +34,9 @@ def conversation_navigator(interpreter):
         print(f"No conversations found in {conversations_dir}")
         return None
 
-    # Get list of all JSON files in the directory and sort them by modification time, newest first
+    # Get list of all conversation files (.history.jsonl, or .json from older versions) and sort them by modification time, newest first
     json_files = sorted(
-        [f for f in os.listdir(conversations_dir) if f.endswith(".json")],
+        [f for f in os.listdir(conversations_dir) if is_conversation_file(f)],
         key=lambda x: os.path.getmtime(os.path.join(conversations_dir, x)),
         reverse=True,
     )
@@ -41,8 +45,7 @@ def conversation_navigator(interpreter):
     readable_names_and_filenames = {}
     for filename in json_files:
         name = (
-            filename.replace(".json", "")
-            .replace(".JSON", "")
+            conversation_name(filename)
             .replace("__", "... (")
             .replace("_", " ")
             + ")"
@@ -76,9 +79,11 @@ def conversation_navigator(interpreter):
 
     selected_filename = readable_names_and_filenames[answers["name"]]
 
-    # Open the selected file and load the JSON data
-    with open(os.path.join(conversations_dir, selected_filename), "r") as f:
-        messages = json.load(f)
+    # Open the selected file and load the messages
+    messages = load_conversation(os.path.join(conversations_dir, selected_filename))
+    if messages is None:
+        print(f"{selected_filename} is not a conversation file")
+        return None
 
     # Pass the data into render_past_conversation
     render_past_conversation(messages)
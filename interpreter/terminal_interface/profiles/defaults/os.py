@@ -59,6 +59,7 @@ computer.clipboard.view() # Returns contents of clipboard
 computer.os.get_selected_text() # Use frequently. If editing text, the user often wants this
 
 {{
+# cache: forever
 import platform
 if platform.system() == 'Darwin':
         print('''
@@ -108,6 +109,7 @@ Include `computer.display.view()` after a 2 second delay at the end of _every_ c
 6. What options could you take next to get closer to your goal?
 
 {{
+# cache: step
 # Add window information
 
 try:
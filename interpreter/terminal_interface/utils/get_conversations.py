@@ -1,9 +1,10 @@
 import os
 
+from ...core.utils.conversation_history import is_conversation_file
 from .local_storage_path import get_storage_path
 
 
 def get_conversations():
     conversations_dir = get_storage_path("conversations")
-    json_files = [f for f in os.listdir(conversations_dir) if f.endswith(".json")]
+    json_files = [f for f in os.listdir(conversations_dir) if is_conversation_file(f)]
     return json_files
@@ -0,0 +1,184 @@
+import json
+import threading
+
+import interpreter.core.core as core
+from interpreter import OpenInterpreter
+from interpreter.core.utils.conversation_history import (
+    ConversationHistoryWriter,
+    is_conversation_file,
+    load_conversation,
+)
+from interpreter.server.session import SessionManager
+from interpreter.terminal_interface.contributing_conversations import (
+    get_all_conversations,
+)
+
+
+def message(content, role="user"):
+    return {"role": role, "type": "message", "content": content}
+
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line)["op"] for line in f]
+
+
+def test_only_new_messages_are_appended(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path)
+    messages = [message("hi"), message("hello", "assistant")]
+    writer.save(messages)
+    messages += [message("again"), message("sure", "assistant")]
+    writer.save(messages)
+    writer.save(messages)
+
+    assert records(path) == ["snapshot", "message", "message"]
+    assert load_conversation(path) == messages
+
+
+def test_edits_and_truncation_are_replayed(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path)
+    messages = [message(str(i)) for i in range(10)]
+    writer.save(messages)
+
+    messages[2]["content"] = "edited"
+    del messages[8:]
+    writer.save(messages)
+
+    assert records(path) == ["snapshot", "update", "truncate"]
+    assert load_conversation(path) == messages
+
+
+def test_compacts_after_many_edits(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path, compact_threshold=3)
+    messages = [message(str(i)) for i in range(10)]
+    writer.save(messages)
+    for i in range(4):
+        messages[i]["content"] += "!"
+        writer.save(messages)
+
+    assert records(path) == ["snapshot"]
+    assert load_conversation(path) == messages
+
+
+def test_replaced_but_equal_messages_are_not_rewritten(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path)
+    messages = [message("hi"), message("hello", "assistant")]
+    writer.save(messages)
+    writer.save(json.loads(json.dumps(messages)) + [message("more")])
+    assert records(path) == ["snapshot", "message"]
+
+
+def test_background_writes(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path, background=True)
+    messages = []
+    for i in range(20):
+        messages.append(message(str(i)))
+        writer.save(messages)
+    writer.close()
+    assert load_conversation(path) == messages
+
+
+def test_background_writes_what_was_saved(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path, background=True)
+    release = threading.Event()
+    write = writer._write
+
+    def slow_write(lines):
+        release.wait()
+        write(lines)
+
+    writer._write = slow_write
+    messages = [message("hi"), message("partial", "assistant")]
+    writer.save(messages)
+    # Still streaming on the main thread while the worker is behind
+    messages[1]["content"] += " and more"
+    messages.append(message("next"))
+    release.set()
+    writer.flush()
+    assert load_conversation(path) == [message("hi"), message("partial", "assistant")]
+
+    writer.save(messages)
+    writer.close()
+    assert load_conversation(path) == messages
+
+
+def test_background_failure_starts_over_from_a_snapshot(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path, background=True)
+    write = writer._write
+    failures = [True]
+
+    def flaky_write(lines):
+        if failures.pop(0) if failures else False:
+            raise OSError("disk full")
+        write(lines)
+
+    writer._write = flaky_write
+    messages = [message("hi")]
+    writer.save(messages)
+    writer.flush()
+    messages.append(message("again"))
+    writer.save(messages)
+    writer.close()
+
+    assert records(path) == ["snapshot"]
+    assert load_conversation(path) == messages
+
+
+def test_interrupted_write_is_ignored(tmp_path):
+    path = str(tmp_path / "chat.history.jsonl")
+    writer = ConversationHistoryWriter(path)
+    writer.save([message("hi")])
+    with open(path, "a") as f:
+        f.write('{"op": "message", "mess')
+    assert load_conversation(path) == [message("hi")]
+
+
+def test_chat_moves_legacy_json_history(tmp_path, monkeypatch):
+    def fake_respond(interpreter):
+        yield {"role": "assistant", "type": "message", "content": "Hello!"}
+
+    monkeypatch.setattr(core, "respond", fake_respond)
+    legacy = tmp_path / "hi_there__January_01_2024_00-00-00.json"
+    legacy.write_text(json.dumps([message("earlier"), message("reply", "assistant")]))
+
+    interpreter = OpenInterpreter(conversation_history_path=str(tmp_path))
+    interpreter.messages = load_conversation(str(legacy))
+    interpreter.conversation_filename = legacy.name
+    interpreter.chat("hi there", display=False)
+    interpreter.chat("and again", display=False)
+
+    assert not legacy.exists()
+    assert interpreter.conversation_filename.endswith(".history.jsonl")
+    path = str(tmp_path / interpreter.conversation_filename)
+    assert records(path) == ["snapshot", "message", "message"]
+    assert load_conversation(path) == interpreter.messages
+    assert len(interpreter.messages) == 6
+
+
+def test_server_journals_and_cli_history_share_a_directory(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session()["session_id"]
+    manager.add_message(session_id, message("from the server"))
+    manager.store.close()
+
+    history = tmp_path / "hi__January_01_2024_00-00-00.history.jsonl"
+    ConversationHistoryWriter(str(history)).save([message("from the cli")])
+
+    assert not is_conversation_file(f"{session_id}.jsonl")
+    assert load_conversation(str(tmp_path / f"{session_id}.jsonl")) is None
+    interpreter = OpenInterpreter(conversation_history_path=str(tmp_path))
+    conversations = get_all_conversations(interpreter)
+    assert [[m["content"] for m in c] for c in conversations] == [["from the cli"]]
+
+    # The server still imports CLI conversations as sessions
+    manager = SessionManager(storage_path=str(tmp_path))
+    imported = manager.get_session("hi__January_01_2024_00-00-00")
+    assert [m["content"] for m in imported["messages"]] == ["from the cli"]
+    assert manager.get_session(session_id)["messages"][0]["content"] == "from the server"
@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from interpreter.core.llm.utils import convert_to_openai_messages as conversion
+from interpreter.core.llm.utils.convert_to_openai_messages import (
+    ConversionCache,
+    convert_to_openai_messages,
+)
+
+
+def make_interpreter(**overrides):
+    settings = dict(
+        user_message_template="<{content}>",
+        always_apply_user_message_template=False,
+        code_output_template="Output: {content}",
+        empty_code_output_template="No output",
+        code_output_sender="user",
+        debug=False,
+    )
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def conversation():
+    return [
+        {"role": "system", "type": "message", "content": "system"},
+        {"role": "user", "type": "message", "content": "hi"},
+        {"role": "assistant", "type": "code", "format": "python", "content": "print(1)"},
+        {"role": "computer", "type": "console", "format": "output", "content": "1"},
+        {"role": "user", "type": "message", "content": "hi"},
+    ]
+
+
+def test_same_result_with_and_without_cache():
+    interpreter = make_interpreter()
+    messages = conversation()
+    for function_calling in (True, False):
+        expected = convert_to_openai_messages(
+            messages, function_calling=function_calling, interpreter=interpreter
+        )
+        cache = ConversionCache()
+        for _ in range(2):
+            assert (
+                convert_to_openai_messages(
+                    messages,
+                    function_calling=function_calling,
+                    interpreter=interpreter,
+                    cache=cache,
+                )
+                == expected
+            )
+
+
+def test_only_new_or_changed_messages_are_converted():
+    interpreter = make_interpreter()
+    messages = conversation()
+    cache = ConversionCache()
+    convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+
+    with patch.object(conversion, "convert_message", wraps=conversion.convert_message) as convert:
+        messages[3]["content"] += "\n2"
+        messages.append({"role": "assistant", "type": "message", "content": "done"})
+        converted = convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+
+    assert [call.args[0] for call in convert.call_args_list] == [messages[3], messages[5]]
+    assert converted[3]["content"] == "1\n2"
+    assert cache.hits == 4
+
+
+def test_template_moves_to_the_new_last_user_message():
+    interpreter = make_interpreter()
+    messages = [{"role": "user", "type": "message", "content": "first"}]
+    cache = ConversionCache()
+    assert convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)[0]["content"] == "<first>"
+
+    messages.append({"role": "user", "type": "message", "content": "second"})
+    converted = convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+    assert [m["content"] for m in converted] == ["first", "<second>"]
+
+
+def test_callers_cannot_change_cached_results():
+    interpreter = make_interpreter()
+    messages = conversation()
+    cache = ConversionCache()
+    convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)[0]["content"] += "!"
+    assert convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)[0]["content"] == "system"
+
+
+def test_callers_cannot_change_cached_nested_content():
+    interpreter = make_interpreter()
+    messages = [
+        {"role": "user", "type": "message", "content": "look"},
+        {"role": "assistant", "type": "code", "format": "python", "content": "print(1)"},
+    ]
+    cache = ConversionCache()
+    converted = convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+    converted[1]["function_call"]["arguments"] = "changed"
+    again = convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+    assert again[1]["function_call"] != converted[1]["function_call"]
+    assert cache.hits == 2
+
+
+def test_template_applies_to_the_last_user_message_only():
+    interpreter = make_interpreter()
+    messages = [
+        {"role": "user", "type": "message", "content": "same"},
+        {"role": "assistant", "type": "message", "content": "ok"},
+        {"role": "user", "type": "message", "content": "same"},
+    ]
+    converted = convert_to_openai_messages(messages, interpreter=interpreter)
+    assert [m["content"] for m in converted] == ["same", "ok", "<same>"]
+
+
+def test_removed_messages_are_dropped():
+    interpreter = make_interpreter()
+    messages = conversation()
+    cache = ConversionCache()
+    convert_to_openai_messages(messages, interpreter=interpreter, cache=cache)
+    convert_to_openai_messages(messages[-2:], interpreter=interpreter, cache=cache)
+    assert len(cache) == 2
@@ -0,0 +1,205 @@
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from interpreter.core.llm.cache import (
+    DiskResponseCache,
+    MemoryResponseCache,
+    cache_key,
+    is_cacheable,
+)
+from interpreter import OpenInterpreter
+from interpreter.core.llm import llm as llm_module
+from interpreter.core.llm.llm import Llm
+from interpreter.core.llm.run_text_llm import run_text_llm
+from interpreter.core.llm.run_tool_calling_llm import run_tool_calling_llm
+
+
+def chunk(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+class CountingCompletions:
+    def __init__(self, contents):
+        self.contents = contents
+        self.calls = 0
+
+    def __call__(self, **params):
+        self.calls += 1
+        for content in self.contents:
+            yield chunk(content)
+
+
+def make_llm(contents, cache):
+    computer = SimpleNamespace(vision=SimpleNamespace(query=None))
+    llm = Llm(SimpleNamespace(verbose=False, os=False, computer=computer))
+    llm.completions = CountingCompletions(contents)
+    llm.cache = cache
+    return llm
+
+
+def params(content="hi", **extra):
+    params = dict(
+        model="gpt-4o",
+        stream=True,
+        temperature=0,
+        messages=[{"role": "user", "content": content}],
+    )
+    params.update(extra)
+    return params
+
+
+def test_cache_key_ignores_credentials_and_priority():
+    assert cache_key(params(api_key="a", priority=1)) == cache_key(params(api_key="b"))
+    assert cache_key(params()) != cache_key(params("other"))
+    assert cache_key(params()) != cache_key(params(max_tokens=10))
+
+
+def test_hit_replays_the_same_chunks():
+    llm = make_llm(["Hel", "lo"], MemoryResponseCache())
+    first = list(llm.stream_completions(**params()))
+    second = list(llm.stream_completions(**params()))
+    assert second == first
+    assert llm.completions.calls == 1
+    assert llm.cache.stats()["hits"] == 1
+
+
+def test_sampled_requests_are_not_cached():
+    llm = make_llm(["Hello"], MemoryResponseCache())
+    list(llm.stream_completions(**params(temperature=0.7)))
+    list(llm.stream_completions(**params(temperature=0.7)))
+    assert llm.completions.calls == 2
+    assert len(llm.cache) == 0
+
+
+def test_requests_without_a_temperature_are_not_cached():
+    # The provider's default sampling applies, which usually isn't deterministic
+    request = params()
+    del request["temperature"]
+    assert not is_cacheable(request)
+    assert is_cacheable(params(temperature=0))
+    assert is_cacheable(params(temperature=0.0))
+
+    llm = make_llm(["Hello"], MemoryResponseCache())
+    list(llm.stream_completions(**request))
+    list(llm.stream_completions(**request))
+    assert llm.completions.calls == 2
+    assert len(llm.cache) == 0
+
+
+def test_abandoned_stream_is_not_stored():
+    llm = make_llm(["a", "b", "c"], MemoryResponseCache())
+    stream = llm.stream_completions(**params())
+    next(stream)
+    del stream
+    assert len(llm.cache) == 0
+
+
+def test_text_llm_stores_response_ending_at_code_block():
+    contents = ["Run:\n```python\n", "print(1)\n", "```", " ignored"]
+    llm = make_llm(contents, MemoryResponseCache())
+    llm.execution_instructions = None
+
+    first = list(run_text_llm(llm, params()))
+    second = list(run_text_llm(llm, params()))
+    assert second == first
+    assert llm.completions.calls == 1
+
+
+def test_memory_cache_evicts_least_recently_used_and_expired():
+    cache = MemoryResponseCache(max_entries=2, ttl=0.1)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.get("a")
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1]
+    time.sleep(0.15)
+    assert cache.get("c") is None
+
+
+def test_disk_cache_persists_and_evicts(tmp_path):
+    cache = DiskResponseCache(str(tmp_path), max_entries=2)
+    cache.put("a", [chunk("x")])
+    time.sleep(0.01)
+    cache.put("b", [chunk("y")])
+    assert DiskResponseCache(str(tmp_path)).get("a") == [chunk("x")]
+
+    time.sleep(0.01)
+    cache.put("c", [chunk("z")])
+    # "a" was read after "b" was written, so "b" is the oldest
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert len(cache) == 2
+
+
+def test_disk_cache_ttl(tmp_path):
+    cache = DiskResponseCache(str(tmp_path), ttl=0.05)
+    cache.put("a", [1])
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def sent_params(cache, temperature=0):
+    sent = []
+
+    def fake_run_text_llm(llm, params):
+        sent.append(params)
+        yield from ()
+
+    interpreter = OpenInterpreter()
+    llm = interpreter.llm
+    llm._is_loaded = True
+    llm.supports_functions = False
+    llm.supports_vision = False
+    llm.context_window, llm.max_tokens = 8000, 100
+    llm.temperature = temperature
+    llm.cache = cache
+    messages = [
+        {"role": "system", "type": "message", "content": "system"},
+        {"role": "user", "type": "message", "content": "hi"},
+    ]
+    with patch.object(llm_module, "run_text_llm", fake_run_text_llm):
+        list(llm.run(messages))
+    return sent[0]
+
+
+def test_temperature_is_only_sent_for_the_cache_or_when_set():
+    # Without a cache the provider's default applies, as it always has
+    assert "temperature" not in sent_params(None)
+    assert sent_params(None, temperature=0.5)["temperature"] == 0.5
+    # A cache opts in to deterministic requests
+    assert sent_params(MemoryResponseCache())["temperature"] == 0
+    assert is_cacheable(sent_params(MemoryResponseCache()))
+
+
+def test_judge_review_survives_a_cache_hit():
+    arguments = '{"language": "python", "code": "print(1)"}'
+    contents = [
+        {"tool_calls": [{"function": {"name": "execute", "arguments": arguments}}]},
+        {"content": "<safe>"},
+        {"content": "Looks fine"},
+        {"content": "</safe>"},
+    ]
+    llm = make_llm([], MemoryResponseCache())
+    llm.completions = lambda **params: iter({"choices": [{"delta": dict(d)}]} for d in contents)
+    llm.interpreter.computer.terminal = SimpleNamespace(languages=[])
+
+    first = list(run_tool_calling_llm(llm, params()))
+    second = list(run_tool_calling_llm(llm, params()))
+    assert llm.cache.stats()["hits"] == 1
+    assert second == first
+    assert any(chunk["type"] == "review" and chunk["format"] == "safe" for chunk in second)
+
+
+def test_disk_cache_stores_json(tmp_path):
+    cache = DiskResponseCache(str(tmp_path))
+    cache.put("a", [chunk("x")])
+    with open(tmp_path / "a.json") as f:
+        assert json.load(f)["chunks"] == [chunk("x")]
+    # Entries that aren't valid JSON are discarded, never executed
+    (tmp_path / "b.json").write_bytes(b"\x80\x04K\x01.")
+    assert cache.get("b") is None
+    assert not (tmp_path / "b.json").exists()
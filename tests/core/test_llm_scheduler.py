@@ -0,0 +1,91 @@
+import threading
+import time
+
+from interpreter.core.llm import llm as llm_module
+from interpreter.core.llm.scheduler import LlmScheduler, estimate_tokens
+
+
+def test_unlimited_models_pass_through():
+    scheduler = LlmScheduler()
+    assert scheduler.acquire("gpt-4o", 100) == 0.0
+    assert scheduler.stats()["requests"] == 1
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_requests_per_minute_budget():
+    scheduler = LlmScheduler()
+    scheduler.WINDOW = 0.2
+    scheduler.configure("gpt-4o", rpm=2)
+    assert scheduler.acquire("gpt-4o") == 0.0
+    assert scheduler.acquire("gpt-4o") == 0.0
+    # The third request waits for the first one to leave the window
+    assert scheduler.acquire("gpt-4o") > 0.1
+    # Other models are not affected
+    assert scheduler.acquire("claude-3-5-sonnet-20240620") == 0.0
+
+
+def test_tokens_per_minute_budget():
+    scheduler = LlmScheduler()
+    scheduler.WINDOW = 0.2
+    scheduler.configure("default", tpm=1000)
+    assert scheduler.acquire("gpt-4o", 800) == 0.0
+    assert scheduler.acquire("gpt-4o", 800) > 0.1
+    # A request larger than the budget still runs once the window is empty
+    time.sleep(0.25)
+    assert scheduler.acquire("gpt-4o", 5000) == 0.0
+
+
+def test_priority_order():
+    scheduler = LlmScheduler()
+    scheduler.WINDOW = 0.3
+    scheduler.configure("gpt-4o", rpm=1)
+    scheduler.acquire("gpt-4o")
+
+    order = []
+
+    def call(name, priority):
+        scheduler.acquire("gpt-4o", priority=priority)
+        order.append(name)
+
+    low = threading.Thread(target=call, args=("low", 5))
+    low.start()
+    while scheduler.stats()["queue_depth"] < 1:
+        time.sleep(0.01)
+    high = threading.Thread(target=call, args=("high", 0))
+    high.start()
+    low.join(timeout=5)
+    high.join(timeout=5)
+    assert order == ["high", "low"]
+
+
+def test_rate_limit_backoff():
+    scheduler = LlmScheduler()
+    delay = scheduler.report_rate_limited("gpt-4o", retry_after=0.2)
+    assert delay == 0.2
+    assert scheduler.acquire("gpt-4o") > 0.1
+    assert scheduler.stats()["rate_limited"] == 1
+
+    scheduler.report_success("gpt-4o")
+    first = scheduler.report_rate_limited("gpt-4o")
+    second = scheduler.report_rate_limited("gpt-4o")
+    assert 0.5 <= first <= 1 and 1 <= second <= 2
+
+
+def test_estimate_tokens():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [{"type": "text", "text": "y" * 40}]},
+    ]
+    assert estimate_tokens(messages) == 100 + 10 + 8
+
+
+def test_completions_reserve_the_trimmers_token_count(monkeypatch):
+    reserved = []
+    monkeypatch.setattr(llm_module.scheduler, "acquire", lambda model, tokens, priority: reserved.append(tokens))
+    monkeypatch.setattr(llm_module.litellm, "completion", lambda **params: iter(["chunk"]))
+    messages = [{"role": "user", "content": "x" * 400}]
+
+    list(llm_module.fixed_litellm_completions(model="gpt-4o", messages=messages, max_tokens=50, prompt_tokens=300))
+    # Without a count from the trimmer, fall back to the estimate
+    list(llm_module.fixed_litellm_completions(model="gpt-4o", messages=messages, max_tokens=50))
+    assert reserved == [350, estimate_tokens(messages) + 50]
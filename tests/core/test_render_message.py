@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+from interpreter.core.render_message import SystemMessageRenderer, block_policy
+
+
+class FakeComputer:
+    def __init__(self):
+        self.save_skills = True
+        self.import_computer_api = False
+        self.system_message = "COMPUTER API"
+        self.terminal = SimpleNamespace(languages=[SimpleNamespace(system_message="PY")])
+        self.runs = []
+
+    def run(self, language, code, display=False):
+        self.runs.append(code)
+        assert self.save_skills is False
+        return [{"type": "console", "format": "output", "content": str(len(self.runs))}]
+
+
+def make_interpreter(system_message):
+    return SimpleNamespace(
+        system_message=system_message,
+        custom_instructions="",
+        verbose=False,
+        computer=FakeComputer(),
+    )
+
+
+def test_block_policy_directive():
+    assert block_policy("print(1)", "turn") == "turn"
+    assert block_policy("# cache: step\nprint(1)", "turn") == "step"
+    assert block_policy("# cache: 30\nprint(1)", "turn") == 30.0
+    assert block_policy("# cache: bogus\nprint(1)", "turn") == "turn"
+
+
+def test_static_message_never_runs_code():
+    interpreter = make_interpreter("Hello")
+    renderer = SystemMessageRenderer()
+    assert renderer.render(interpreter) == "Hello\n\nPY"
+    assert renderer.render(interpreter) == "Hello\n\nPY"
+    assert interpreter.computer.runs == []
+    assert renderer.stats()["template_hits"] == 1
+
+
+def test_blocks_run_once_per_turn():
+    interpreter = make_interpreter("Now: {{print('x')}}")
+    renderer = SystemMessageRenderer()
+    renderer.begin_turn()
+    assert renderer.render(interpreter) == "Now: 1\n\nPY"
+    assert renderer.render(interpreter) == "Now: 1\n\nPY"
+    renderer.begin_turn()
+    assert renderer.render(interpreter) == "Now: 2\n\nPY"
+    assert renderer.stats()["hits"] == 1
+    assert renderer.stats()["misses"] == 2
+    assert interpreter.computer.save_skills is True
+
+
+def test_step_blocks_run_every_time():
+    interpreter = make_interpreter("{{# cache: step\nprint('x')}} {{print('y')}}")
+    renderer = SystemMessageRenderer()
+    renderer.render(interpreter)
+    renderer.render(interpreter)
+    assert len(interpreter.computer.runs) == 3
+
+
+def test_changed_inputs_rebuild_the_template():
+    interpreter = make_interpreter("A")
+    renderer = SystemMessageRenderer()
+    renderer.render(interpreter)
+    interpreter.custom_instructions = "Be brief"
+    interpreter.computer.import_computer_api = True
+    assert renderer.render(interpreter) == "A\n\nPY\n\nBe brief\n\nCOMPUTER API"
+    assert renderer.stats()["template_misses"] == 2
@@ -0,0 +1,118 @@
+import copy
+import random
+
+import pytest
+import tokentrim
+import tokentrim.tokentrim
+
+from interpreter.core.llm.utils.token_trimmer import TokenTrimmer
+
+
+class FourCharEncoding:
+    """Offline stand-in for tiktoken: one token per four characters"""
+
+    def encode(self, text):
+        return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    monkeypatch.setattr(tokentrim.tokentrim, "get_encoding", lambda model: FourCharEncoding())
+
+
+def history(seed, length=40):
+    rnd = random.Random(seed)
+    messages = []
+    for i in range(length):
+        if rnd.random() < 0.2:
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": "",
+                    "function_call": {"name": "execute", "arguments": "x" * rnd.randint(1, 200)},
+                }
+            )
+        else:
+            role = rnd.choice(["user", "assistant"])
+            messages.append({"role": role, "content": f"{i} " + "word " * rnd.randint(1, 300)})
+    return messages
+
+
+def test_matches_tokentrim():
+    for seed in range(10):
+        messages = history(seed)
+        system_message = "You are helpful. " * random.Random(seed).randint(1, 40)
+        for max_tokens in (50, 400, 2000, 100000):
+            expected = tokentrim.trim(
+                copy.deepcopy(messages), system_message=system_message, max_tokens=max_tokens
+            )
+            trimmer = TokenTrimmer()
+            assert trimmer.trim(messages, system_message=system_message, max_tokens=max_tokens) == expected
+            assert trimmer.last_total == tokentrim.tokentrim.num_tokens_from_messages(expected, None)
+            # And again from cached counts
+            assert trimmer.trim(messages, system_message=system_message, max_tokens=max_tokens) == expected
+
+
+def test_only_new_messages_are_tokenized():
+    counted = []
+
+    def count_tokens(message, model):
+        counted.append(message["content"])
+        return len(message["content"])
+
+    trimmer = TokenTrimmer(count_tokens=count_tokens)
+    messages = [{"role": "user", "content": f"message {i}"} for i in range(100)]
+    trimmer.trim(messages, system_message="system", max_tokens=10**6)
+    assert len(counted) == 101
+
+    counted.clear()
+    messages = messages + [{"role": "assistant", "content": "new"}]
+    trimmer.trim(messages, system_message="system", max_tokens=10**6)
+    assert counted == ["new"]
+
+
+def test_image_messages_are_keyed_without_stringifying_them():
+    counted = []
+
+    def count_tokens(message, model):
+        counted.append(message)
+        return 10
+
+    image = "data:image/png;base64," + "A" * 100000
+    message = {
+        "role": "user",
+        "content": [{"type": "image_url", "image_url": {"url": image}}, {"type": "text", "text": "what's this?"}],
+    }
+    trimmer = TokenTrimmer(count_tokens=count_tokens)
+    trimmer.trim([message], max_tokens=1000)
+    # Every LLM call converts the history into new dicts with the same strings
+    trimmer.trim([copy.deepcopy(message)], max_tokens=1000)
+    assert len(counted) == 1
+    assert any(image is part for part in _strings(next(iter(trimmer._counts))))
+
+
+def _strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, tuple):
+        for item in value:
+            yield from _strings(item)
+
+
+def test_does_not_change_the_callers_messages():
+    messages = [{"role": "user", "content": "word " * 500}, {"role": "user", "content": "short"}]
+    original = copy.deepcopy(messages)
+    trimmed = TokenTrimmer().trim(messages, max_tokens=100)
+    assert messages == original
+    assert trimmed[-1] == original[-1]
+    assert len(trimmed[0]["content"]) < len(original[0]["content"])
+
+
+def test_counts_for_old_messages_are_pruned():
+    trimmer = TokenTrimmer(count_tokens=lambda message, model: 1)
+    for i in range(200):
+        trimmer.trim([{"role": "user", "content": str(i)}], max_tokens=100)
+    assert len(trimmer) < 20
@@ -0,0 +1,74 @@
+import random
+
+import interpreter.core.core as core
+from interpreter import OpenInterpreter
+from interpreter.core.utils.truncate_output import OutputAccumulator, truncate_output
+
+
+def chunked(data, seed):
+    rnd = random.Random(seed)
+    i = 0
+    while i < len(data):
+        size = rnd.randint(1, 50)
+        yield data[i : i + size]
+        i += size
+
+
+def sample_output(seed, lines=300):
+    rnd = random.Random(seed)
+    words = ["foo", "bar", "errors", "xerror", "42", "Traceback", "ValueError:", "warning", "done"]
+    return "\n".join(
+        " ".join(rnd.choice(words[:5]) if rnd.random() > 0.01 else rnd.choice(words) for _ in range(8))
+        for _ in range(lines)
+    )
+
+
+def test_matches_truncate_output_for_any_chunking():
+    for seed in range(20):
+        data = sample_output(seed, lines=100)
+        for max_output in (100, 2800, 100000):
+            output = OutputAccumulator(max_output, max_error_chars=10**9)
+            seen = ""
+            for chunk in chunked(data, seed):
+                output.append(chunk)
+                seen += chunk
+                assert output.view() == truncate_output(seen, max_output)
+
+
+def test_memory_stays_bounded():
+    output = OutputAccumulator(2800)
+    for i in range(20000):
+        output.append(f"line {i}: an error happened\n")
+    view = output.view()
+    assert len(view) < 3 * 2800
+    assert "line 19999" in view
+    assert len(output._recent) < 10000
+    assert len(output._contexts) < 20
+
+
+def test_spills_full_output(tmp_path):
+    path = tmp_path / "out.txt"
+    output = OutputAccumulator(100, spill_path=str(path))
+    data = "".join(f"{i}\n" for i in range(1000))
+    for chunk in chunked(data, 0):
+        output.append(chunk)
+    assert str(path) in output.view()
+    output.close()
+    assert path.read_text() == data
+
+
+def test_respond_and_store_truncates_incrementally(monkeypatch):
+    lines = [f"line {i}\n" for i in range(2000)]
+
+    def fake_respond(interpreter):
+        yield {"role": "computer", "type": "console", "format": "active_line", "content": 1}
+        for line in lines:
+            yield {"role": "computer", "type": "console", "format": "output", "content": line}
+        yield {"role": "computer", "type": "console", "format": "active_line", "content": None}
+
+    monkeypatch.setattr(core, "respond", fake_respond)
+    interpreter = OpenInterpreter(max_output=500)
+    interpreter.messages = [{"role": "user", "type": "message", "content": "count"}]
+    list(interpreter._respond_and_store())
+
+    assert interpreter.messages[-1]["content"] == truncate_output("".join(lines), 500)
@@ -18,7 +18,8 @@ def app():
         'LOG_LEVEL': 'DEBUG',
         'MAX_ACTIVE_INSTANCES': 3,
         'INSTANCE_TIMEOUT': 300,
-        'CLEANUP_INTERVAL': 60
+        'CLEANUP_INTERVAL': 60,
+        'INTERPRETER_POOL_SIZE': 0
     })
     return app
 
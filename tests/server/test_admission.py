@@ -0,0 +1,89 @@
+import threading
+import time
+
+from interpreter.server.admission import AdmissionController, RateLimiter, TokenBucket
+from interpreter.server.session_queue import SessionTurnQueue
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60, capacity=2)
+    now = bucket.updated
+    assert bucket.take(now)
+    assert bucket.take(now)
+    assert not bucket.take(now)
+    assert bucket.retry_after() > 0
+    assert bucket.take(now + 1.0)
+
+
+def test_rate_limiter_is_per_key():
+    limiter = RateLimiter(2)
+    assert limiter.check('a').allowed
+    assert limiter.check('a').remaining == 0
+    rejected = limiter.check('a')
+    assert not rejected.allowed
+    assert rejected.retry_after > 0
+    assert limiter.check('b').allowed
+    assert RateLimiter(0).check('a').allowed
+
+
+def test_admission_rejects_when_saturated():
+    active = [3]
+    admission = AdmissionController(max_active_turns=3, active_turns=lambda: active[0])
+    assert admission.admit() == 'instances'
+    # 会话已有实例时不受实例上限影响
+    assert admission.admit(needs_instance=False) is None
+    active[0] = 2
+    assert admission.admit() is None
+    assert admission.stats()['rejected'] == 1
+
+
+def test_admission_rejects_immediately_by_default():
+    admission = AdmissionController(max_active_turns=1, active_turns=lambda: 1)
+    started = time.monotonic()
+    assert admission.admit() == 'instances'
+    assert time.monotonic() - started < 0.1
+
+
+def test_admission_wait_is_woken_when_a_turn_ends():
+    queue = SessionTurnQueue()
+    admission = AdmissionController(
+        max_active_turns=1, max_wait=5, active_turns=lambda: len(queue.held)
+    )
+    queue.on_release = admission.notify
+    queue.acquire('busy')
+    threading.Timer(0.05, queue.release, args=('busy',)).start()
+
+    started = time.monotonic()
+    assert admission.admit() is None
+    assert time.monotonic() - started < 1
+    assert admission.stats()['delayed'] == 1
+
+
+def test_client_rate_limit_headers_and_429(app, client):
+    app.rate_limiter = RateLimiter(2)
+    response = client.get('/v1/sessions')
+    assert response.headers['X-RateLimit-Limit'] == '2'
+    client.get('/v1/sessions')
+
+    response = client.get('/v1/sessions')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['error']['code'] == 'rate_limited'
+    # 健康检查不参与限流
+    assert client.get('/v1/health').status_code == 200
+
+
+def test_chat_rejected_with_retry_after_when_saturated(app, client):
+    app.admission.max_active_turns = 1
+    app.admission.max_wait = 0
+    app.session_manager.turn_queue.held.add('other-session')
+    try:
+        response = client.post('/v1/chat', json={
+            'session_id': 'new-session',
+            'messages': [{'role': 'user', 'type': 'message', 'content': 'hi'}]
+        })
+    finally:
+        app.session_manager.turn_queue.held.discard('other-session')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app.admission.retry_after)
+    assert response.get_json()['error']['details']['saturated'] == 'instances'
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import threading
+
+from flask import Flask, Response
+
+from interpreter.server.asgi import WSGIToASGI, create_asgi_app
+
+
+def call_asgi(asgi_app, method, path, body=b'', disconnect_after=None):
+    """驱动 ASGI 应用处理一个请求，返回发送的消息列表"""
+    sent = []
+
+    async def run():
+        requested = False
+        disconnect = asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            chunks = [m for m in sent if m['type'] == 'http.response.body']
+            if disconnect_after is not None and len(chunks) >= disconnect_after:
+                disconnect.set()
+
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(b'content-type', b'application/json')],
+        }
+        await asgi_app(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def test_asgi_serves_flask_routes(app):
+    sent = call_asgi(create_asgi_app(app, max_workers=2), 'GET', '/v1/health')
+    assert sent[0]['status'] == 200
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    assert 'status' in json.loads(body)
+
+
+def test_asgi_streams_chunks_separately():
+    flask_app = Flask(__name__)
+
+    @flask_app.route('/stream')
+    def stream():
+        return Response((f'data: {i}\n\n' for i in range(3)), mimetype='text/event-stream')
+
+    sent = call_asgi(WSGIToASGI(flask_app, max_workers=1), 'GET', '/stream')
+    bodies = [m['body'] for m in sent if m['type'] == 'http.response.body' and m['body']]
+    assert bodies == [b'data: 0\n\n', b'data: 1\n\n', b'data: 2\n\n']
+    assert sent[-1]['more_body'] is False
+
+
+def test_asgi_closes_stream_on_disconnect():
+    flask_app = Flask(__name__)
+    closed = threading.Event()
+    produced = []
+
+    @flask_app.route('/stream')
+    def stream():
+        def generate():
+            try:
+                for i in range(1000):
+                    produced.append(i)
+                    yield f'data: {i}\n\n'
+            finally:
+                closed.set()
+        return Response(generate(), mimetype='text/event-stream')
+
+    call_asgi(WSGIToASGI(flask_app, max_workers=1), 'GET', '/stream', disconnect_after=2)
+    assert closed.is_set()
+    assert len(produced) < 1000
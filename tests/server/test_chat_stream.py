@@ -0,0 +1,42 @@
+import json
+from unittest.mock import MagicMock
+
+
+def make_interpreter(chunks):
+    interpreter = MagicMock()
+    interpreter.messages = []
+    interpreter.chat.side_effect = lambda *args, **kwargs: iter(chunks)
+    return interpreter
+
+
+def parse_events(body):
+    return [line[len('data: '):] for line in body.decode().split('\n\n') if line.startswith('data: ')]
+
+
+def test_chat_stream_returns_sse(app, client):
+    session_id = app.session_manager.create_session()['session_id']
+    chunks = [
+        {'role': 'assistant', 'type': 'message', 'start': True},
+        {'role': 'assistant', 'type': 'message', 'content': 'Hi'},
+        {'role': 'assistant', 'type': 'message', 'end': True},
+    ]
+    app.session_manager.get_interpreter = MagicMock(return_value=make_interpreter(chunks))
+
+    response = client.post('/v1/chat', json={
+        'session_id': session_id,
+        'stream': True,
+        'messages': [{'role': 'user', 'type': 'message', 'content': 'Hello'}]
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = parse_events(response.data)
+    assert events[-1] == '[DONE]'
+    payloads = [json.loads(event) for event in events[:-1]]
+    assert [p.get('content') for p in payloads] == [None, 'Hi', None]
+    assert all('elapsed_ms' in p['timing'] for p in payloads)
+    response.close()
+
+    # 流结束后会话锁已释放
+    assert app.session_manager.acquire_session_lock(session_id, timeout=0.1)
+    app.session_manager.release_session_lock(session_id)
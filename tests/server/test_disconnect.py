@@ -0,0 +1,167 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+from interpreter.server.disconnect import DisconnectMonitor, DisconnectWatcher, TurnGuard
+
+
+class BlockingInterpreter:
+    """对话一直进行到 stop_event 被设置（最多 5 秒）"""
+
+    def __init__(self):
+        self.messages = []
+        self.stop_event = threading.Event()
+        self.stopped = threading.Event()
+        self.computer = MagicMock()
+        self.llm = MagicMock()
+
+    def chat(self, message, stream=False, display=False):
+        self.messages.append({'role': 'user', 'type': 'message', 'content': message})
+        if not stream:
+            self._wait()
+            return []
+        return self._stream()
+
+    def _stream(self):
+        yield {'role': 'assistant', 'type': 'message', 'start': True}
+        self._wait()
+
+    def _wait(self):
+        if self.stop_event.wait(5):
+            self.stopped.set()
+
+
+@pytest.fixture
+def server(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    thread.join()
+
+
+def wait_until(condition, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_watcher_calls_back_once_on_disconnect():
+    state = {'closed': False}
+    calls = []
+    monitor = DisconnectMonitor(interval=0.01)
+    with DisconnectWatcher(lambda: state['closed'], lambda: calls.append(1), monitor) as watcher:
+        time.sleep(0.05)
+        assert not watcher.disconnected
+        state['closed'] = True
+        assert wait_until(lambda: watcher.disconnected, 1)
+        time.sleep(0.05)
+    assert calls == [1]
+
+
+def test_watchers_share_one_polling_thread():
+    monitor = DisconnectMonitor(interval=0.01)
+    closed = set()
+    calls = []
+    threads = threading.active_count()
+    watchers = [
+        DisconnectWatcher(lambda i=i: i in closed, lambda i=i: calls.append(i), monitor)
+        for i in range(20)
+    ]
+    for watcher in watchers:
+        watcher.__enter__()
+    assert threading.active_count() == threads + 1
+    assert len(monitor) == 20
+
+    closed.add(3)
+    assert wait_until(lambda: watchers[3].disconnected, 1)
+    for watcher in watchers:
+        watcher.__exit__(None, None, None)
+    assert calls == [3]
+    assert len(monitor) == 0
+
+
+def test_watcher_without_probe_does_nothing():
+    with DisconnectWatcher(None, lambda: pytest.fail('should not be called')) as watcher:
+        pass
+    assert not watcher.disconnected
+
+
+def test_turn_guard_does_not_cancel_a_finished_turn():
+    calls = []
+    guard = TurnGuard(lambda: calls.append(1))
+    assert guard.finish()
+    guard.cancel()
+    assert calls == [] and not guard.cancelled
+
+    guard = TurnGuard(lambda: calls.append(1))
+    guard.cancel()
+    assert not guard.finish()
+    assert calls == [1] and guard.cancelled
+
+
+def test_cancel_saves_partial_output(app):
+    manager = app.session_manager
+    session_id = manager.create_session()['session_id']
+    interpreter = BlockingInterpreter()
+    interpreter.messages = [
+        {'role': 'user', 'type': 'message', 'content': 'count'},
+        {'role': 'assistant', 'type': 'message', 'content': '1, 2'},
+    ]
+    assert manager.wait_for_turn(session_id) is not None
+    manager.cancel_turn(session_id, interpreter, 0, {'role': 'user', 'type': 'message', 'content': 'count'})
+
+    assert [m['content'] for m in manager.get_messages(session_id)] == ['count', '1, 2']
+    assert session_id not in manager.turn_queue.held
+    assert interpreter.stop_event.is_set()
+    # 中止后实例才停下，已保存的消息不会被再次写入
+    manager.record_turn(session_id, interpreter, 0)
+    assert len(manager.get_messages(session_id)) == 2
+
+
+def test_chat_timeout_cancels_turn_and_releases_lock(app, server):
+    manager = app.session_manager
+    session_id = manager.create_session()['session_id']
+    interpreter = BlockingInterpreter()
+    manager.get_interpreter = MagicMock(return_value=interpreter)
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        requests.post(f'{server}/v1/chat', timeout=0.5, json={
+            'session_id': session_id,
+            'messages': [{'role': 'user', 'type': 'message', 'content': 'run forever'}]
+        })
+
+    assert wait_until(interpreter.stopped.is_set)
+    assert wait_until(lambda: session_id not in manager.turn_queue.held)
+    # 中止的轮次保存用户消息，运行中的代码被终止
+    assert [m['content'] for m in manager.get_session(session_id)['messages']] == ['run forever']
+    assert wait_until(lambda: interpreter.computer.terminate.called)
+
+
+def test_dropped_stream_cancels_turn(app, server):
+    manager = app.session_manager
+    session_id = manager.create_session()['session_id']
+    interpreter = BlockingInterpreter()
+    manager.get_interpreter = MagicMock(return_value=interpreter)
+
+    response = requests.post(f'{server}/v1/chat/completions', stream=True, timeout=5, json={
+        'session_id': session_id,
+        'stream': True,
+        'messages': [{'role': 'user', 'content': 'stream forever'}]
+    })
+    assert response.status_code == 200
+    next(response.iter_lines())
+    started = time.time()
+    response.close()
+
+    assert wait_until(interpreter.stopped.is_set)
+    assert wait_until(lambda: session_id not in manager.turn_queue.held)
+    assert time.time() - started < 3
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from interpreter.server.expiry import ExpiryScheduler, to_timestamp
+from interpreter.server.session import SessionManager
+
+
+def test_pop_expired_skips_superseded_deadlines():
+    scheduler = ExpiryScheduler(lambda key: None)
+    scheduler.touch('a', 10)
+    scheduler.touch('b', 20)
+    scheduler.touch('a', 30)  # 续期后旧记录被惰性丢弃
+    scheduler.touch('c', 5)
+    scheduler.cancel('c')
+
+    assert scheduler.pop_expired(25) == ['b']
+    assert scheduler.deadline_of('a') == 30
+    assert scheduler.pop_expired(30) == ['a']
+    assert len(scheduler) == 0
+
+
+def test_heap_is_compacted_after_many_touches():
+    scheduler = ExpiryScheduler(lambda key: None, compact_min=10)
+    for i in range(100):
+        scheduler.touch('a', i)
+    assert len(scheduler._heap) <= 12
+    assert scheduler.pop_expired(99) == ['a']
+
+
+def test_scheduler_fires_at_deadline():
+    fired = []
+    done = threading.Event()
+
+    def on_expire(key):
+        fired.append((key, time.time()))
+        done.set()
+
+    scheduler = ExpiryScheduler(on_expire)
+    scheduler.start()
+    deadline = time.time() + 0.2
+    scheduler.touch('late', deadline + 60)
+    # 更早的截止时间会唤醒调度线程
+    scheduler.touch('soon', deadline)
+
+    assert done.wait(2)
+    scheduler.stop()
+    assert fired[0][0] == 'soon'
+    assert fired[0][1] >= deadline
+    assert scheduler.deadline_of('late') is not None
+
+
+def test_to_timestamp_accepts_iso_strings():
+    assert to_timestamp('1970-01-01T00:00:10+00:00') == 10
+    assert to_timestamp(12.5) == 12.5
+    assert to_timestamp(None) == 0
+    assert to_timestamp('garbage') == 0
+
+
+def test_session_expires_without_cleanup_scan(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), session_timeout=0.3, cleanup_interval=3600)
+    session_id = manager.create_session()['session_id']
+    assert manager.expiry.deadline_of(session_id) is not None
+
+    time.sleep(0.8)
+    assert session_id not in manager.sessions
+    assert manager.expiry.deadline_of(session_id) is None
+    manager.close()
+
+
+def test_active_turn_postpones_expiry(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), session_timeout=0.3)
+    session_id = manager.create_session()['session_id']
+    manager.wait_for_turn(session_id)
+
+    time.sleep(0.8)
+    assert session_id in manager.sessions
+
+    manager.release_session_lock(session_id)
+    time.sleep(0.8)
+    assert session_id not in manager.sessions
+    manager.close()
+
+
+def test_persisted_sessions_are_scheduled_on_load(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), session_timeout=3600)
+    session_id = manager.create_session()['session_id']
+    manager.close()
+
+    reloaded = SessionManager(storage_path=str(tmp_path), session_timeout=3600)
+    deadline = reloaded.expiry.deadline_of(session_id)
+    assert deadline is not None and deadline > time.time()
+    reloaded.close()
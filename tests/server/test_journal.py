@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from interpreter.server.journal import SessionJournal
+from interpreter.server.session import SessionManager
+from interpreter.server.storage import SessionStore
+
+
+def test_journal_replay(tmp_path):
+    journal = SessionJournal(tmp_path)
+    journal.compact("s1", {"session_id": "s1", "messages": [], "metadata": {}})
+    journal.append("s1", {"op": "message", "message": {"role": "user", "content": "hi"}})
+    journal.append("s1", {"op": "update", "fields": {"metadata": {"title": "t"}}})
+    journal.close()
+
+    session = SessionJournal(tmp_path).load("s1")
+    assert session["messages"] == [{"role": "user", "content": "hi"}]
+    assert session["metadata"] == {"title": "t"}
+
+
+def test_journal_append_many_counts_every_record(tmp_path):
+    journal = SessionJournal(tmp_path, compact_threshold=3)
+    journal.compact("s1", {"session_id": "s1", "messages": []})
+    journal.append_many("s1", [
+        {"op": "message", "message": {"role": "user", "content": str(i)}} for i in range(3)
+    ])
+    assert journal.needs_compaction("s1")
+    assert [m["content"] for m in journal.load("s1")["messages"]] == ["0", "1", "2"]
+
+
+def test_store_without_append_many_fails_clearly():
+    with pytest.raises(NotImplementedError):
+        SessionStore().append("s1", {"op": "update", "fields": {}})
+
+
+def test_journal_compaction(tmp_path):
+    journal = SessionJournal(tmp_path, compact_threshold=3)
+    session = {"session_id": "s1", "messages": []}
+    journal.compact("s1", session)
+    for i in range(3):
+        message = {"role": "user", "content": str(i)}
+        session["messages"].append(message)
+        journal.append("s1", {"op": "message", "message": message})
+    assert journal.needs_compaction("s1")
+
+    journal.compact("s1", session)
+    assert not journal.needs_compaction("s1")
+    with open(journal.path_for("s1")) as f:
+        assert len(f.readlines()) == 1
+    assert len(journal.load("s1")["messages"]) == 3
+
+
+def test_journal_partial_tail(tmp_path):
+    journal = SessionJournal(tmp_path)
+    journal.compact("s1", {"session_id": "s1", "messages": []})
+    journal.close()
+    with open(journal.path_for("s1"), "a") as f:
+        f.write('{"op": "message", "mess')
+
+    journal = SessionJournal(tmp_path)
+    assert journal.load("s1")["messages"] == []
+    journal.append("s1", {"op": "message", "message": {"role": "user", "content": "ok"}})
+    assert journal.load("s1")["messages"] == [{"role": "user", "content": "ok"}]
+
+
+def test_session_manager_appends_messages(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session()["session_id"]
+    for i in range(5):
+        assert manager.add_message(session_id, {"role": "user", "content": f"m{i}"})
+    manager.store.close()
+
+    with open(tmp_path / f"{session_id}.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]["op"] == "snapshot"
+    assert [r["op"] for r in records[1:]].count("message") == 5
+
+    reloaded = SessionManager(storage_path=str(tmp_path))
+    assert [m["content"] for m in reloaded.get_messages(session_id)] == [f"m{i}" for i in range(5)]
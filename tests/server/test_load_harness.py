@@ -0,0 +1,48 @@
+from interpreter.server.tests.load.fakes import FakeCodeRunner, FakeLLM, RUN_CODE_MARKER
+from interpreter.server.tests.load.harness import Sample, percentile, run_load_test, summarize
+
+
+def test_percentile_interpolates():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 99) == 99.01
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_summarize_counts_errors_per_operation():
+    samples = [
+        Sample('chat', 0.1, None, 200),
+        Sample('chat', 0.3, None, 200),
+        Sample('chat', 5.0, None, 503),
+        Sample('list_sessions', 0.01, None, 200),
+    ]
+    summary = summarize(samples, duration=2.0)
+    assert summary['requests'] == 4
+    assert summary['errors'] == 1
+    assert summary['throughput_rps'] == 1.5
+    assert summary['operations']['chat']['errors'] == 1
+    assert summary['operations']['chat']['latency_ms']['max'] == 300.0
+
+
+def test_fake_llm_streams_code_only_when_asked():
+    llm = FakeLLM(tokens_per_second=0, chars_per_token=3)
+    plain = ''.join(c['choices'][0]['delta']['content'] for c in llm(messages=[{'role': 'user', 'content': 'hi'}]))
+    code = ''.join(c['choices'][0]['delta']['content']
+                   for c in llm(messages=[{'role': 'user', 'content': f'hi {RUN_CODE_MARKER}'}]))
+    assert plain == llm.reply
+    assert '```python' in code
+    assert llm.calls == 2
+
+
+def test_load_test_reports_each_scenario():
+    llm = FakeLLM(tokens_per_second=0)
+    runner = FakeCodeRunner()
+    report = run_load_test(['chat', 'chat_code', 'sessions'], sessions=2, turns=1, llm=llm, runner=runner)
+
+    assert set(report['scenarios']) == {'chat', 'chat_code', 'sessions'}
+    for scenario in report['scenarios'].values():
+        assert scenario['errors'] == 0
+        assert scenario['latency_ms']['p99'] is not None
+        assert scenario['memory']['rss_peak_mb'] > 0
+    assert report['code_runs'] == 2
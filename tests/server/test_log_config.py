@@ -0,0 +1,56 @@
+import logging
+
+from interpreter.server.log_config import (
+    NonBlockingQueueHandler, TruncatedPayload, configure_payload_logging, log_payload,
+    setup_logging, shutdown_logging
+)
+
+
+def test_truncated_payload_shortens_images_and_history():
+    payload = {
+        'messages': [{'role': 'user', 'content': f'message {i}'} for i in range(50)],
+        'image': 'A' * 100000,
+    }
+    text = str(TruncatedPayload(payload, max_chars=2000, max_items=5))
+    assert len(text) < 2100
+    assert '45 earlier items' in text
+    assert 'message 49' in text
+    assert '+99500 chars' in text
+
+
+def test_logging_goes_through_listener_thread(tmp_path):
+    logger = setup_logging('test_queue_logging', log_level='INFO', log_dir=str(tmp_path))
+    assert [type(handler) for handler in logger.handlers] == [NonBlockingQueueHandler]
+
+    logger.info('hello %s', 'queue')
+    shutdown_logging()
+    assert 'hello queue' in (tmp_path / 'info.log').read_text()
+
+
+def test_full_queue_drops_instead_of_blocking():
+    import queue
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg', None, None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
+
+
+def test_log_payload_is_sampled():
+    target = logging.getLogger('test_payload_sampling')
+    target.setLevel(logging.DEBUG)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    target.addHandler(handler)
+    try:
+        configure_payload_logging(sample_rate=0)
+        log_payload('Body', {'a': 1}, target)
+        assert records == []
+
+        configure_payload_logging(sample_rate=1.0)
+        log_payload('Body', {'a': 1}, target)
+        assert records[0].getMessage() == 'Body: {"a": 1}'
+    finally:
+        configure_payload_logging()
+        target.removeHandler(handler)
@@ -0,0 +1,30 @@
+from interpreter.server.metrics import Histogram, REQUEST_LATENCY
+
+
+def test_histogram_render():
+    histogram = Histogram('test_seconds', 'Test histogram', ('language',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'python')
+    histogram.observe(0.5, 'python')
+    histogram.observe(5, 'python')
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{language="python",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{language="python",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{language="python",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{language="python"} 3' in lines
+    assert histogram.snapshot()[('python',)]['sum'] == 5.55
+
+
+def test_metrics_endpoint(client):
+    response = client.get('/v1/health')
+    response.close()
+    assert REQUEST_LATENCY.snapshot()[('GET', '/v1/health', '200')]['count'] >= 1
+
+    response = client.get('/v1/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'oi_http_request_duration_seconds_count{method="GET",route="/v1/health",status="200"}' in body
+    for name in ('oi_active_instances', 'oi_pooled_instances', 'oi_queued_chat_requests',
+                 'oi_resident_memory_bytes', 'oi_session_lock_wait_seconds', 'oi_llm_time_to_first_token_seconds'):
+        assert f'# TYPE {name}' in body
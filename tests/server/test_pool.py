@@ -0,0 +1,66 @@
+from interpreter.server.pool import InterpreterPool
+
+
+class FakeComputer:
+    def __init__(self):
+        self.runs = []
+        self.terminated = False
+
+    def run(self, language, code, display=False):
+        self.runs.append((language, code))
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeInterpreter:
+    def __init__(self):
+        self.messages = []
+        self.computer = FakeComputer()
+
+
+def wait_for_idle(pool, count):
+    import time
+    deadline = time.time() + 5
+    while pool.stats()["idle"] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_pool_prewarms_instances():
+    pool = InterpreterPool(FakeInterpreter, size=2)
+    wait_for_idle(pool, 2)
+
+    instance = pool.acquire()
+    assert instance.computer.runs[0][0] == "python"
+    stats = pool.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 0
+    pool.close()
+
+
+def test_pool_miss_and_recycle():
+    pool = InterpreterPool(FakeInterpreter, size=0)
+    instance = pool.acquire()
+    assert pool.stats()["misses"] == 1
+    assert instance.computer.runs == []
+
+    instance.messages.append({"role": "user", "type": "message", "content": "hi"})
+    pool.release(instance)
+    pool.close()
+    assert instance.computer.terminated
+    assert pool.stats()["recycled"] == 1
+
+
+
+def test_released_instances_are_not_reused():
+    pool = InterpreterPool(FakeInterpreter, size=1)
+    wait_for_idle(pool, 1)
+    instance = pool.acquire()
+    # 绑定会话期间修改过设置，即使没有消息也不能交给下一个会话
+    instance.model = "session-model"
+    pool.release(instance)
+    wait_for_idle(pool, 1)
+    assert pool.acquire() is not instance
+    assert pool.stats()["recycled"] == 1
+    pool.close()
+    assert instance.computer.terminated
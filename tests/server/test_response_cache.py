@@ -0,0 +1,30 @@
+from interpreter.core.llm.cache import DiskResponseCache, MemoryResponseCache
+from interpreter.server import create_app
+
+
+def make_app(**config):
+    return create_app(dict({
+        'TESTING': True,
+        'MAX_ACTIVE_INSTANCES': 3,
+        'INTERPRETER_POOL_SIZE': 0
+    }, **config))
+
+
+def test_cache_is_disabled_by_default(app, client):
+    assert app.llm_cache is None
+    assert app.interpreter_instance.llm.cache is None
+    assert 'llm_cache' not in client.get('/v1/health').get_json()['instances']
+
+
+def test_instances_share_the_configured_cache(tmp_path):
+    app = make_app(LLM_CACHE='memory', LLM_CACHE_SIZE=8, LLM_CACHE_TTL=0)
+    assert isinstance(app.llm_cache, MemoryResponseCache)
+    assert app.llm_cache.ttl is None
+    assert app.interpreter_instance.llm.cache is app.llm_cache
+    assert app.session_manager.pool.factory().llm.cache is app.llm_cache
+    health = app.test_client().get('/v1/health').get_json()
+    assert health['instances']['llm_cache']['entries'] == 0
+
+    app = make_app(LLM_CACHE='disk', LLM_CACHE_DIR=str(tmp_path))
+    assert isinstance(app.llm_cache, DiskResponseCache)
+    assert app.llm_cache.path == str(tmp_path)
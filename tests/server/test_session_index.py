@@ -0,0 +1,46 @@
+from interpreter.server.session import SessionManager
+
+
+def test_startup_loads_index_only(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session({'title': 'indexed'})['session_id']
+    manager.add_message(session_id, {'role': 'user', 'content': 'hello'})
+    manager.close()
+
+    reloaded = SessionManager(storage_path=str(tmp_path))
+    assert session_id in reloaded.sessions
+    assert reloaded.sessions.peek(session_id) is None
+
+    summary = reloaded.sessions.summary(session_id)
+    assert summary['message_count'] == 1
+    assert summary['metadata'] == {'title': 'indexed'}
+    assert summary['size'] > 0
+
+    # 首次访问时才加载消息内容
+    assert reloaded.get_messages(session_id)[0]['content'] == 'hello'
+    assert reloaded.sessions.peek(session_id) is not None
+    reloaded.close()
+
+
+def test_resident_sessions_are_evicted(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), max_resident_sessions=2)
+    session_ids = [manager.create_session()['session_id'] for _ in range(4)]
+    manager.interpreter_instances.clear()
+
+    for session_id in session_ids:
+        assert manager.get_session(session_id) is not None
+    assert len(manager.sessions.resident_items()) == 2
+    assert len(manager.sessions) == 4
+    assert len(manager.list_sessions()) == 4
+    manager.close()
+
+
+def test_index_rebuilt_for_unindexed_journals(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session()['session_id']
+    manager.close()
+    (tmp_path / 'sessions.index').unlink()
+
+    reloaded = SessionManager(storage_path=str(tmp_path))
+    assert reloaded.get_session(session_id) is not None
+    reloaded.close()
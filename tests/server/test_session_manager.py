@@ -43,3 +43,180 @@ def test_instance_cleanup():
     # 验证实例被清理
     assert session_id not in manager.interpreter_instances
     assert session_id not in manager.instance_last_used
+
+def test_get_session_defers_persistence(tmp_path):
+    import threading
+    import json
+
+    manager = SessionManager(storage_path=str(tmp_path), flush_interval=3600)
+    session_id = manager.create_session()['session_id']
+    journal_path = tmp_path / f"{session_id}.jsonl"
+    size = journal_path.stat().st_size
+
+    threads = threading.active_count()
+    for _ in range(50):
+        assert manager.get_session(session_id) is not None
+    assert threading.active_count() == threads
+    assert journal_path.stat().st_size == size
+
+    # 多次访问合并为一条记录
+    manager.flush()
+    with open(journal_path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    assert records[-1]['fields']['last_active'] == manager.sessions[session_id]['last_active']
+    manager.close()
+
+def test_evicted_instance_is_hibernated(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), max_active_instances=1)
+    first = manager.create_session()['session_id']
+    interpreter = manager.get_interpreter(first)
+    interpreter.messages = [{'role': 'user', 'type': 'message', 'content': 'remember me'}]
+    interpreter.llm.model = 'hibernated-model'
+
+    second = manager.create_session()['session_id']
+    assert first not in manager.interpreter_instances
+    assert second in manager.interpreter_instances
+
+    # 会话本身没有被删除，再次获取时透明恢复
+    assert manager.get_session(first) is not None
+    restored = manager.get_interpreter(first)
+    assert restored.messages[0]['content'] == 'remember me'
+    assert restored.llm.model == 'hibernated-model'
+    assert not manager.hibernator.exists(first)
+    manager.close()
+
+def test_hibernation_snapshot_is_taken_outside_the_locks(tmp_path):
+    import threading
+
+    manager = SessionManager(storage_path=str(tmp_path), max_active_instances=1)
+    first = manager.create_session()['session_id']
+    manager.get_interpreter(first).llm.model = 'hibernated-model'
+    save = manager.hibernator.save
+    held = []
+
+    def save_and_check(session_id, interpreter):
+        # 其他线程在写快照期间仍能获取全局锁和实例锁
+        def probe():
+            for lock in (manager.lock, manager._instances_lock):
+                acquired = lock.acquire(timeout=1)
+                held.append(acquired)
+                if acquired:
+                    lock.release()
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        assert first in manager._hibernating
+        save(session_id, interpreter)
+
+    manager.hibernator.save = save_and_check
+    manager.create_session()
+    assert held == [True, True]
+    assert first not in manager._hibernating
+    assert manager.get_interpreter(first).llm.model == 'hibernated-model'
+    manager.close()
+
+def test_restore_does_not_block_other_sessions(tmp_path):
+    import threading
+
+    manager = SessionManager(storage_path=str(tmp_path), max_active_instances=2)
+    first = manager.create_session()['session_id']
+    manager.get_interpreter(first).llm.model = 'hibernated-model'
+    second = manager.create_session()['session_id']
+    third = manager.create_session()['session_id']
+    assert manager.hibernator.exists(first)
+    live = manager.get_interpreter(third)
+
+    restore = manager.hibernator.restore
+    restoring, release = threading.Event(), threading.Event()
+
+    def slow_restore(session_id, interpreter):
+        restoring.set()
+        release.wait(5)
+        return restore(session_id, interpreter)
+
+    manager.hibernator.restore = slow_restore
+    results = {}
+    waiters = [
+        threading.Thread(target=lambda key=key: results.setdefault(key, manager.get_interpreter(first)))
+        for key in ('a', 'b')
+    ]
+    for thread in waiters:
+        thread.start()
+    assert restoring.wait(5)
+    # 恢复期间已有实例的会话不受影响
+    assert manager.get_interpreter(third) is live
+    assert first in manager._restoring
+    release.set()
+    for thread in waiters:
+        thread.join(5)
+
+    # 同一会话的并发请求只恢复一次，得到同一个实例
+    assert results['a'] is results['b']
+    assert results['a'].llm.model == 'hibernated-model'
+    assert first not in manager._restoring
+    assert len(manager.interpreter_instances) <= 2
+    manager.close()
+
+def test_interpreter_messages_synced_incrementally(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session()['session_id']
+    interpreter = manager.get_interpreter(session_id)
+    history = [
+        {'role': 'user', 'type': 'message', 'content': 'hi'},
+        {'role': 'assistant', 'type': 'message', 'content': 'hello'},
+    ]
+
+    # 空会话用客户端历史初始化，存储的消息带 id 和序号
+    manager.sync_interpreter_messages(session_id, interpreter, history)
+    stored = manager.get_messages(session_id)
+    assert [m['seq'] for m in stored] == [0, 1]
+    assert all(m['id'] for m in stored)
+    assert [m['content'] for m in interpreter.messages] == ['hi', 'hello']
+    assert 'seq' not in interpreter.messages[0]
+
+    # 本轮新增的消息写回会话
+    start = len(interpreter.messages)
+    interpreter.messages.append({'role': 'user', 'type': 'message', 'content': 'again'})
+    interpreter.messages.append({'role': 'assistant', 'type': 'message', 'content': 'sure'})
+    manager.record_turn(session_id, interpreter, start)
+    assert [m['seq'] for m in manager.get_messages(session_id)] == [0, 1, 2, 3]
+
+    # 客户端重复发送的历史不会再次加入
+    manager.sync_interpreter_messages(session_id, interpreter, history)
+    assert len(interpreter.messages) == 4
+
+    # 其他途径追加的消息只同步增量
+    manager.add_message(session_id, {'role': 'user', 'content': 'note'})
+    manager.sync_interpreter_messages(session_id, interpreter)
+    assert [m['content'] for m in interpreter.messages][-1] == 'note'
+    assert len(interpreter.messages) == 5
+    manager.close()
+
+def test_message_added_during_turn_is_synced_once(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path))
+    session_id = manager.create_session()['session_id']
+    interpreter = manager.get_interpreter(session_id)
+    manager.sync_interpreter_messages(
+        session_id, interpreter, [{'role': 'user', 'type': 'message', 'content': 'hi'}]
+    )
+
+    # 本轮进行期间客户端另外 POST 了一条消息
+    start = len(interpreter.messages)
+    interpreter.messages.append({'role': 'user', 'type': 'message', 'content': 'run it'})
+    manager.add_message(session_id, {'role': 'user', 'content': 'posted meanwhile'})
+    interpreter.messages.append({'role': 'assistant', 'type': 'message', 'content': 'done'})
+    recorded = manager.record_turn(session_id, interpreter, start)
+
+    # 实例的消息已被替换为会话中的顺序，本轮的消息以返回值为准
+    assert [m['content'] for m in recorded] == ['run it', 'done']
+    expected = ['hi', 'posted meanwhile', 'run it', 'done']
+    assert [m['content'] for m in manager.get_messages(session_id)] == expected
+    manager.sync_interpreter_messages(session_id, interpreter)
+    assert [m['content'] for m in interpreter.messages] == expected
+
+    # 之后的轮次照常只同步增量
+    manager.add_message(session_id, {'role': 'user', 'content': 'next'})
+    manager.sync_interpreter_messages(session_id, interpreter)
+    assert [m['content'] for m in interpreter.messages] == expected + ['next']
+    manager.close()
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from interpreter.server.session_queue import SessionQueueFull, SessionTurnQueue
+
+
+def test_turns_are_handed_over_in_fifo_order():
+    queue = SessionTurnQueue(max_depth=4)
+    assert queue.acquire('s1') == 0
+
+    order = []
+    positions = []
+
+    def waiter(name):
+        positions.append(queue.acquire('s1', timeout=5))
+        order.append(name)
+        queue.release('s1')
+
+    threads = []
+    for name in ('a', 'b', 'c'):
+        thread = threading.Thread(target=waiter, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # 等待线程进入队列，保证到达顺序
+        while queue.queue_length('s1') < len(threads):
+            time.sleep(0.01)
+
+    queue.release('s1')
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ['a', 'b', 'c']
+    assert positions == [1, 2, 3]
+    assert queue.stats() == {'active': 0, 'queued': 0, 'max_depth': 4}
+
+
+def test_queue_depth_and_wait_are_bounded():
+    queue = SessionTurnQueue(max_depth=1)
+    assert queue.acquire('s1') == 0
+    # 不同会话互不影响
+    assert queue.acquire('s2') == 0
+
+    assert queue.acquire('s1', timeout=0.05) is None
+    assert queue.queue_length('s1') == 0
+
+    waiter = threading.Thread(target=queue.acquire, args=('s1', 5))
+    waiter.start()
+    while queue.queue_length('s1') < 1:
+        time.sleep(0.01)
+    with pytest.raises(SessionQueueFull):
+        queue.acquire('s1', timeout=0.05)
+
+    queue.release('s1')
+    waiter.join(timeout=5)
+    assert 's1' in queue.held
+    queue.release('s1')
+    assert 's1' not in queue.held
@@ -123,3 +123,71 @@ def test_session_not_found(client):
     fake_id = "non-existent-id"
     response = client.get(f'/v1/sessions/{fake_id}')
     assert response.status_code == 404
+
+def test_list_sessions_returns_paginated_summaries(client):
+    for i in range(3):
+        response = client.post('/v1/sessions', json={'title': f'Page {i}'})
+        session_id = response.get_json()['session_id']
+        client.post(f'/v1/sessions/{session_id}/messages',
+                    json={'role': 'user', 'type': 'message', 'content': 'hi'})
+
+    response = client.get('/v1/sessions?limit=2')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['sessions']) == 2
+    assert data['has_more']
+    assert 'messages' not in data['sessions'][0]
+    assert data['sessions'][0]['message_count'] == 1
+
+    response = client.get(f"/v1/sessions?limit=2&after={data['next_cursor']}&fields=session_id,messages")
+    rest = response.get_json()['sessions']
+    assert rest and rest[0]['messages'][0]['content'] == 'hi'
+    ids = {s['session_id'] for s in data['sessions'] + rest}
+    assert len(ids) == len(data['sessions']) + len(rest)
+
+def test_messages_pagination_and_since(client):
+    session_id = client.post('/v1/sessions', json={'title': 'Poll'}).get_json()['session_id']
+    for i in range(5):
+        client.post(f'/v1/sessions/{session_id}/messages',
+                    json={'role': 'user', 'type': 'message', 'content': f'm{i}'})
+
+    data = client.get(f'/v1/sessions/{session_id}/messages?limit=2').get_json()
+    assert [m['content'] for m in data['messages']] == ['m0', 'm1']
+    assert data['has_more']
+
+    data = client.get(f"/v1/sessions/{session_id}/messages?after={data['next_cursor']}&fields=content").get_json()
+    assert data['messages'] == [{'content': 'm2'}, {'content': 'm3'}, {'content': 'm4'}]
+
+    last_id = data['last_message_id']
+    client.post(f'/v1/sessions/{session_id}/messages',
+                json={'role': 'user', 'type': 'message', 'content': 'new'})
+    data = client.get(f'/v1/sessions/{session_id}/messages?since={last_id}').get_json()
+    assert [m['content'] for m in data['messages']] == ['new']
+
+    response = client.get(f'/v1/sessions/{session_id}/messages?since=msg_unknown')
+    assert response.status_code == 400
+
+
+def test_listings_without_paging_params_return_everything(app, client):
+    session_id = client.post('/v1/sessions', json={'title': 'Long'}).get_json()['session_id']
+    for i in range(105):
+        app.session_manager.add_message(session_id, {'role': 'user', 'type': 'message', 'content': f'm{i}'})
+
+    data = client.get(f'/v1/sessions/{session_id}/messages').get_json()
+    assert len(data['messages']) == 105
+    assert data['messages'][-1]['content'] == 'm104'
+    assert data['last_message_id'] == data['messages'][-1]['id']
+    paged = client.get(f'/v1/sessions/{session_id}/messages?limit=100').get_json()
+    assert len(paged['messages']) == 100 and paged['has_more']
+
+    data = client.get('/v1/sessions').get_json()
+    assert data['total'] == len(data['sessions'])
+    assert any(s['session_id'] == session_id and len(s['messages']) == 105 for s in data['sessions'])
+    data = client.get('/v1/sessions?fields=session_id,title').get_json()
+    assert all(set(s) <= {'session_id', 'title'} for s in data['sessions'])
+
+
+def test_malformed_cursor_is_a_bad_request(client):
+    session_id = client.post('/v1/sessions', json={'title': 'Cursor'}).get_json()['session_id']
+    assert client.get('/v1/sessions?after=not-a-cursor').status_code == 400
+    assert client.get(f'/v1/sessions/{session_id}/messages?after=not-a-cursor').status_code == 400
@@ -0,0 +1,78 @@
+import pytest
+
+from interpreter.server.errors import ValidationError
+from interpreter.server.session import SessionManager
+from interpreter.server.sqlite_store import SqliteSessionStore
+from interpreter.server.storage import message_cursor, session_cursor
+
+
+def test_sqlite_store_replays_records(tmp_path):
+    store = SqliteSessionStore(tmp_path / 'sessions.db')
+    store.compact('s1', {'session_id': 's1', 'created_at': '2024-01-01', 'last_active': 1.0,
+                         'messages': [], 'metadata': {}, 'title': 'x'})
+    store.append_many('s1', [
+        {'op': 'message', 'message': {'role': 'user', 'content': 'hi'}},
+        {'op': 'update', 'fields': {'metadata': {'title': 't'}, 'last_active': 2.0}},
+    ])
+    store.close()
+
+    session = SqliteSessionStore(tmp_path / 'sessions.db').load('s1')
+    assert session['messages'] == [{'role': 'user', 'content': 'hi', 'seq': 0}]
+    assert session['metadata'] == {'title': 't'}
+    assert session['last_active'] == 2.0
+    assert session['title'] == 'x'
+
+
+def test_sqlite_session_manager_pagination(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), storage_backend='sqlite')
+    session_ids = [manager.create_session()['session_id'] for _ in range(5)]
+    for i in range(7):
+        manager.add_message(session_ids[0], {'role': 'user', 'content': f'm{i}'})
+
+    seen, cursor = [], None
+    while True:
+        page, has_more = manager.list_sessions_page(limit=2, after=cursor)
+        seen.extend(summary['session_id'] for summary in page)
+        if not has_more:
+            break
+        cursor = session_cursor(page[-1])
+    assert sorted(seen) == sorted(session_ids)
+
+    messages, has_more = manager.get_messages_page(session_ids[0], limit=3)
+    assert [m['content'] for m in messages] == ['m0', 'm1', 'm2']
+    assert has_more
+    messages, has_more = manager.get_messages_page(session_ids[0], limit=5, after=message_cursor(messages[-1]))
+    assert [m['content'] for m in messages] == ['m3', 'm4', 'm5', 'm6']
+    assert not has_more
+    messages, _ = manager.get_messages_page(session_ids[0], limit=2, before=message_cursor(messages[0]))
+    assert [m['content'] for m in messages] == ['m1', 'm2']
+    messages, _ = manager.get_messages_page(session_ids[0], since=messages[-1]['id'])
+    assert [m['content'] for m in messages] == ['m3', 'm4', 'm5', 'm6']
+    manager.close()
+
+
+def test_sqlite_store_shared_between_managers(tmp_path):
+    first = SessionManager(storage_path=str(tmp_path), storage_backend='sqlite')
+    second = SessionManager(storage_path=str(tmp_path), storage_backend='sqlite')
+    session_id = first.create_session()['session_id']
+    first.add_message(session_id, {'role': 'user', 'content': 'from first'})
+
+    # 另一个进程能看到新会话，并在会话被修改后重新加载
+    assert [m['content'] for m in second.get_messages(session_id)] == ['from first']
+    first.interpreter_instances.clear()
+    second.add_message(session_id, {'role': 'user', 'content': 'from second'})
+    assert [m['content'] for m in first.get_messages(session_id)] == ['from first', 'from second']
+    assert [m['seq'] for m in first.get_messages(session_id)] == [0, 1]
+    first.close()
+    second.close()
+
+
+def test_sqlite_malformed_cursor_is_rejected(tmp_path):
+    manager = SessionManager(storage_path=str(tmp_path), storage_backend='sqlite')
+    session_id = manager.create_session()['session_id']
+    for cursor in ('not a cursor', message_cursor({'seq': 0})):
+        with pytest.raises(ValidationError):
+            manager.list_sessions_page(limit=2, after=cursor)
+    with pytest.raises(ValidationError):
+        manager.get_messages_page(session_id, before='not a cursor')
+    manager.close()
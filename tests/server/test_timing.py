@@ -0,0 +1,36 @@
+from interpreter.server.timing import RequestTimeline, SlowRequestLog
+
+
+def test_timeline_header_accumulates_phases():
+    timeline = RequestTimeline('POST', '/v1/chat')
+    timeline.add('llm', 0.25)
+    timeline.add('llm', 0.25)
+    timeline.add('persist', 0.002)
+    timeline.total = 0.6
+
+    assert timeline.header() == 'llm;dur=500.0, persist;dur=2.0, total;dur=600.0'
+    assert timeline.to_dict()['phases_ms'] == {'llm': 500.0, 'persist': 2.0}
+
+
+def test_slow_request_log_keeps_slowest_first():
+    log = SlowRequestLog(size=2, threshold=0.5)
+    for total in (0.1, 0.7, 2.0, 0.9):
+        timeline = RequestTimeline('GET', '/')
+        timeline.total = total
+        log.record(timeline)
+
+    assert [entry['total_ms'] for entry in log.entries()] == [2000.0, 900.0]
+    assert len(log.entries(limit=1)) == 1
+
+
+def test_server_timing_header_and_slow_request_endpoint(app, client):
+    app.slow_requests.threshold = 0
+
+    response = client.get('/v1/health')
+    assert 'total;dur=' in response.headers['Server-Timing']
+    response.close()
+
+    response = client.get('/v1/debug/slow-requests?limit=5')
+    assert response.status_code == 200
+    paths = [entry['path'] for entry in response.get_json()['requests']]
+    assert '/v1/health' in paths